@@ -0,0 +1,279 @@
+from telemetry import *
+from instance_generator import *
+import time
+import tracemalloc
+
+
+def model_size(model: CpModel):
+    proto = model.Proto()
+    return len(proto.variables), len(proto.constraints)
+
+
+def reproducible_solver(deterministic_seconds: float) -> CpSolver:
+    # One worker and a deterministic time limit, so the same model and seed give the same search
+    # on any machine and under any load
+    solver = CpSolver()
+    solver.parameters.max_deterministic_time = deterministic_seconds
+    solver.parameters.num_search_workers = 1
+    return solver
+
+
+def first_solution_deterministic_time(model: CpModel, deterministic_seconds: float, seed: int = 0):
+    # The solver's deterministic time up to its first solution, None if there's none in the budget
+    # The callbacks' deterministic time lags behind the solver's (presolve and the first search
+    # aren't in it), so this is a solve that stops at the first solution
+    solver = reproducible_solver(deterministic_seconds)
+    solver.parameters.random_seed = seed
+    solver.parameters.stop_after_first_solution = True
+    status = solver.Solve(model)
+    return solver.deterministic_time if status == OPTIMAL or status == FEASIBLE else None
+
+
+def solve_schedule(schedule: Schedule, time_seconds: int, seed: int = 0,
+                   telemetry_dir: str = None, name: str = "telemetry", deterministic: bool = False):
+    # With telemetry_dir the time series and summary of the solve are saved there as <name>.csv/.json
+    # With deterministic time_seconds is deterministic time (see reproducible_solver) and the
+    # deterministic time to the first solution is measured too
+    minimize_schedule(schedule)
+    solver = reproducible_solver(time_seconds) if deterministic else create_solver(time_seconds)
+    solver.parameters.random_seed = seed
+    status, telemetry = solve_with_telemetry(schedule.model, solver)
+    if telemetry_dir is not None:
+        save_telemetry(telemetry, telemetry_dir, name)
+    summary = telemetry["summary"]
+    first_solution_time = summary["first_solution_time"]
+    result = {
+        "status": telemetry["status"],
+        "objective": summary["final_objective"],
+        "best_bound": summary["final_bound"],
+        "gap": None if summary["final_gap"] is None else round(summary["final_gap"], 4),
+        "first_solution_time": None if first_solution_time is None else round(first_solution_time, 2),
+        "solve_time": round(telemetry["solve_time"], 2),
+        "deterministic_time": round(solver.deterministic_time, 2),
+    }
+    if deterministic:
+        first_solution = first_solution_deterministic_time(schedule.model, time_seconds, seed)
+        result["first_solution_deterministic_time"] = None if first_solution is None else round(first_solution, 2)
+    return result
+
+
+def benchmark_builds(options: Dict[str, Dict],
+                     time_seconds: int = 60,
+                     seed: int = 0,
+                     telemetry_dir: str = None,
+                     label: str = "encoding",
+                     deterministic: bool = False):
+    # Builds and solves the January 2021 instance once per set of build_schedule options
+    # label: the column the names of the options go in
+    instance = create_instance(1, 1, 2021, seed=seed)
+    rows = []
+    for name, kwargs in options.items():
+        start = time.time()
+        schedule = build_schedule(instance, **kwargs)
+        build_time = time.time() - start
+        num_variables, num_constraints = model_size(schedule.model)
+        cache = literal_cache(schedule.model).stats()
+        row = {label: name,
+               "build_time": round(build_time, 2),
+               "variables": num_variables,
+               "constraints": num_constraints,
+               "cache_variables_saved": cache["variables_saved"],
+               "cache_constraints_saved": cache["constraints_saved"]}
+        if time_seconds > 0:
+            row.update(solve_schedule(schedule, time_seconds, seed, telemetry_dir, name, deterministic))
+        rows.append(row)
+    print_table(rows)
+    return rows
+
+
+def benchmark_sequence_encodings(time_seconds: int = 60,
+                                 seed: int = 0,
+                                 encodings: List[str] = (WINDOW_ENCODING, AUTOMATON_ENCODING)):
+    return benchmark_builds({encoding: {"encoding": encoding} for encoding in encodings},
+                            time_seconds, seed)
+
+
+def benchmark_transition_encodings(time_seconds: int = 60,
+                                   seed: int = 0,
+                                   encodings: List[str] = (PAIR_TRANSITIONS, TABLE_TRANSITIONS)):
+    return benchmark_builds({encoding: {"transition_encoding": encoding} for encoding in encodings},
+                            time_seconds, seed)
+
+
+def benchmark_distribution_encodings(time_seconds: int = 60,
+                                     seed: int = 0,
+                                     encodings: List[str] = (PRODUCT_DISTRIBUTION, ELEMENT_DISTRIBUTION,
+                                                             CONVEX_DISTRIBUTION),
+                                     transition_encoding: str = TABLE_TRANSITIONS):
+    # The pair transitions rarely find a first solution in a minute, which would hide any difference
+    return benchmark_builds({encoding: {"distribution_encoding": encoding,
+                                        "transition_encoding": transition_encoding}
+                             for encoding in encodings},
+                            time_seconds, seed)
+
+
+def profile_families(encoding: str = WINDOW_ENCODING,
+                     seed: int = 0,
+                     name: str = None):
+    # Shows which constraint families make the January 2021 model large or slow to build
+    instance = create_instance(1, 1, 2021, seed=seed)
+    schedule = build_schedule(instance, encoding=encoding, profile=True)
+    print_profile(schedule.profiles)
+    if name is not None:
+        save_profile(schedule.profiles, name)
+    return schedule.profiles
+
+
+LEAVE_ONE_OUT = "leave_one_out"
+ADD_ONE_IN = "add_one_in"
+
+# Kept in every subset, without coverage the model is trivial
+ABLATION_CORE = ["all_shifts_taken"]
+
+
+def ablation_subsets(families: List[str], plan: str = LEAVE_ONE_OUT, core: List[str] = ABLATION_CORE):
+    # Returns {subset name: build_schedule options}, the full model and the core are the baselines
+    candidates = [family for family in families if family not in core]
+    subsets = {"all": {}, "core": {"families": list(core)}}
+    for family in candidates:
+        if plan == LEAVE_ONE_OUT:
+            subsets[f"-{family}"] = {"exclude": [family]}
+        elif plan == ADD_ONE_IN:
+            subsets[f"+{family}"] = {"families": list(core) + [family]}
+        else:
+            raise ValueError(f"Unknown ablation plan {plan}")
+    return subsets
+
+
+def rank_ablation(rows: List[Dict], time_seconds: int, plan: str = LEAVE_ONE_OUT):
+    # Ranked by deterministic time, which unlike wall time is the same from run to run
+    # A run without a first solution counts as the whole time budget
+    def first_solution(row):
+        time_to_first = row.get("first_solution_deterministic_time")
+        return time_seconds if time_to_first is None else time_to_first
+
+    baseline = {row["subset"]: first_solution(row) for row in rows if row["subset"] in ("all", "core")}
+    ranked = []
+    for row in rows:
+        if row["subset"] in ("all", "core"):
+            continue
+        if plan == LEAVE_ONE_OUT:
+            # Time saved by leaving the family out
+            cost = baseline["all"] - first_solution(row)
+        else:
+            # Time added by the family on top of the core
+            cost = first_solution(row) - baseline["core"]
+        ranked.append({"family": row["subset"][1:],
+                       "first_solution_cost": round(cost, 2),
+                       "first_solution_deterministic_time": row.get("first_solution_deterministic_time"),
+                       "first_solution_time": row.get("first_solution_time"),
+                       "status": row.get("status"),
+                       "objective": row.get("objective"),
+                       "variables": row["variables"],
+                       "constraints": row["constraints"]})
+    ranked.sort(key=lambda row: row["first_solution_cost"], reverse=True)
+    return ranked
+
+
+def benchmark_ablation(plan: str = LEAVE_ONE_OUT,
+                       time_seconds: int = 60,
+                       seed: int = 0,
+                       families: List[str] = None,
+                       core: List[str] = ABLATION_CORE,
+                       telemetry_dir: str = None,
+                       **options):
+    # Solves the January 2021 instance once per subset of constraint families with the same seed,
+    # options are passed to build_schedule for every subset, e.g. transition_encoding
+    # families defaults to every family build_schedule adds
+    # The solves use reproducible_solver, time_seconds is deterministic time, so the same
+    # arguments rank the families the same way every time
+    if families is None:
+        families = build_schedule(create_instance(1, 1, 2021, seed=seed), **options).family_names
+    subsets = {name: dict(options, **subset) for name, subset in ablation_subsets(families, plan, core).items()}
+    rows = benchmark_builds(subsets, time_seconds, seed, telemetry_dir, label="subset", deterministic=True)
+    ranked = rank_ablation(rows, time_seconds, plan)
+    print_table(ranked)
+    return {"runs": rows, "ranked": ranked}
+
+
+# The values each dimension of a generated instance is scaled through
+SCALING_DIMENSIONS = {
+    "num_staff": [10, 30, 60, 100, 200],
+    "months": [1, 2, 3, 6],
+    "num_shifts": [6, 12, 24, 48],
+    "request_density": [0, 3.5, 10, 30],
+    # The equalize targets are shared out over every staff, so larger groups soon make them infeasible
+    "mask_fraction": [0, 0.05, 0.1, 0.2],
+}
+
+# Staff per shift in data.py, kept when either is scaled so every day can still be covered
+STAFF_PER_SHIFT = len(staff_list) / len(shift_list)
+
+
+def scaled_instance(dimension: str, value, seed: int = 0, **generator_options) -> Instance:
+    options = dict(generator_options)
+    if dimension == "num_staff":
+        options["num_staff"] = value
+        options["shift_names"] = generate_shift_list(max(5, round(value / STAFF_PER_SHIFT)))
+    elif dimension == "num_shifts":
+        options["shift_names"] = generate_shift_list(value)
+        options["num_staff"] = round(value * STAFF_PER_SHIFT)
+    elif dimension == "mask_fraction":
+        # The same fraction of the staff in each of the FT, midnight and new staff groups
+        options.update(ft_fraction=value, midnight_fraction=value, new_staff_fraction=value)
+    elif dimension in ("months", "request_density"):
+        options[dimension] = value
+    else:
+        raise ValueError(f"Unknown scaling dimension {dimension}")
+    return generate_instance(seed=seed, **options)
+
+
+def benchmark_scaling(dimension: str,
+                      values: List = None,
+                      time_seconds: int = 60,
+                      seed: int = 0,
+                      generator_options: Dict = None,
+                      name: str = None,
+                      **options):
+    # Builds and solves a generated instance for every value of one dimension, the rest stay at
+    # generator_options. options are passed to build_schedule, e.g. transition_encoding
+    # With name the rows are saved as JSON to plot the curves
+    values = SCALING_DIMENSIONS[dimension] if values is None else values
+    rows = []
+    for value in values:
+        instance = scaled_instance(dimension, value, seed, **(generator_options or {}))
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        start = time.time()
+        schedule = build_schedule(instance, **options)
+        build_time = time.time() - start
+        peak_memory = tracemalloc.get_traced_memory()[1] - start_memory
+        if started_tracing:
+            tracemalloc.stop()
+        num_variables, num_constraints = model_size(schedule.model)
+        row = {dimension: value,
+               "staff": len(instance.staff),
+               "shifts": len(instance.shifts),
+               "days": len(instance.days),
+               "requests": len(instance.requests),
+               "build_time": round(build_time, 2),
+               "peak_memory_kb": round(peak_memory / 1024),
+               "variables": num_variables,
+               "constraints": num_constraints}
+        if time_seconds > 0:
+            row.update(solve_schedule(schedule, time_seconds, seed))
+        rows.append(row)
+    print_table(rows)
+    if name is not None:
+        with open(name, "w") as f:
+            json.dump(rows, f, indent=2)
+    return rows
+
+
+if __name__ == "__main__":
+    benchmark_sequence_encodings()
+    benchmark_transition_encodings()
+    benchmark_distribution_encodings()
@@ -25,7 +25,8 @@ def max_days_worked(model: CpModel,
                     days: List[int],
                     hard_max: int,
                     soft_max: int,
-                    max_cost: int):
+                    max_cost: int,
+                    encoding: str = WINDOW_ENCODING):
     # Maximum work 7 consecutive days
     # SOFT Work maximum of 5 days in a row
     # GOAL Avoid working more than 3 days in row (could be 4)
@@ -35,10 +36,11 @@ def max_days_worked(model: CpModel,
         variables, coeffs = add_soft_sequence_max(
             model=model,
             prefix="max_days_in_a_row_" + m,
-            shifts=not_list([staff_works_day[m, d] for d in days]),
+            shifts=not_list([staff_works_day[m, d] for d in days], literal_cache(model)),
             hard_max=hard_max,
             soft_max=soft_max,
             max_cost=max_cost,
+            encoding=encoding,
         )
         obj_bool_vars.extend(variables)
         obj_bool_coeffs.extend(coeffs)
@@ -52,7 +54,8 @@ def min_days_off_after_midnight(model: CpModel,
                                 days: List[int],
                                 hard_min: int,
                                 soft_min: int,
-                                min_cost: int):
+                                min_cost: int,
+                                encoding: str = WINDOW_ENCODING):
     # 2 days off after last midnight (except on call shift).
     # SOFT 3 days off after midnight. 4 even better
     obj_bool_vars = []
@@ -65,6 +68,7 @@ def min_days_off_after_midnight(model: CpModel,
             hard_min=hard_min,
             soft_min=soft_min,
             min_cost=min_cost,
+            encoding=encoding,
             prior=Prior([staff_works_midnight_shift[m, d]
                         for d in days], [1], True)
         )
@@ -99,7 +103,8 @@ def max_midnights_in_a_row(model: CpModel,
                            days: List[int],
                            hard_max: int,
                            soft_max: int,
-                           max_cost: int):
+                           max_cost: int,
+                           encoding: str = WINDOW_ENCODING):
     # Maximum 2 midnights in a row (except for several physicians who only work midnights)
     # SOFT Max 1 midnight in a row
     obj_bool_vars = []
@@ -108,10 +113,11 @@ def max_midnights_in_a_row(model: CpModel,
         variables, coeffs = add_soft_sequence_max(
             model=model,
             prefix="max_midnights_in_a_row_" + m,
-            shifts=not_list([staff_works_midnight_shift[m, d] for d in days]),
+            shifts=not_list([staff_works_midnight_shift[m, d] for d in days], literal_cache(model)),
             hard_max=hard_max,
             soft_max=soft_max,
             max_cost=max_cost,
+            encoding=encoding,
         )
         obj_bool_vars.extend(variables)
         obj_bool_coeffs.extend(coeffs)
@@ -135,7 +141,8 @@ def no_late_shift_before_time_off(model: CpModel,
                                   requests,
                                   hard_min: int,
                                   soft_min: int,
-                                  min_cost: int):
+                                  min_cost: int,
+                                  encoding: str = WINDOW_ENCODING):
     # No 2000, 2200, or midnight shift prior to day requested off
     obj_bool_vars = []
     obj_bool_coeffs = []
@@ -153,6 +160,7 @@ def no_late_shift_before_time_off(model: CpModel,
             hard_min=hard_min,
             soft_min=soft_min,
             min_cost=min_cost,
+            encoding=encoding,
             post=Post([model.NewConstant(1)] * hard_min + days_off, [1])
         )
         obj_bool_vars.extend(variables)
@@ -167,7 +175,8 @@ def on_call_rules_before(model: CpModel,
                          days: List[int],
                          hard_min: int,
                          soft_min: int,
-                         min_cost: int):
+                         min_cost: int,
+                         encoding: str = WINDOW_ENCODING):
     # On call shift - day after rules
     # Physicians can work the 0930 shifts or earlier prior to working on call.
     obj_bool_vars = []
@@ -180,6 +189,7 @@ def on_call_rules_before(model: CpModel,
             hard_min=hard_min,
             soft_min=soft_min,
             min_cost=min_cost,
+            encoding=encoding,
             post=Post([staff_works_on_call_shift[m, d] for d in days], [1])
         )
         obj_bool_vars.extend(variables)
@@ -194,7 +204,8 @@ def on_call_rules_after(model: CpModel,
                         days: List[int],
                         hard_min: int,
                         soft_min: int,
-                        min_cost: int):
+                        min_cost: int,
+                        encoding: str = WINDOW_ENCODING):
     # On call shift - day after rules
     # They can work starting no earlier than 11 the day after on call.
     obj_bool_vars = []
@@ -207,6 +218,7 @@ def on_call_rules_after(model: CpModel,
             hard_min=hard_min,
             soft_min=soft_min,
             min_cost=min_cost,
+            encoding=encoding,
             prior=Prior([staff_works_on_call_shift[m, d] for d in days], [1])
         )
         obj_bool_vars.extend(variables)
@@ -221,7 +233,8 @@ def days_off_after_consecutive_shifts(model: CpModel,
                                       days: List[int],
                                       hard_min: int,
                                       soft_min: int,
-                                      min_cost: int):
+                                      min_cost: int,
+                                      encoding: str = WINDOW_ENCODING):
     # 2 days off after 3 to 7 days of work in a row
     obj_bool_vars = []
     obj_bool_coeffs = []
@@ -233,36 +246,58 @@ def days_off_after_consecutive_shifts(model: CpModel,
             hard_min=hard_min,
             soft_min=soft_min,
             min_cost=min_cost,
+            encoding=encoding,
             prior=Prior([staff_works_day[m, d] for d in days], [1, 1, 1], True))
         obj_bool_vars.extend(variables)
         obj_bool_coeffs.extend(coeffs)
     return obj_bool_vars, obj_bool_coeffs
 
 
+# One literal and clause per staff, day and penalized pair of shifts
+PAIR_TRANSITIONS = "pairs"
+# One shift index per staff and day and one cost per transition read from a table
+TABLE_TRANSITIONS = "table"
+
+
+def timed_shifts(shift_names: List[str] = shift_list) -> List[int]:
+    # Shifts named by their start time, on call has none and never counts as a transition
+    return [s for s, name in enumerate(shift_names) if name[0:4].isdigit()]
+
+
+def penalized_transitions(shift_names: List[str] = shift_list) -> List[Tuple]:
+    # Shifts should have same start time to 2.5 hours later compared to previous shift (the 2 hours later can be relaxed to 3,4 perhaps)
+    # No shifts that start more than 1.5 hours earlier than the shift on the previous day
+    penalized_transitions = []
+    for shift in list(permutations(timed_shifts(shift_names), 2)):
+        t1 = float(shift_names[shift[0]][0:2] + '.' + shift_names[shift[0]][2:4])
+        t2 = float(shift_names[shift[1]][0:2] + '.' + shift_names[shift[1]][2:4])
+        if t2 - t1 > 2.5:
+            penalized_transitions.append((shift, MAX))
+        elif t2 - t1 < -1.5:
+            penalized_transitions.append((shift, MID))
+    return penalized_transitions
+
+
 def transitions_constraints(model: CpModel,
                             staff_works_shift_on_day: Dict[Tuple, IntVar],
                             staff: List[int],
-                            days: List[int]):
+                            days: List[int],
+                            encoding: str = PAIR_TRANSITIONS,
+                            shift_names: List[str] = shift_list):
     # General principle avoid shift times changing too much day to day
-    # Shifts should have same start time to 2.5 hours later compared to previous shift (the 2 hours later can be relaxed to 3,4 perhaps)
-    # No shifts that start more than 1.5 hours earlier than the shift on the previous day
-    penalized_transitions = []
+    if encoding == TABLE_TRANSITIONS:
+        return transitions_table(model, staff_works_shift_on_day, staff, days, shift_names)
+
     obj_bool_vars = []
     obj_bool_coeffs = []
 
-    for shift in list(permutations(shift_list[:-1], 2)):
-        t1 = float(shift[0][0:2] + '.' + shift[0][2:4])
-        t2 = float(shift[1][0:2] + '.' + shift[1][2:4])
-        if t2 - t1 > 2.5:
-            penalized_transitions.append(
-                ((shift_list.index(shift[0]), shift_list.index(shift[1])), MAX))
-        elif t2 - t1 < -1.5:
-            penalized_transitions.append(
-                ((shift_list.index(shift[0]), shift_list.index(shift[1])), MID))
-
-    for (previous_shift, next_shift), cost in penalized_transitions:
+    for (previous_shift, next_shift), cost in penalized_transitions(shift_names):
         for m in staff:
             for d in days[:-1]:
+                # A transition from or to a shift that can't be worked never happens
+                if (is_false_literal(model, staff_works_shift_on_day[m, d, previous_shift]) or
+                        is_false_literal(model, staff_works_shift_on_day[m, d + 1, next_shift])):
+                    continue
                 transition = [
                     staff_works_shift_on_day[m, d, previous_shift].Not(), staff_works_shift_on_day[m, d + 1,
                                                                                                    next_shift].Not()
@@ -277,6 +312,47 @@ def transitions_constraints(model: CpModel,
     return obj_bool_vars, obj_bool_coeffs
 
 
+def transitions_table(model: CpModel,
+                      staff_works_shift_on_day: Dict[Tuple, IntVar],
+                      staff: List[int],
+                      days: List[int],
+                      shift_names: List[str] = shift_list):
+    # Staff work at most one shift a day so the shift worked can be stored as a single index
+    # 0 is a day off (or on call), shift s is stored as s + 1
+    # Each cost has its own 0-1 variable, the table sets the one of the transition's cost, so
+    # transitions of different costs stay separate terms of the objective
+    costs = dict(penalized_transitions(shift_names))
+    transition_shifts = timed_shifts(shift_names)
+    cost_values = sorted(set(costs.values()) - {0})
+    table = []
+    for previous_shift in [None] + transition_shifts:
+        for next_shift in [None] + transition_shifts:
+            cost = costs.get((previous_shift, next_shift), 0)
+            table.append((previous_shift + 1 if previous_shift is not None else 0,
+                          next_shift + 1 if next_shift is not None else 0,
+                          *[int(cost == value) for value in cost_values]))
+
+    shift_worked = {}
+    for m in staff:
+        for d in days:
+            worked = [s for s in transition_shifts
+                      if not is_false_literal(model, staff_works_shift_on_day[m, d, s])]
+            shift_worked[m, d] = model.NewIntVarFromDomain(
+                Domain.FromValues([0] + [s + 1 for s in worked]), f"shift_worked_staff_{m}_day_{d}")
+            model.Add(shift_worked[m, d] == sum(
+                (s + 1) * staff_works_shift_on_day[m, d, s] for s in worked))
+
+    obj_bool_vars = []
+    obj_bool_coeffs = []
+    for m in staff:
+        for d in days[:-1]:
+            transition = [model.NewBoolVar(f"transition_cost_{value}_staff_{m}_day_{d}") for value in cost_values]
+            model.AddAllowedAssignments([shift_worked[m, d], shift_worked[m, d + 1]] + transition, table)
+            obj_bool_vars.extend(transition)
+            obj_bool_coeffs.extend(cost_values)
+    return obj_bool_vars, obj_bool_coeffs
+
+
 def days_off_between_late_and_day_shifts(model: CpModel,
                                          staff_doesnt_work_day: Dict[Tuple, IntVar],
                                          staff_works_day_shift: Dict[Tuple, IntVar],
@@ -285,7 +361,8 @@ def days_off_between_late_and_day_shifts(model: CpModel,
                                          days: List[int],
                                          hard_min: int,
                                          soft_min: int,
-                                         min_cost: int):
+                                         min_cost: int,
+                                         encoding: str = WINDOW_ENCODING):
     # 3 days off when transitioning from late shift to day shift
     obj_bool_vars = []
     obj_bool_coeffs = []
@@ -297,6 +374,7 @@ def days_off_between_late_and_day_shifts(model: CpModel,
             hard_min=hard_min,
             soft_min=soft_min,
             min_cost=min_cost,
+            encoding=encoding,
             prior=Prior([staff_works_late_shift[m, d]
                         for d in days], [1]),
             post=Post([staff_works_day_shift[m, d] for d in days], [1]),
@@ -314,7 +392,8 @@ def days_off_between_late_and_afternoon_shifts(model: CpModel,
                                                days: List[int],
                                                hard_min: int,
                                                soft_min: int,
-                                               min_cost: int):
+                                               min_cost: int,
+                                               encoding: str = WINDOW_ENCODING):
     # 2 days off when transitioning from late shift to afternoon shift (although this transition should be avoided)
     obj_bool_vars = []
     obj_bool_coeffs = []
@@ -326,6 +405,7 @@ def days_off_between_late_and_afternoon_shifts(model: CpModel,
             hard_min=hard_min,
             soft_min=soft_min,
             min_cost=min_cost,
+            encoding=encoding,
             prior=Prior([staff_works_late_shift[m, d]
                         for d in days], [1]),
             post=Post([staff_works_afternoon_shift[m, d]
@@ -342,7 +422,8 @@ def late_shifts_in_a_row(model: CpModel,
                          days: List[int],
                          hard_max: int,
                          soft_max: int,
-                         max_cost: int):
+                         max_cost: int,
+                         encoding: str = WINDOW_ENCODING):
     # 3 late shifts in a row maximum - late shifts are 1800, 2000, 2200. The ability to set what a late shift is would be great. Likely better to set them
     # as 2000 and 2200. Midnight shift should also be included.
     obj_bool_vars = []
@@ -351,10 +432,11 @@ def late_shifts_in_a_row(model: CpModel,
         variables, coeffs = add_soft_sequence_max(
             model=model,
             prefix="late_shifts_in_a_row_" + m,
-            shifts=not_list([staff_works_late_shift[m, d] for d in days]),
+            shifts=not_list([staff_works_late_shift[m, d] for d in days], literal_cache(model)),
             hard_max=hard_max,
             soft_max=soft_max,
             max_cost=max_cost,
+            encoding=encoding,
         )
         obj_bool_vars.extend(variables)
         obj_bool_coeffs.extend(coeffs)
@@ -399,7 +481,8 @@ def avoid_consecutive_ft_shifts(model: CpModel,
                                 days: List[int],
                                 hard_max: int,
                                 soft_max: int,
-                                max_cost: int):
+                                max_cost: int,
+                                encoding: str = WINDOW_ENCODING):
     # Avoid FT shifts (0730,1530) on consecutive days
     obj_int_vars = []
     obj_int_coeffs = []
@@ -407,10 +490,11 @@ def avoid_consecutive_ft_shifts(model: CpModel,
         variables, coeffs = add_soft_sequence_max(
             model=model,
             prefix="avoid_consecutive_ft_shifts_" + m,
-            shifts=not_list([staff_works_ft_shift[(m, d)] for d in days]),
+            shifts=not_list([staff_works_ft_shift[(m, d)] for d in days], literal_cache(model)),
             hard_max=hard_max,
             soft_max=soft_max,
             max_cost=max_cost,
+            encoding=encoding,
         )
         obj_int_vars.extend(variables)
         obj_int_coeffs.extend(coeffs)
@@ -422,7 +506,8 @@ def equalize_weekends(model: CpModel,
                       staff: List[int],
                       weekends: List[int],
                       cost: int,
-                      target: int):
+                      target: int,
+                      encoding: str = PRODUCT_DISTRIBUTION):
     # Equalize weekends
     obj_int_vars = []
     obj_int_coeffs = []
@@ -432,7 +517,8 @@ def equalize_weekends(model: CpModel,
             target_shifts=[staff_works_day[m, d]
                            for d in weekends] + [model.NewConstant(-1)] * (4 - cost),
             prefix="equalize_weekends_" + m,
-            target=target - (4 - cost)
+            target=target - (4 - cost),
+            encoding=encoding
         )
         obj_int_vars.extend(variables)
         obj_int_coeffs.extend(coeffs)
@@ -472,7 +558,8 @@ def equalize_night_shifts(model: CpModel,
                           staff: List[int],
                           days: List[int],
                           cost: int,
-                          target: int):
+                          target: int,
+                          encoding: str = PRODUCT_DISTRIBUTION):
     # Equalize night shifts
     obj_int_vars = []
     obj_int_coeffs = []
@@ -482,7 +569,8 @@ def equalize_night_shifts(model: CpModel,
             target_shifts=[staff_works_midnight_shift[m, d]
                            for d in days] + [model.NewConstant(-1)] * (4 - cost),
             prefix="equalize_nights_" + m,
-            target=target - (4 - cost)
+            target=target - (4 - cost),
+            encoding=encoding
         )
         obj_int_vars.extend(variables)
         obj_int_coeffs.extend(coeffs)
@@ -497,7 +585,8 @@ def no_nightshifts_before_weekend_off(model: CpModel,
                                       saturdays: List[int],
                                       hard_min: int,
                                       soft_min: int,
-                                      min_cost: int):
+                                      min_cost: int,
+                                      encoding: str = WINDOW_ENCODING):
     # Avoid scheduling people shifts that end after 5 pm Friday on weekends they have off
     obj_bool_vars = []
     obj_bool_coeffs = []
@@ -510,6 +599,7 @@ def no_nightshifts_before_weekend_off(model: CpModel,
             hard_min=hard_min,
             soft_min=soft_min,
             min_cost=min_cost,
+            encoding=encoding,
             post=Post([model.NewConstant(1)] * hard_min +
                       [staff_works_day[m, d] for d in saturdays], [1])
         )
@@ -523,7 +613,8 @@ def equalize_late_shifts(model: CpModel,
                          staff: List[int],
                          days: List[int],
                          cost: int,
-                         target: int):
+                         target: int,
+                         encoding: str = PRODUCT_DISTRIBUTION):
     # Equalize late shifts (currently our 2000, 2200 shifts)
     # Equalize 2200 shifts
     # Equalize 2000 shifts
@@ -535,7 +626,8 @@ def equalize_late_shifts(model: CpModel,
             target_shifts=[staff_works_late_shift[m, d]
                            for d in days] + [model.NewConstant(-1)] * (4 - cost),
             prefix="equalize_lates_" + m,
-            target=target - (4 - cost)
+            target=target - (4 - cost),
+            encoding=encoding
         )
         obj_int_vars.extend(variables)
         obj_int_coeffs.extend(coeffs)
@@ -547,7 +639,8 @@ def equalize_day_shifts(model: CpModel,
                         staff: List[int],
                         days: List[int],
                         cost: int,
-                        target: int):
+                        target: int,
+                        encoding: str = PRODUCT_DISTRIBUTION):
     # Equalize day shifts (0700 - 1200 start time)
     obj_int_vars = []
     obj_int_coeffs = []
@@ -557,7 +650,8 @@ def equalize_day_shifts(model: CpModel,
             target_shifts=[staff_works_day_shift[m, d]
                            for d in days] + [model.NewConstant(-1)] * (4 - cost),
             prefix="equalize_days_" + m,
-            target=target - (4 - cost)
+            target=target - (4 - cost),
+            encoding=encoding
         )
         obj_int_vars.extend(variables)
         obj_int_coeffs.extend(coeffs)
@@ -569,7 +663,8 @@ def equalize_afternoon_shifts(model: CpModel,
                               staff: List[int],
                               days: List[int],
                               cost: int,
-                              target: int):
+                              target: int,
+                              encoding: str = PRODUCT_DISTRIBUTION):
     # Equalize afternoon shifts (1300 - 1800 start time)
     obj_int_vars = []
     obj_int_coeffs = []
@@ -579,7 +674,8 @@ def equalize_afternoon_shifts(model: CpModel,
             target_shifts=[staff_works_afternoon_shift[m, d]
                            for d in days] + [model.NewConstant(-1)] * (4 - cost),
             prefix="equalize_afternoons_" + m,
-            target=target - (4 - cost)
+            target=target - (4 - cost),
+            encoding=encoding
         )
         obj_int_vars.extend(variables)
         obj_int_coeffs.extend(coeffs)
@@ -591,7 +687,8 @@ def equalize_weekdays(model: CpModel,
                       staff: List[int],
                       weekdays: List[int],
                       cost: int,
-                      target: int):
+                      target: int,
+                      encoding: str = PRODUCT_DISTRIBUTION):
     # Equalize weekdays (same number of shifts on M,T,W,Th,F)
     obj_int_vars = []
     obj_int_coeffs = []
@@ -601,7 +698,8 @@ def equalize_weekdays(model: CpModel,
             target_shifts=[staff_works_day[m, d]
                            for d in weekdays] + [model.NewConstant(-1)] * (4 - cost),
             prefix="equalize_weekdays_" + m,
-            target=target - (4 - cost)
+            target=target - (4 - cost),
+            encoding=encoding
         )
         obj_int_vars.extend(variables)
         obj_int_coeffs.extend(coeffs)
@@ -636,19 +734,25 @@ def apply_productivity(model: CpModel,
     obj_int_vars = []
     obj_int_coeffs = []
     for d in days:
-        for wind in window(shifts[:-1], span):
-            variables, coeffs = add_soft_sum(
-                model=model,
-                prefix="productivity",
-                shifts=[staff_productivities[m, d, s]
-                        for m in staff for s in wind],
-                hard_min=0,
-                soft_min=6,
-                min_cost=LOW,
-                hard_max=span * 5,
-                soft_max=15,
-                max_cost=LOW,
-            )
-            obj_int_vars.extend(variables)
-            obj_int_coeffs.extend(coeffs)
+        # One productivity total per shift, every window on the day sums span of them
+        # Productivities aren't negative so a shift can't have more than a whole window
+        totals = []
+        for s in shifts[:-1]:
+            total = model.NewIntVar(0, span * 5, f"productivity_day_{d}_shift_{s}")
+            model.Add(total == sum(staff_productivities[m, d, s] for m in staff))
+            totals.append(total)
+        variables, coeffs = add_soft_window_sums(
+            model=model,
+            prefix="productivity",
+            totals=totals,
+            span=span,
+            hard_min=0,
+            soft_min=6,
+            min_cost=LOW,
+            hard_max=span * 5,
+            soft_max=15,
+            max_cost=LOW,
+        )
+        obj_int_vars.extend(variables)
+        obj_int_coeffs.extend(coeffs)
     return obj_int_vars, obj_int_coeffs
@@ -0,0 +1,287 @@
+from validation import *
+from functools import lru_cache
+import scheduling_funtions
+
+
+# Scores a schedule without a solver, family by family the way build_schedule adds them
+# The schedule is a staff x day x shift 0/1 array (see schedule_array), the result is the objective
+# the model gives that schedule and the hard rules it breaks, in total, per family and per staff
+#
+# Sequence rules are scored with the windows the automaton encoding is built from (sequence_windows
+# and window_outcome), evaluated for every staff and window start at once
+
+# validation has its own sequence_windows for the notebook's tests. The windows only depend on
+# the rule and schedules are scored many times over, so they're kept
+rule_windows = lru_cache()(scheduling_funtions.sequence_windows)
+
+
+def sequence_costs(x: np.ndarray, rule: SequenceRule, prior: np.ndarray = None, post: np.ndarray = None):
+    # x, prior and post are staff x day arrays, post is padded with ones and prior with zeros like the
+    # automaton does. Returns the cost and the number of broken hard windows for each staff
+    num_staff, num_days = x.shape
+    k = len(rule.choices) if rule.choices is not None else 0
+    j = rule.post_length or 0
+    pad = np.zeros((num_staff, 1), dtype=np.int64)
+    sums = np.concatenate([pad, np.cumsum(x, axis=1)], axis=1)
+    prior = np.zeros_like(x) if prior is None else prior
+    post = np.ones_like(x) if post is None else post
+
+    costs = np.zeros(num_staff, dtype=np.int64)
+    violations = np.zeros(num_staff, dtype=np.int64)
+    for window in rule_windows(rule):
+        count = num_days - window.need + 1
+        if count <= 0:
+            continue
+        starts = np.arange(count)
+        length = window.length
+        if window.bounded:
+            span_any = sums[:, starts + length] - sums[:, starts] > 0
+            left = starts > 0
+            span_any[:, left] |= x[:, starts[left] - 1] == 0
+            right = starts + length < num_days
+            span_any[:, right] |= x[:, starts[right] + length] == 0
+            span_all = None
+        else:
+            first = starts + k
+            end = np.maximum(first, np.minimum(starts + length + 1 + k - j, num_days))
+            total = sums[:, end] - sums[:, first]
+            span_any = total > 0
+            span_all = total == end - first
+
+        matched = np.ones((num_staff, count), dtype=bool)
+        for i, choice in enumerate(rule.choices or []):
+            matched &= prior[:, starts + i] == int(choice)
+        for i in range(j):
+            matched &= post[:, starts + length + k + i] == 1
+        # The prior's next day, only read by windows that exist far enough from the end
+        continued = np.zeros((num_staff, count), dtype=bool)
+        if k and (window.continues or (rule.choices is not None and j)):
+            readable = starts + k < num_days
+            continued[:, readable] = prior[:, starts[readable] + k] == 1
+
+        if window.forbid:
+            if k and j:
+                broken = matched
+            elif not k and not j:
+                broken = ~span_any
+            else:
+                broken = matched & ~span_all & ~(window.continues & continued)
+            violations += broken.sum(axis=1)
+            continue
+        if k and j:
+            charged = matched & (~span_any | ~continued)
+        elif k or j:
+            charged = matched & ~span_all & ~(window.continues & continued)
+        else:
+            charged = ~span_any
+        costs += window.cost * charged.sum(axis=1)
+    return costs, violations
+
+
+def family_result(staff: List, costs: np.ndarray, violations: np.ndarray) -> Dict:
+    return {"cost": int(costs.sum()),
+            "violations": int(violations.sum()),
+            "staff": {m: int(cost) for m, cost in zip(staff, costs)},
+            "staff_violations": {m: int(count) for m, count in zip(staff, violations)}}
+
+
+def evaluate_sequence(instance: Instance, staff: List, x: np.ndarray, hard: int, soft: int, cost: int,
+                      minimum: bool, prior: Prior = None, post: Post = None) -> Dict:
+    # Prior and Post hold staff x day arrays over every staff, only the rows in staff are scored
+    rows = staff_rows(instance, staff)
+    rule = sequence_rule(minimum, hard, soft, cost, prior, post)
+    costs, violations = sequence_costs(x[rows],
+                                       rule,
+                                       None if prior is None else prior.shifts[rows],
+                                       None if post is None else post.shifts[rows])
+    return family_result(staff, costs, violations)
+
+
+def evaluate_request_sequences(instance: Instance, hard_min: int, soft_min: int, cost: int,
+                               sequences: Dict[str, Tuple[List[int], List[int]]]) -> Dict:
+    # Sequences built per staff out of requests or chosen days, so they differ in length
+    costs = np.zeros(len(instance.staff), dtype=np.int64)
+    violations = np.zeros(len(instance.staff), dtype=np.int64)
+    for i, m in enumerate(instance.staff):
+        shifts, post = sequences[m]
+        x = np.array([shifts], dtype=np.int64)
+        # Posts past the end of the sequence are dropped, past the end of the post list they don't exist
+        post = np.array([(post + [1] * len(shifts))[:len(shifts)]], dtype=np.int64)
+        rule = SequenceRule(True, hard_min, soft_min, cost, None, False, 1)
+        staff_cost, staff_violations = sequence_costs(x, rule, None, post)
+        costs[i], violations[i] = staff_cost[0], staff_violations[0]
+    return family_result(instance.staff, costs, violations)
+
+
+def evaluate_distribution(instance: Instance, counts: np.ndarray, cost: int, target: int) -> Dict:
+    # distribution() pads the count with 4 - cost shifts of -1 and lowers the target by as many
+    padding = 4 - cost
+    shifts = counts - padding
+    target = target - padding
+    diff = target - shifts
+    # Over the target, or below zero with the padding, has no value in the model
+    # Counted in shifts, so a search can tell one over from two
+    violations = np.maximum(-diff, 0) + np.maximum(-shifts, 0)
+    costs = 2 * np.maximum(diff, 0) * (np.maximum(diff, 0) + 1)
+    return family_result(instance.staff, costs, violations)
+
+
+def transition_costs(array: np.ndarray, shift_names: List[str] = shift_list) -> np.ndarray:
+    # Cost of every move between consecutive days, looked up from the shift worked on each
+    timed = timed_shifts(shift_names)
+    table = np.zeros((len(shift_names) + 1, len(shift_names) + 1), dtype=np.int64)
+    for (previous_shift, next_shift), cost in penalized_transitions(shift_names):
+        table[previous_shift + 1, next_shift + 1] = cost
+    works_timed = array[:, :, timed]
+    worked = np.where(works_timed.any(axis=2), np.array(timed)[works_timed.argmax(axis=2)] + 1, 0)
+    return table[worked[:, :-1], worked[:, 1:]].sum(axis=1)
+
+
+def evaluate_productivity(instance: Instance, array: np.ndarray, span: int) -> Dict:
+    # Per day the productivity worked on each shift but on call, every span shifts in a row
+    # should add up to at least 6. The totals and windows are hard limited to span * 5
+    productivities = np.array(instance.productivities, dtype=np.int64)
+    totals = np.einsum("m,mds->ds", productivities, array[:, :, instance.shifts[:-1]].astype(np.int64))
+    windows = np.lib.stride_tricks.sliding_window_view(totals, span, axis=1).sum(axis=2)
+    violations = int((totals > span * 5).sum() + (windows > span * 5).sum())
+    cost = int(LOW * np.maximum(6 - windows, 0).sum())
+    # The penalty is on the day's totals, not on any one staff
+    return {"cost": cost, "violations": violations, "staff": {}, "staff_violations": {}}
+
+
+def evaluate_hard_rules(instance: Instance, array: np.ndarray) -> Dict[str, int]:
+    # Constraints with no cost, the number of times each is broken
+    staff_index = {m: i for i, m in enumerate(instance.staff)}
+
+    def shifts_of(staff, shifts):
+        rows = [staff_index[m] for m in staff]
+        return int(array[np.ix_(rows, range(array.shape[1]), shifts)].sum()) if rows and shifts else 0
+
+    # The staff groups' shifts are also left out of the model's cells (Instance.eligibility)
+    return {"all_shifts_taken": int((array.sum(axis=0) != 1).sum()),
+            "one_shift_a_day": int((array.sum(axis=2) > 1).sum()),
+            "midnight_physicians": shifts_of(instance.midnight_staff, instance.not_midnight_shifts),
+            "no_midnights_within_six_months": shifts_of(instance.six_month_new_staff, instance.midnight_shifts),
+            "ft_physicians": shifts_of(instance.ft_staff, instance.not_ft_shifts)}
+
+
+def staff_instance(instance: Instance, staff: List) -> Instance:
+    # The instance with only some of its staff, their requests and their groups
+    return Instance(staff=list(staff),
+                    shifts=instance.shifts,
+                    days=instance.days,
+                    first_day=instance.first_day,
+                    requests=[request for request in instance.requests if request[0] in staff],
+                    ft_staff=[m for m in instance.ft_staff if m in staff],
+                    midnight_staff=[m for m in instance.midnight_staff if m in staff],
+                    six_month_new_staff=[m for m in instance.six_month_new_staff if m in staff],
+                    productivities=[instance.productivities[instance.staff.index(m)] for m in staff],
+                    midnight_shifts=instance.midnight_shifts,
+                    late_shifts=instance.late_shifts,
+                    day_shifts=instance.day_shifts,
+                    afternoon_shifts=instance.afternoon_shifts,
+                    ft_shifts=instance.ft_shifts,
+                    on_call_shifts=instance.on_call_shifts,
+                    shift_names=instance.shift_names)
+
+
+def evaluate_schedule(array: np.ndarray, instance: Instance, parameters: Parameters = None,
+                      staff: List = None) -> Dict:
+    # Returns {"total", "violations", "hard_rules",
+    #          "families": {family: {"cost", "violations", "staff", "staff_violations"}}}
+    # total is only the model's objective if there are no violations, otherwise the model has no solution
+    # staff: only score these staff, e.g. the ones a change touched. The productivity and the hard
+    # rules over whole days are still scored on every staff, the equalize targets are for every staff
+    p = parameters or Parameters()
+    num_staff = len(instance.staff)
+    productivity = evaluate_productivity(instance, array, p.productivity_span)
+    hard_rules = evaluate_hard_rules(instance, array)
+    if staff is not None:
+        array = array[staff_rows(instance, staff)]
+        instance = staff_instance(instance, staff)
+    i = instance
+    staff, days, shifts = i.staff, i.days, i.shifts
+    v = schedule_views(array, instance)
+    v = {name: view.astype(np.int64) for name, view in v.items()}
+    families = {}
+
+    # The max rules are built on the negated view
+    for name, family in sequence_rules(p, v).items():
+        families[name] = evaluate_sequence(i, getattr(i, family.staff),
+                                           family.shifts if family.minimum else 1 - family.shifts,
+                                           family.hard, family.soft, family.cost, family.minimum,
+                                           family.prior, family.post)
+
+    sequences = {}
+    for m in staff:
+        row = staff.index(m)
+        days_off = [d for n, d, s, w in i.requests if n == m and s == -1]
+        before = [int(v["staff_doesnt_work_after_5_shift"][row, d - 1]) if d > 0 else 0 for d in days_off]
+        sequences[m] = (before + [1], [1] * p.no_late_shift_before_time_off_hard_min +
+                        [int(v["staff_works_day"][row, d]) for d in days_off])
+    families["no_late_shift_before_time_off"] = evaluate_request_sequences(
+        i, p.no_late_shift_before_time_off_hard_min, p.no_late_shift_before_time_off_soft_min,
+        p.no_late_shift_before_time_off_min_cost, sequences)
+
+    transitions = transition_costs(array, i.shift_names)
+    families["transitions_constraints"] = family_result(staff, transitions, np.zeros_like(transitions))
+
+    # add_soft_sum over each whole week but the last
+    weeks = days[-1] // 7
+    late = v["staff_works_late_shift"][:, :weeks * 7].reshape(len(staff), weeks, 7).sum(axis=2)
+    costs = np.zeros(len(staff), dtype=np.int64)
+    if p.late_shifts_in_weeks_soft_min > p.late_shifts_in_weeks_hard_min and p.late_shifts_in_weeks_min_cost > 0:
+        costs += p.late_shifts_in_weeks_min_cost * np.maximum(p.late_shifts_in_weeks_soft_min - late, 0).sum(axis=1)
+    if p.late_shifts_in_weeks_soft_max < p.late_shifts_in_weeks_hard_max and p.late_shifts_in_weeks_max_cost > 0:
+        costs += p.late_shifts_in_weeks_max_cost * np.maximum(late - p.late_shifts_in_weeks_soft_max, 0).sum(axis=1)
+    violations = ((late < p.late_shifts_in_weeks_hard_min) | (late > p.late_shifts_in_weeks_hard_max)).sum(axis=1)
+    families["late_shifts_in_weeks"] = family_result(staff, costs, violations)
+
+    families["equalize_weekends"] = evaluate_distribution(
+        i, v["staff_works_day"][:, i.weekends].sum(axis=1), p.equalize_weekends_cost,
+        triangle_costs(len(shifts), len(i.weekends), num_staff))
+
+    pairs = min(len(i.sats), len(i.suns))
+    split = (v["staff_works_day"][:, i.sats[:pairs]] != v["staff_works_day"][:, i.suns[:pairs]]).sum(axis=1)
+    families["minimize_split_weekends"] = family_result(
+        staff, p.minimize_split_weekends_cost * split, np.zeros_like(split))
+
+    families["equalize_night_shifts"] = evaluate_distribution(
+        i, v["staff_works_midnight_shift"].sum(axis=1), p.equalize_night_shifts_cost,
+        triangle_costs(len(i.midnight_shifts), len(days), num_staff))
+
+    sequences = {}
+    for m in staff:
+        row = staff.index(m)
+        sequences[m] = ([int(v["staff_doesnt_work_after_5_shift"][row, d]) for d in i.fris] + [1],
+                        [1] * p.no_nightshifts_before_weekend_off_hard_min +
+                        [int(v["staff_works_day"][row, d]) for d in i.sats])
+    families["no_nightshifts_before_weekend_off"] = evaluate_request_sequences(
+        i, p.no_nightshifts_before_weekend_off_hard_min, p.no_nightshifts_before_weekend_off_soft_min,
+        p.no_nightshifts_before_weekend_off_min_cost, sequences)
+
+    families["equalize_late_shifts"] = evaluate_distribution(
+        i, v["staff_works_late_shift"].sum(axis=1), p.equalize_late_shifts_cost,
+        triangle_costs(len(i.late_shifts), len(days), num_staff))
+    families["equalize_day_shifts"] = evaluate_distribution(
+        i, v["staff_works_day_shift"].sum(axis=1), p.equalize_day_shifts_cost,
+        triangle_costs(len(i.day_shifts), len(days), num_staff))
+    families["equalize_afternoon_shifts"] = evaluate_distribution(
+        i, v["staff_works_afternoon_shift"].sum(axis=1), p.equalize_afternoon_shifts_cost,
+        triangle_costs(len(i.afternoon_shifts), len(days), num_staff))
+    families["equalize_weekdays"] = evaluate_distribution(
+        i, v["staff_works_day"][:, i.weekdays].sum(axis=1), p.equalize_weekdays_cost,
+        triangle_costs(len(shifts), len(i.weekdays), num_staff))
+
+    requests = np.zeros(len(staff), dtype=np.int64)
+    for m, d, s, w in i.requests:
+        row = staff.index(m)
+        requests[row] += w * (v["staff_works_day"][row, d] if s == -1 else int(array[row, d, s]))
+    families["apply_requests"] = family_result(staff, requests, np.zeros_like(requests))
+
+    families["apply_productivity"] = productivity
+
+    return {"total": sum(family["cost"] for family in families.values()),
+            "violations": sum(family["violations"] for family in families.values()) + sum(hard_rules.values()),
+            "hard_rules": hard_rules,
+            "families": families}
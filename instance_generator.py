@@ -0,0 +1,105 @@
+from schedule import *
+
+
+# Seeded instances of any size, for scaling the model past the one department in data.py
+# Shift groups come from the start time in each shift's name, as in the data.py masks
+
+ON_CALL_SHIFT = "On Call"
+
+
+def shift_start(name: str) -> float:
+    return int(name[0:2]) + int(name[2:4]) / 60
+
+
+def shift_groups(shift_names: List[str]) -> Dict[str, List[int]]:
+    # Day shifts start before 10, afternoons from 12 until 5, lates until 11 and midnights after
+    groups = {"day_shifts": [], "afternoon_shifts": [], "late_shifts": [], "midnight_shifts": [],
+              "ft_shifts": [], "on_call_shifts": []}
+    for s, name in enumerate(shift_names):
+        if not name[0:4].isdigit():
+            groups["on_call_shifts"].append(s)
+            continue
+        start = shift_start(name)
+        if start < 10:
+            groups["day_shifts"].append(s)
+        elif 12 <= start < 17:
+            groups["afternoon_shifts"].append(s)
+        elif 17 <= start < 23:
+            groups["late_shifts"].append(s)
+        elif start >= 23:
+            groups["midnight_shifts"].append(s)
+        if "(FT)" in name:
+            groups["ft_shifts"].append(s)
+    return groups
+
+
+def generate_shift_list(num_shifts: int = len(shift_list)) -> List[str]:
+    # The data.py shifts taken from each group in turn, so every group has a shift and the equalize
+    # targets aren't empty, then repeated until there are enough. On call is always last
+    groups = shift_groups(shift_list)
+    timed = [groups[group] for group in ["day_shifts", "afternoon_shifts", "late_shifts", "midnight_shifts"]]
+    if num_shifts < len(timed) + 1:
+        raise ValueError(f"At least {len(timed) + 1} shifts are needed, one for each group and on call")
+    order = [group[i] for i in range(max(map(len, timed))) for group in timed if i < len(group)]
+    names = [shift_list[order[i % len(order)]] + ("" if i < len(order) else f" #{i // len(order) + 1}")
+             for i in range(num_shifts - 1)]
+    return sorted(names, key=shift_start) + [ON_CALL_SHIFT]
+
+
+def generate_requests(staff: List, days: List[int], shifts: List[int], request_density: float,
+                      rng: random.Random) -> List[Tuple]:
+    # request_density is the average number of requests per staff every 30 days
+    requests = []
+    most = round(2 * request_density * len(days) / 30)
+    for m in staff:
+        for i in range(rng.randint(0, most)):
+            d = rng.choice(days)
+            s = rng.choice([rng.choice(shifts)] * 10 + [-1])
+            w = rng.choice([LOW, MID, HIGH, MAX])
+            requests.append((m, d, s, w))
+    return requests
+
+
+def generate_instance(num_staff: int = len(staff_list),
+                      months: int = 1,
+                      first_month: int = 1,
+                      year: int = 2021,
+                      shift_names: List[str] = None,
+                      ft_fraction: float = 0,
+                      midnight_fraction: float = 0,
+                      new_staff_fraction: float = 0,
+                      productivity_range: Tuple[int, int] = (1, 6),
+                      request_density: float = 3.5,
+                      seed: int = 0) -> Instance:
+    # The fractions are of the staff, the three groups never overlap
+    # The defaults give an instance the size of data.py with random productivities and requests
+    if not 1 <= months or first_month + months - 1 > 12:
+        raise ValueError("The horizon has to be whole months within one year")
+    if ft_fraction + midnight_fraction + new_staff_fraction > 1:
+        raise ValueError("At most every staff can be in one of the groups")
+    rng = random.Random(seed)
+    shift_names = shift_names or list(shift_list)
+    groups = shift_groups(shift_names)
+    shifts = create_data(shift_names)
+    days, first_day = create_date_range(first_month, first_month + months - 1, year)
+
+    staff = [f"staff_{i}" for i in range(num_staff)]
+    shuffled = rng.sample(staff, num_staff)
+    num_ft = round(ft_fraction * num_staff)
+    num_midnight = round(midnight_fraction * num_staff)
+    num_new = round(new_staff_fraction * num_staff)
+    ft_staff = sorted(shuffled[:num_ft], key=staff.index)
+    midnight_staff = sorted(shuffled[num_ft:num_ft + num_midnight], key=staff.index)
+    six_month_new_staff = sorted(shuffled[num_ft + num_midnight:num_ft + num_midnight + num_new], key=staff.index)
+
+    return Instance(staff=staff,
+                    shifts=shifts,
+                    days=days,
+                    first_day=first_day,
+                    requests=generate_requests(staff, days, shifts, request_density, rng),
+                    ft_staff=ft_staff,
+                    midnight_staff=midnight_staff,
+                    six_month_new_staff=six_month_new_staff,
+                    productivities=[rng.randint(*productivity_range) for _ in staff],
+                    shift_names=shift_names,
+                    **groups)
@@ -0,0 +1,106 @@
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List
+from utility_functions import *
+import json
+import time
+import tracemalloc
+
+
+# Records how much each constraint family adds to the model and how long it takes to build
+
+
+@dataclass
+class FamilyProfile:
+    family: str
+    build_time: float
+    variables: int
+    constraints: int
+    objective_terms: int
+    # Peak Python memory allocated while the family was built, in bytes
+    peak_memory: int
+    constraint_types: Dict[str, int] = field(default_factory=dict)
+
+
+CONSTRAINT_KINDS = ["bool_or", "bool_and", "at_most_one", "exactly_one", "bool_xor", "linear",
+                    "lin_max", "int_prod", "int_div", "int_mod", "element", "table", "automaton",
+                    "all_diff", "inverse", "circuit", "routes", "reservoir", "interval",
+                    "no_overlap", "no_overlap_2d", "cumulative"]
+
+
+def constraint_kind(constraint):
+    # Protobuf messages know which constraint they hold, newer ortools wrappers only have has_*
+    if hasattr(constraint, "WhichOneof"):
+        return constraint.WhichOneof("constraint")
+    for kind in CONSTRAINT_KINDS:
+        if getattr(constraint, "has_" + kind)():
+            return kind
+    return None
+
+
+def profile_builder(profiles: List[FamilyProfile], model, name, builder, *args, **kwargs):
+    proto = model.Proto()
+    num_variables = len(proto.variables)
+    num_constraints = len(proto.constraints)
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+
+    result = builder(*args, **kwargs)
+
+    build_time = time.perf_counter() - start
+    peak_memory = tracemalloc.get_traced_memory()[1] - start_memory
+    if started_tracing:
+        tracemalloc.stop()
+
+    proto = model.Proto()
+    constraint_types = {}
+    for i in range(num_constraints, len(proto.constraints)):
+        kind = constraint_kind(proto.constraints[i])
+        constraint_types[kind] = constraint_types.get(kind, 0) + 1
+
+    # Builders either return (variables, coefficients) or nothing
+    objective_terms = len(result[0]) if isinstance(result, tuple) else 0
+    profiles.append(FamilyProfile(family=name,
+                                  build_time=build_time,
+                                  variables=len(proto.variables) - num_variables,
+                                  constraints=len(proto.constraints) - num_constraints,
+                                  objective_terms=objective_terms,
+                                  peak_memory=peak_memory,
+                                  constraint_types=constraint_types))
+    return result
+
+
+def profile_rows(profiles: List[FamilyProfile], sort_by: str = "build_time"):
+    rows = [{"family": profile.family,
+             "build_time": round(profile.build_time, 3),
+             "variables": profile.variables,
+             "constraints": profile.constraints,
+             "objective_terms": profile.objective_terms,
+             "peak_memory_kb": round(profile.peak_memory / 1024),
+             "constraint_types": ", ".join(f"{kind}={count}" for kind, count in
+                                           sorted(profile.constraint_types.items()))}
+            for profile in profiles]
+    if sort_by is not None:
+        rows.sort(key=lambda row: row[sort_by], reverse=True)
+    return rows
+
+
+def print_profile(profiles: List[FamilyProfile], sort_by: str = "build_time"):
+    rows = profile_rows(profiles, sort_by)
+    rows.append({"family": "total",
+                 "build_time": round(sum(profile.build_time for profile in profiles), 3),
+                 "variables": sum(profile.variables for profile in profiles),
+                 "constraints": sum(profile.constraints for profile in profiles),
+                 "objective_terms": sum(profile.objective_terms for profile in profiles),
+                 "peak_memory_kb": round(max([profile.peak_memory for profile in profiles] + [0]) / 1024),
+                 "constraint_types": ""})
+    print_table(rows)
+
+
+def save_profile(profiles: List[FamilyProfile], name: str):
+    with open(name, "w") as f:
+        json.dump([asdict(profile) for profile in profiles], f, indent=2)
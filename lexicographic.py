@@ -0,0 +1,112 @@
+from solution_arrays import *
+from warm_start import *
+import time
+
+
+# Solves the priority tiers one at a time instead of summing everything into one objective
+# Each tier is minimized on its own, its value is then kept as a constraint (with an optional
+# tolerance) and the next tier is solved starting from the previous solution
+
+# Highest priority first, a cost belongs to the first tier it reaches
+PRIORITY_TIERS = {"max": MAX, "high": HIGH, "mid": MID, "low": LOW}
+
+# Families whose costs aren't parameters
+# The transitions aren't here, each term's coefficient is its cost (MAX or MID) in both encodings
+FAMILY_COSTS = {"apply_productivity": LOW}
+
+
+def cost_tier(cost, tiers: Dict[str, int] = PRIORITY_TIERS):
+    for name, value in tiers.items():
+        if cost >= value:
+            return name
+    # The fairness weights are all below LOW
+    return list(tiers)[-1]
+
+
+def family_cost(parameters: Parameters, family: str):
+    if family in FAMILY_COSTS:
+        return FAMILY_COSTS[family]
+    costs = [value for name, value in asdict(parameters).items()
+             if name in (f"{family}_cost", f"{family}_min_cost", f"{family}_max_cost")]
+    return max(costs) if costs else None
+
+
+def objective_tiers(schedule: Schedule, tiers: Dict[str, int] = PRIORITY_TIERS) -> Dict[str, Tuple[List, List]]:
+    # A family goes in the tier of its cost, the requests and transitions carry their own costs so
+    # go term by term
+    partition = {name: ([], []) for name in tiers}
+    for family, (variables, coeffs) in schedule.objectives.items():
+        cost = family_cost(schedule.parameters, family)
+        for variable, coeff in zip(variables, coeffs):
+            if coeff == 0:
+                continue
+            tier = cost_tier(cost if cost is not None else coeff, tiers)
+            partition[tier][0].append(variable)
+            partition[tier][1].append(coeff)
+    return partition
+
+
+def lexicographic_solve(schedule: Schedule,
+                        time_seconds: float = 60,
+                        tolerance: float = 0,
+                        tiers: Dict[str, int] = PRIORITY_TIERS,
+                        seed: int = 0,
+                        verbose: bool = False) -> Dict:
+    # time_seconds is for each tier
+    # tolerance lets a later tier make an earlier one worse by that fraction of its value
+    partition = objective_tiers(schedule, tiers)
+    clone = clone_model(schedule.model)
+    num_variables = len(clone.Proto().variables)
+    stages = []
+    values = None
+    start = time.time()
+    for tier, (variables, coeffs) in partition.items():
+        if not variables:
+            continue
+        expression = sum(clone.GetIntVarFromProtoIndex(variable.Index()) * coeff
+                         for variable, coeff in zip(variables, coeffs))
+        clone.ClearObjective()
+        clone.Minimize(expression)
+        if values is not None:
+            clone.ClearHints()
+            for index, value in enumerate(values):
+                clone.AddHint(clone.GetIntVarFromProtoIndex(index), value)
+
+        solver = create_solver(time_seconds)
+        solver.parameters.random_seed = seed
+        stage_start = time.time()
+        status = solver.Solve(clone)
+        solved = status == OPTIMAL or status == FEASIBLE
+        stages.append({"tier": tier,
+                       "terms": len(variables),
+                       "status": solver.StatusName(status),
+                       "objective": solver.ObjectiveValue() if solved else None,
+                       "best_bound": solver.BestObjectiveBound() if solved else None,
+                       "time": round(time.time() - stage_start, 2)})
+        if verbose:
+            print(stages[-1])
+        if not solved:
+            # The previous tiers' solution is still the best there is
+            break
+        values = solution_values(solver)[:num_variables]
+        value = round(solver.ObjectiveValue())
+        clone.Add(expression <= value + math.floor(tolerance * abs(value)))
+
+    result = {"status": stages[-1]["status"] if stages else "EMPTY",
+              "stages": stages,
+              "solve_time": round(time.time() - start, 2),
+              "objective": None,
+              "assignment": None,
+              "values": values}
+    if values is not None:
+        # The weighted objective of the final solution, to compare with a single solve
+        # Negated literals have negative indices, literal_values reads them as 1 - value
+        solution = np.array(values, dtype=np.int64)
+        variables, coeffs = schedule.objective_terms()
+        indices = np.array([variable.Index() for variable in variables], dtype=np.int64)
+        result["objective"] = int((literal_values(solution, indices) * np.array(coeffs, dtype=np.int64)).sum())
+        works = schedule.variables["staff_works_shift_on_day"]
+        cells = literal_values(solution, np.array([literal.Index() for literal in works.values()], dtype=np.int64))
+        result["assignment"] = {key: 0 if is_false_literal(schedule.model, literal) else int(value)
+                                for (key, literal), value in zip(works.items(), cells.tolist())}
+    return result
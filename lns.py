@@ -0,0 +1,126 @@
+from warm_start import *
+import time
+
+
+# Large neighbourhood search that knows about the staff x day structure of the problem
+# Every iteration frees the shifts in one neighbourhood, fixes the rest to the incumbent
+# and keeps the result if it's better
+
+# A random subset of the staff, all of their days
+STAFF_NEIGHBOURHOOD = "staff"
+# A run of consecutive days, all staff
+DAYS_NEIGHBOURHOOD = "days"
+# Everyone working on a chosen weekend, for the week around it
+WEEKEND_NEIGHBOURHOOD = "weekend"
+
+
+def neighbourhood_cells(schedule: Schedule,
+                        values: List[int],
+                        neighbourhood: str,
+                        rng: random.Random,
+                        staff_fraction: float,
+                        day_window: int):
+    instance = schedule.instance
+    works = schedule.variables["staff_works_shift_on_day"]
+    if neighbourhood == STAFF_NEIGHBOURHOOD:
+        chosen = set(rng.sample(instance.staff, max(1, round(staff_fraction * len(instance.staff)))))
+        return {key for key in works if key[0] in chosen}
+    if neighbourhood == DAYS_NEIGHBOURHOOD:
+        first = rng.randint(0, max(0, len(instance.days) - day_window))
+        return {key for key in works if first <= key[1] < first + day_window}
+    if neighbourhood == WEEKEND_NEIGHBOURHOOD:
+        if not instance.sats:
+            # A horizon without a Saturday, e.g. a short rolling_horizon block, has no weekend
+            return set()
+        sat = rng.choice(instance.sats)
+        weekend = [sat, sat + 1]
+        chosen = {key[0] for key in works
+                  if key[1] in weekend and not is_false_literal(schedule.model, works[key])
+                  and values[works[key].Index()] == 1}
+        return {key for key in works if key[0] in chosen and sat - 5 <= key[1] <= sat + 1}
+    raise ValueError(f"Unknown neighbourhood {neighbourhood}")
+
+
+def solve_neighbourhood(schedule: Schedule, values: List[int], free: set, time_seconds: float, seed: int = 0):
+    # Shifts outside free are fixed to the incumbent, which is hinted so the solver starts from it
+    clone = clone_model(schedule.model)
+    clone.ClearHints()
+    for index, value in enumerate(values):
+        clone.AddHint(clone.GetIntVarFromProtoIndex(index), value)
+    for key, literal in schedule.variables["staff_works_shift_on_day"].items():
+        if key not in free and not is_false_literal(schedule.model, literal):
+            clone.Add(clone.GetIntVarFromProtoIndex(literal.Index()) == values[literal.Index()])
+
+    solver = create_solver(time_seconds)
+    solver.parameters.random_seed = seed
+    status = solver.Solve(clone)
+    if status != OPTIMAL and status != FEASIBLE:
+        return solver.StatusName(status), None, None
+    return (solver.StatusName(status), solver.ObjectiveValue(),
+            solution_values(solver)[:len(values)])
+
+
+def lns(schedule: Schedule,
+        assignment: Dict[Tuple, int],
+        iterations: int = 50,
+        time_seconds: float = 10,
+        neighbourhoods: Dict[str, float] = None,
+        staff_fraction: float = 0.2,
+        day_window: int = 7,
+        seed: int = 0,
+        verbose: bool = False) -> Dict:
+    # assignment is any feasible schedule, e.g. from read_assignment_from_file or rolling_horizon
+    # neighbourhoods maps each neighbourhood to how often it's picked
+    neighbourhoods = neighbourhoods or {STAFF_NEIGHBOURHOOD: 1, DAYS_NEIGHBOURHOOD: 1, WEEKEND_NEIGHBOURHOOD: 1}
+    if not schedule.instance.sats:
+        # Nothing to free in a weekend neighbourhood, its iterations go to the others
+        neighbourhoods = {name: weight for name, weight in neighbourhoods.items() if name != WEEKEND_NEIGHBOURHOOD}
+        if not neighbourhoods:
+            raise ValueError("The horizon has no Saturday for the weekend neighbourhood")
+    if not schedule.model.HasObjective():
+        minimize_schedule(schedule)
+    rng = random.Random(seed)
+
+    num_variables = len(schedule.model.Proto().variables)
+    start = time.time()
+    # Nothing free, this fills in the auxiliary variables and the objective of the start
+    cells = dict(hint_cells(schedule, assignment))
+    start_values = [cells.get(i, 0) for i in range(num_variables)]
+    status, objective, values = solve_neighbourhood(schedule, start_values, set(), time_seconds, seed)
+    if values is None:
+        raise ValueError("The starting schedule isn't feasible for this model")
+
+    history = [{"iteration": 0, "neighbourhood": "start", "free_cells": 0, "status": "FEASIBLE",
+                "objective": objective, "improvement": 0, "time": round(time.time() - start, 2)}]
+    summary = {name: {"neighbourhood": name, "iterations": 0, "improved": 0, "improvement": 0, "time": 0}
+               for name in neighbourhoods}
+    for iteration in range(1, iterations + 1):
+        neighbourhood = rng.choices(list(neighbourhoods), weights=list(neighbourhoods.values()))[0]
+        free = neighbourhood_cells(schedule, values, neighbourhood, rng, staff_fraction, day_window)
+        iteration_start = time.time()
+        status, new_objective, new_values = solve_neighbourhood(
+            schedule, values, free, time_seconds, seed + iteration)
+        elapsed = time.time() - iteration_start
+
+        improvement = 0
+        if new_values is not None and new_objective < objective:
+            improvement = objective - new_objective
+            objective, values = new_objective, new_values
+
+        stats = summary[neighbourhood]
+        stats["iterations"] += 1
+        stats["improved"] += improvement > 0
+        stats["improvement"] += improvement
+        stats["time"] = round(stats["time"] + elapsed, 2)
+        history.append({"iteration": iteration, "neighbourhood": neighbourhood, "free_cells": len(free),
+                        "status": status, "objective": objective,
+                        "improvement": improvement, "time": round(time.time() - start, 2)})
+        if verbose:
+            print(f"{iteration}: {neighbourhood} freed {len(free)} shifts, {status}, objective {objective}")
+
+    works = schedule.variables["staff_works_shift_on_day"]
+    return {"objective": objective,
+            "assignment": {key: 0 if is_false_literal(schedule.model, literal) else values[literal.Index()]
+                           for key, literal in works.items()},
+            "history": history,
+            "neighbourhoods": list(summary.values())}
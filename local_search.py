@@ -0,0 +1,221 @@
+from evaluation import *
+from warm_start import *
+import time
+
+
+# First schedules without the solver: a greedy fill that gives every shift to an eligible staff,
+# then moves between staff kept when they don't make the schedule worse
+# A move only changes a few staff, so only their rows are scored again (evaluate_schedule's staff)
+# The result is meant as a hint for the CP-SAT solve, see local_search_hint
+
+# Breaking a hard rule costs more than any schedule's penalties, so those are fixed first
+HARD_VIOLATION_COST = 100000
+
+# One staff's shift given to a staff who is off that day
+MOVE = "move"
+# Two staff working the same day trade their shifts
+SWAP = "swap"
+# Two staff trade everything they work over a few days in a row
+EXCHANGE = "exchange"
+MOVES = [MOVE, SWAP, EXCHANGE]
+MAX_EXCHANGE_DAYS = 7
+
+
+def eligible_array(instance: Instance) -> np.ndarray:
+    eligibility = instance.eligibility
+    return np.array([[[is_eligible(eligibility, m, d, s) for s in instance.shifts]
+                      for d in instance.days]
+                     for m in instance.staff], dtype=bool)
+
+
+def request_costs(instance: Instance) -> np.ndarray:
+    # The cost of each cell from the requests, a day off request counts on every shift of the day
+    costs = np.zeros((len(instance.staff), len(instance.days), len(instance.shifts)), dtype=np.int64)
+    for m, d, s, w in instance.requests:
+        if s == -1:
+            costs[instance.staff.index(m), d, :] += w
+        else:
+            costs[instance.staff.index(m), d, s] += w
+    return costs
+
+
+def greedy_schedule(instance: Instance, seed: int = 0) -> np.ndarray:
+    # Day by day, the shifts with the fewest eligible staff first, each goes to the staff it costs
+    # least in requests, who is rested (nothing the day before, no shift after 5 in the two before)
+    # and has worked the fewest weekends and shifts of its group
+    rng = random.Random(seed)
+    staff, days, shifts = instance.staff, instance.days, instance.shifts
+    eligible = eligible_array(instance)
+    requests = request_costs(instance)
+    weekends = set(instance.weekends)
+    after_5 = instance.after_5_shifts
+    groups = [instance.day_shifts, instance.afternoon_shifts, instance.late_shifts,
+              instance.midnight_shifts, instance.on_call_shifts]
+    group_of = {s: next((g for g, group in enumerate(groups) if s in group), len(groups)) for s in shifts}
+    loads = np.zeros((len(staff), len(groups) + 1), dtype=np.int64)
+    weekend_loads = np.zeros(len(staff), dtype=np.int64)
+    array = np.zeros((len(staff), len(days), len(shifts)), dtype=np.uint8)
+    for d in days:
+        order = sorted(shifts, key=lambda s: (eligible[:, d, s].sum(), rng.random()))
+        for s in order:
+            candidates = [m for m in range(len(staff)) if eligible[m, d, s]]
+            if not candidates:
+                continue
+            free = [m for m in candidates if not array[m, d].any()]
+            m = min(free or candidates,
+                    key=lambda m: (requests[m, d, s],
+                                   d > 0 and bool(array[m, d - 1].any()),
+                                   bool(array[m, max(d - 2, 0):d, after_5].any()),
+                                   d in weekends and weekend_loads[m],
+                                   loads[m, group_of[s]],
+                                   loads[m].sum(),
+                                   rng.random()))
+            array[m, d, s] = 1
+            loads[m, group_of[s]] += 1
+            weekend_loads[m] += d in weekends
+    return array
+
+
+def schedule_score(result: Dict) -> int:
+    return HARD_VIOLATION_COST * result["violations"] + result["total"]
+
+
+def staff_scores(result: Dict) -> Dict:
+    # Each staff's part of the score, the rest (shared_score) is on whole days
+    scores = {}
+    for family in result["families"].values():
+        for m, cost in family["staff"].items():
+            scores[m] = scores.get(m, 0) + cost + HARD_VIOLATION_COST * family["staff_violations"][m]
+    return scores
+
+
+def shared_score(result: Dict) -> int:
+    return schedule_score(result) - sum(staff_scores(result).values())
+
+
+def propose_move(array: np.ndarray, eligible: np.ndarray, kind: str, rng: random.Random, focus: int = None):
+    # The rows a move changes and their new values, or None if the move found can't be made
+    # focus: a staff the move has to take a shift from
+    num_staff, num_days, num_shifts = array.shape
+    works_day = array.any(axis=2)
+    if focus is not None and kind != EXCHANGE:
+        worked = np.flatnonzero(works_day[focus])
+        if len(worked) == 0:
+            return None
+        d = int(rng.choice(worked))
+    else:
+        d = rng.randrange(num_days)
+    if kind == MOVE:
+        s = int(array[focus, d].argmax()) if focus is not None else rng.randrange(num_shifts)
+        holders = np.flatnonzero(array[:, d, s])
+        candidates = np.flatnonzero(eligible[:, d, s] & ~works_day[:, d])
+        if len(candidates) == 0:
+            return None
+        b = int(rng.choice(candidates))
+        rows = {b: array[b].copy()}
+        rows[b][d, s] = 1
+        if len(holders):
+            a = int(holders[0])
+            rows[a] = array[a].copy()
+            rows[a][d, s] = 0
+        return rows
+    if kind == SWAP:
+        working = [int(m) for m in np.flatnonzero(works_day[:, d]) if m != focus]
+        if len(working) < 2 - (focus is not None):
+            return None
+        a, b = (focus, rng.choice(working)) if focus is not None else rng.sample(working, 2)
+        rows = {a: array[a].copy(), b: array[b].copy()}
+        rows[a][d], rows[b][d] = array[b, d], array[a, d]
+    else:
+        a = focus if focus is not None else rng.randrange(num_staff)
+        b = rng.choice([m for m in range(num_staff) if m != a])
+        days = slice(d, min(d + rng.randint(2, MAX_EXCHANGE_DAYS), num_days))
+        rows = {a: array[a].copy(), b: array[b].copy()}
+        rows[a][days], rows[b][days] = array[b, days], array[a, days]
+    if any((values.astype(bool) & ~eligible[m]).any() for m, values in rows.items()):
+        return None
+    return rows
+
+
+def local_search(instance: Instance,
+                 parameters: Parameters = None,
+                 array: np.ndarray = None,
+                 time_seconds: float = 10,
+                 max_moves: int = None,
+                 moves: List[str] = MOVES,
+                 stop_when_feasible: bool = False,
+                 seed: int = 0,
+                 verbose: bool = False) -> Dict:
+    # array: a schedule to start from, otherwise the greedy fill
+    # A move is kept if it doesn't make the score worse, so the search can cross plateaus
+    # While there are staff breaking hard rules, half the moves take a shift from one of them
+    # Stops after time_seconds, max_moves, once a feasible schedule has no cost left or with
+    # stop_when_feasible as soon as it breaks no hard rule
+    parameters = parameters or Parameters()
+    rng = random.Random(seed)
+    start = time.time()
+    array = greedy_schedule(instance, seed) if array is None else array.copy()
+    eligible = eligible_array(instance)
+    greedy = evaluate_schedule(array, instance, parameters)
+    score = schedule_score(greedy)
+    scores = staff_scores(greedy)
+    shared = shared_score(greedy)
+
+    tried = accepted = 0
+    feasible_time = 0 if score < HARD_VIOLATION_COST else None
+    while time.time() - start < time_seconds and (max_moves is None or tried < max_moves) and score > 0:
+        if feasible_time is not None and stop_when_feasible:
+            break
+        breaking = [m for m, staff_score in scores.items() if staff_score >= HARD_VIOLATION_COST]
+        focus = instance.staff.index(rng.choice(breaking)) if breaking and rng.random() < 0.5 else None
+        rows = propose_move(array, eligible, rng.choice(moves), rng, focus)
+        if rows is None:
+            continue
+        tried += 1
+        changed = [instance.staff[m] for m in rows]
+        old = {m: array[m].copy() for m in rows}
+        for m, values in rows.items():
+            array[m] = values
+        # Only the changed staff are scored, the others keep their scores from before
+        result = evaluate_schedule(array, instance, parameters, changed)
+        changed_scores = staff_scores(result)
+        changed_shared = shared_score(result)
+        delta = (sum(changed_scores.values()) - sum(scores[m] for m in changed)) + changed_shared - shared
+        if delta <= 0:
+            accepted += 1
+            if verbose and delta < 0:
+                print(f"{time.time() - start:.2f}s move {tried} score {score + delta}")
+            score += delta
+            scores.update(changed_scores)
+            shared = changed_shared
+            if feasible_time is None and score < HARD_VIOLATION_COST:
+                feasible_time = round(time.time() - start, 2)
+        else:
+            for m, values in old.items():
+                array[m] = values
+
+    result = evaluate_schedule(array, instance, parameters)
+    return {"array": array,
+            "assignment": array_assignment(array, instance.staff, instance.days, instance.shifts),
+            "total": result["total"],
+            "violations": result["violations"],
+            "greedy_total": greedy["total"],
+            "greedy_violations": greedy["violations"],
+            "moves": tried,
+            "accepted": accepted,
+            "feasible_time": feasible_time,
+            "time": round(time.time() - start, 2)}
+
+
+def local_search_hint(schedule: Schedule,
+                      time_seconds: float = 10,
+                      seed: int = 0,
+                      complete: bool = True,
+                      repair: bool = True,
+                      hint_seconds: float = 60,
+                      **options) -> Dict:
+    # Searches for a schedule then hints the model with it, options are passed on to local_search
+    # With repair a schedule that still breaks a hard rule is hinted as the closest one that doesn't
+    search = local_search(schedule.instance, schedule.parameters, time_seconds=time_seconds, seed=seed, **options)
+    hint = hint_schedule(schedule, search["assignment"], complete, repair, hint_seconds)
+    return {**{key: value for key, value in search.items() if key not in ("array", "assignment")}, **hint}
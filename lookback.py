@@ -0,0 +1,41 @@
+from schedule import *
+
+
+# How many days before a horizon the constraints can look at, so only that much history has to
+# be added to the model instead of the whole previous month
+#
+# A sequence rule's windows read from window.first to window.last days around their start, so a
+# window reaching the first new day reads at most last - first days before it
+
+# Families that aren't sequence rules over every day, and how far back they reach
+# late_shifts_in_weeks isn't here, its weeks start at the horizon's first day so it never reads
+# a day before it
+CALENDAR_LOOKBACK = {
+    # The shift the day before
+    "transitions_constraints": 1,
+    # The evening before a day off request
+    "no_late_shift_before_time_off": 1,
+    # Friday before the weekend
+    "no_nightshifts_before_weekend_off": 1,
+    "minimize_split_weekends": 1,
+}
+
+
+def rule_lookback(rule: SequenceRule) -> int:
+    return max((window.last - window.first for window in sequence_windows(rule)), default=0)
+
+
+def family_lookbacks(parameters: Parameters = None) -> Dict[str, int]:
+    lookbacks = {name: rule_lookback(sequence_rule(family.minimum, family.hard, family.soft, family.cost,
+                                                   family.prior, family.post))
+                 for name, family in sequence_rules(parameters).items()}
+    lookbacks.update(CALENDAR_LOOKBACK)
+    return lookbacks
+
+
+def required_lookback(parameters: Parameters = None, families: List[str] = None, exclude: List[str] = None) -> int:
+    # The history the active families need, families and exclude as in build_schedule
+    # Families not listed (the equalize families, requests, productivity...) only see their own days
+    return max((lookback for name, lookback in family_lookbacks(parameters).items()
+                if (families is None or name in families) and (exclude is None or name not in exclude)),
+               default=0)
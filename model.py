@@ -1,12 +1,55 @@
 from ortools.sat.python.cp_model import *
 from data import *
 from typing import Dict, List, Tuple
+from weakref import WeakKeyDictionary
 
 
 def create_model() -> CpModel:
     return CpModel()
 
 
+_false_literals = WeakKeyDictionary()
+
+
+def false_literal(model: CpModel) -> IntVar:
+    # One constant shared by every cell that can never be worked
+    if model not in _false_literals:
+        _false_literals[model] = model.NewConstant(0)
+    return _false_literals[model]
+
+
+def is_false_literal(model: CpModel, literal) -> bool:
+    return model in _false_literals and literal is _false_literals[model]
+
+
+def has_false_literal(model: CpModel) -> bool:
+    return model in _false_literals
+
+
+def register_false_literal(model: CpModel, literal: IntVar):
+    # For models loaded from a proto, where the constant already exists
+    _false_literals[model] = literal
+
+
+def create_eligibility(restrictions: List[Tuple]) -> Dict[Tuple, bool]:
+    # Each restriction is (staff, shifts they can't work) or (staff, days, shifts they can't work)
+    eligibility = {}
+    for restriction in restrictions:
+        if len(restriction) == 2:
+            staff, shifts = restriction
+            eligibility.update({(m, s): False for m in staff for s in shifts})
+        else:
+            staff, days, shifts = restriction
+            eligibility.update({(m, d, s): False for m in staff for d in days for s in shifts})
+    return eligibility
+
+
+def is_eligible(eligibility: Dict[Tuple, bool], m, d: int, s: int) -> bool:
+    if eligibility is None:
+        return True
+    return eligibility.get((m, d, s), eligibility.get((m, s), True))
+
+
 def create_model_variables(model: CpModel,
                            prefix: str,
                            staff: List[int],
@@ -16,14 +59,18 @@ def create_model_variables(model: CpModel,
             for m in staff
             for d in days}
 
- 
+
 def create_model_variables_long(model: CpModel,
                            prefix: str,
                            staff: List[int],
                            days: List[int],
-                           shifts: List[int]) -> Dict[Tuple, IntVar]:
+                           shifts: List[int],
+                           eligibility: Dict[Tuple, bool] = None) -> Dict[Tuple, IntVar]:
+    # Ineligible cells aren't given a variable, they all point at the same false constant
     return {(m, d, s):
             model.NewBoolVar(f"{prefix}_staff_{m}_day_{d}_shift_{s}")
+            if is_eligible(eligibility, m, d, s)
+            else false_literal(model)
             for m in staff
             for d in days
             for s in shifts}
@@ -35,9 +82,12 @@ def create_model_variables_int(model: CpModel,
                            lb: int,
                            staff: List[int],
                            days: List[int],
-                           shifts: List[int]) -> Dict[Tuple, IntVar]:
+                           shifts: List[int],
+                           eligibility: Dict[Tuple, bool] = None) -> Dict[Tuple, IntVar]:
     return {(m, d, s):
             model.NewIntVar(lb, ub, f"{prefix}_staff_{m}_day_{d}")
+            if is_eligible(eligibility, m, d, s)
+            else false_literal(model)
             for m in staff
             for d in days
             for s in shifts}
@@ -50,8 +100,10 @@ def constraints_equal_sum(model: CpModel,
                           shifts: List[int]) -> Dict[Tuple, IntVar]:
     for m in staff:
         for d in days:
+            if is_false_literal(model, constraints[m, d]):
+                continue
             model.Add(constraints[m, d] == sum(
-                sums[m, d, s] for s in shifts))
+                sums[m, d, s] for s in shifts if not is_false_literal(model, sums[m, d, s])))
 
 
 def create_model_variables_with_sum(model: CpModel,
@@ -60,8 +112,11 @@ def create_model_variables_with_sum(model: CpModel,
                                     staff: List[int],
                                     days: List[int],
                                     shifts: List[int]) -> Dict[Tuple, IntVar]:
+    # If none of the shifts can be worked the sum is always false
     constraints = {(m, d):
                    model.NewBoolVar(f"{prefix}_staff_{m}_day_{d}")
+                   if any(not is_false_literal(model, sums[m, d, s]) for s in shifts)
+                   else false_literal(model)
                    for m in staff
                    for d in days}
 
@@ -80,16 +135,16 @@ def create_staff_variables(model: CpModel,
                            staff: List[int],
                            days: List[int],
                            shifts: List[int]) -> Dict[Tuple, IntVar]:
-
-    constraints = create_model_variables_int(model, prefix, ub, lb, staff, days, shifts)
-
-    for m in staff:
+    # Each cell is value * works rather than its own variable, solver.Value still reads it
+    # prefix, lb and ub are kept so existing calls don't change
+    constraints = {}
+    for m, value in zip(staff, values):
         for d in days:
             for s in shifts:
-                model.Add(constraints[m, d, s] ==
-                          values[staff.index(m)]).OnlyEnforceIf(enforcements[m, d, s])
-                model.Add(constraints[m, d, s] == 0).OnlyEnforceIf(
-                    enforcements[m, d, s].Not())
+                if is_false_literal(model, enforcements[m, d, s]):
+                    constraints[m, d, s] = 0
+                else:
+                    constraints[m, d, s] = value * enforcements[m, d, s]
 
     return constraints
 
@@ -101,5 +156,18 @@ def create_solver(time_seconds: int) -> CpSolver:
     return solver
 
 
+def solver_response(solver):
+    # A CpSolver after Solve, or a solution callback while it runs
+    if isinstance(solver, CpSolverSolutionCallback):
+        return solver.response_proto
+    return solver.ResponseProto()
+
+
+def solution_values(solver) -> List[int]:
+    # Every variable's value by proto index, read off the response in one pass
+    # rather than a GetIntVarFromProtoIndex and Value call for each
+    return list(solver_response(solver).solution)
+
+
 def empty_minimize_constraints() -> Tuple[List, List]:
     return [], []
\ No newline at end of file
@@ -0,0 +1,214 @@
+from schedule import *
+from dataclasses import asdict
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+import ortools
+
+try:
+    from ortools.sat.python.cp_model_helper import FlatIntExpr
+except ImportError:
+    FlatIntExpr = None
+
+
+# Building the model is pure Python and repeats the same work every run, so finished
+# models are kept on disk keyed by everything that went into them
+#
+# January 2021 builds in 1.8 to 2.6s and loads in 1.1 to 1.3s from a 28 MB entry. Most of a load
+# is ortools parsing the proto, which it can only read back as text. The terms are kept as arrays
+# of proto indices and rebuilt straight from the proto
+# Worth it for models rebuilt many times over, not for a single solve
+#
+# An entry also keeps the model's literal cache, so families added to a loaded model reuse
+# the reified literals already in it instead of adding duplicates
+
+MODEL_CACHE_DIR = ".model_cache"
+MODEL_CACHE_MAX_BYTES = 1024 ** 3
+# Changes when the entries change, older entries are then never read
+MODEL_CACHE_FORMAT = 3
+
+# Editing any of these changes the model without changing the inputs
+BUILDER_SOURCES = ["data.py", "model.py", "utility_functions.py", "scheduling_funtions.py",
+                   "constraints.py", "instrumentation.py", "schedule.py"]
+
+
+def source_fingerprint():
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in BUILDER_SOURCES:
+        with open(os.path.join(directory, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def schedule_key(instance: Instance, parameters: Parameters = None, **options) -> str:
+    # options are the build_schedule keywords, e.g. encoding and families
+    configuration = {"instance": asdict(instance),
+                     "parameters": asdict(parameters or Parameters()),
+                     "options": options,
+                     "shift_list": shift_list,
+                     "ortools": ortools.__version__,
+                     "format": MODEL_CACHE_FORMAT,
+                     "sources": source_fingerprint()}
+    text = json.dumps(configuration, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def proto_to_bytes(model: CpModel) -> bytes:
+    proto = model.Proto()
+    # Older ortools hands back the protobuf message, newer versions a wrapper that only speaks text format
+    if hasattr(proto, "SerializeToString"):
+        return proto.SerializeToString()
+    return str(proto).encode()
+
+
+def model_from_bytes(data: bytes) -> CpModel:
+    model = CpModel()
+    proto = model.Proto()
+    if hasattr(proto, "ParseFromString"):
+        proto.ParseFromString(data)
+    else:
+        proto.parse_text_format(data.decode())
+    return model
+
+
+def encode_term(term):
+    # Constants, literals (negative indices are negated literals) and linear expressions
+    if isinstance(term, int):
+        return ("constant", term)
+    if hasattr(term, "Index"):
+        return ("literal", term.Index())
+    if hasattr(term, "GetIntegerVarValueMap"):
+        coeffs, offset = term.GetIntegerVarValueMap()
+        return ("expression", [(var.Index(), coeff) for var, coeff in coeffs.items()], offset)
+    flat = FlatIntExpr(term)
+    return ("expression", [(var.Index(), coeff) for var, coeff in zip(flat.vars, flat.coeffs)], flat.offset)
+
+
+class TermDecoder:
+    # Rebuilds the terms of a loaded model, one IntVar per index so identity checks like
+    # is_false_literal still hold. IntVar is made straight from the proto, GetIntVarFromProtoIndex
+    # checks the index first and is three times slower
+    def __init__(self, model: CpModel):
+        self.model = model
+        self.proto = model.Proto()
+        self.variables = {}
+
+    def variable(self, index: int) -> IntVar:
+        variable = self.variables.get(index)
+        if variable is None:
+            variable = self.variables[index] = IntVar(self.proto, index)
+        return variable
+
+    def literal(self, index: int):
+        return self.variable(index) if index >= 0 else self.variable(-index - 1).Not()
+
+    def term(self, term):
+        if term[0] == "constant":
+            return term[1]
+        if term[0] == "literal":
+            return self.literal(term[1])
+        indices, coeffs = zip(*term[1]) if term[1] else ((), ())
+        return LinearExpr.WeightedSum([self.variable(index) for index in indices], coeffs) + term[2]
+
+    def terms(self, encoded) -> List:
+        if isinstance(encoded, np.ndarray):
+            return [self.literal(index) for index in encoded.tolist()]
+        return [self.term(term) for term in encoded]
+
+
+def encode_terms(terms: List):
+    # Literals only (nearly every family) as an array of their indices, anything else term by term
+    encoded = [encode_term(term) for term in terms]
+    if all(term[0] == "literal" for term in encoded):
+        return np.array([term[1] for term in encoded], dtype=np.int64)
+    return encoded
+
+
+def save_literal_cache(cache: LiteralCache) -> Dict:
+    # The reified ANDs and ORs by the indices of their literals, so builders adding to a loaded
+    # model reuse them instead of creating them again. Negations don't add variables
+    expressions = list(cache.expressions.items())
+    return {"keys": [(kind, sorted(indices)) for (kind, indices), literal in expressions],
+            "literals": encode_terms([literal for key, literal in expressions]),
+            "stats": {"variables_saved": cache.variables_saved,
+                      "constraints_saved": cache.constraints_saved,
+                      "negations_reused": cache.negations_reused}}
+
+
+def load_literal_cache(cache: LiteralCache, decoder: TermDecoder, entry: Dict):
+    cache.expressions = {(kind, frozenset(indices)): literal
+                         for (kind, indices), literal in zip(entry["keys"], decoder.terms(entry["literals"]))}
+    for name, value in entry["stats"].items():
+        setattr(cache, name, value)
+
+
+def save_schedule_model(schedule: Schedule, path: str):
+    model = schedule.model
+    false = false_literal(model) if has_false_literal(model) else None
+    entry = {"proto": proto_to_bytes(model),
+             "variables": {name: (list(terms), encode_terms(list(terms.values())))
+                           for name, terms in schedule.variables.items()},
+             "objectives": {name: (encode_terms(terms), list(coeffs))
+                            for name, (terms, coeffs) in schedule.objectives.items()},
+             "family_names": schedule.family_names,
+             "false_literal": None if false is None else false.Index(),
+             "literal_cache": save_literal_cache(literal_cache(model))}
+    # Write then rename so a crash never leaves half an entry behind
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+
+def load_schedule_model(path: str, instance: Instance, parameters: Parameters = None,
+                        families: List[str] = None, exclude: List[str] = None) -> Schedule:
+    with open(path, "rb") as f:
+        entry = pickle.load(f)
+    model = model_from_bytes(entry["proto"])
+    decoder = TermDecoder(model)
+    # Builders added after loading still need to recognise cells that were never created
+    if entry["false_literal"] is not None:
+        register_false_literal(model, decoder.literal(entry["false_literal"]))
+    schedule = Schedule(model, instance, parameters or Parameters(), {}, families=families, exclude=exclude)
+    schedule.variables = {name: dict(zip(keys, decoder.terms(terms)))
+                          for name, (keys, terms) in entry["variables"].items()}
+    schedule.objectives = {name: (decoder.terms(terms), coeffs)
+                           for name, (terms, coeffs) in entry["objectives"].items()}
+    schedule.family_names = entry["family_names"]
+    load_literal_cache(literal_cache(model), decoder, entry["literal_cache"])
+    return schedule
+
+
+def evict_model_cache(cache_dir: str = MODEL_CACHE_DIR, max_bytes: int = MODEL_CACHE_MAX_BYTES):
+    # Least recently used first, a hit touches its entry
+    entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(".model")]
+    entries.sort(key=os.path.getmtime)
+    total = sum(os.path.getsize(path) for path in entries)
+    while entries and total > max_bytes:
+        path = entries.pop(0)
+        total -= os.path.getsize(path)
+        os.remove(path)
+
+
+def cached_build_schedule(instance: Instance,
+                          parameters: Parameters = None,
+                          cache_dir: str = MODEL_CACHE_DIR,
+                          max_bytes: int = MODEL_CACHE_MAX_BYTES,
+                          **options) -> Schedule:
+    # Same as build_schedule(instance, parameters, **options) but loads the model from disk when it can
+    if options.get("profile") or options.get("report"):
+        # Both are about the build itself, a loaded model has nothing to show
+        return build_schedule(instance, parameters, **options)
+    options = {name: value for name, value in options.items() if name not in ("profile", "report")}
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, schedule_key(instance, parameters, **options) + ".model")
+    if os.path.exists(path):
+        os.utime(path)
+        return load_schedule_model(path, instance, parameters, options.get("families"), options.get("exclude"))
+
+    schedule = build_schedule(instance, parameters, **options)
+    save_schedule_model(schedule, path)
+    evict_model_cache(cache_dir, max_bytes)
+    return schedule
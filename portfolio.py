@@ -0,0 +1,186 @@
+from model_cache import *
+import multiprocessing
+import tempfile
+import time
+
+
+# Runs one built model in several processes, each with its own seed and parameters
+# Every improving solution is written to a shared results directory
+#
+#   results/
+#     model                   the model every worker loads
+#     worker_<w>.log          one JSON line per improving solution, then a final line
+#     worker_<w>_<n>.solution the values of every variable for that solution
+#     STOP                    written once the target is reached, workers stop on their next solution
+
+# Parameters for each profile, enums are given by name
+PORTFOLIO_PROFILES = {
+    "default": {},
+    "no_lp": {"linearization_level": 0},
+    "full_lp": {"linearization_level": 2},
+    "fixed_search": {"search_branching": "FIXED_SEARCH"},
+    "pseudo_cost": {"search_branching": "PSEUDO_COST_SEARCH"},
+    "quick_restart": {"search_branching": "PORTFOLIO_WITH_QUICK_RESTART_SEARCH"},
+    "no_presolve": {"cp_model_presolve": False},
+    "core": {"optimize_with_core": True},
+}
+
+
+def set_parameter(parameters, name, value):
+    if isinstance(value, str):
+        current = getattr(parameters, name)
+        if hasattr(type(current), value):
+            value = getattr(type(current), value)
+        else:
+            # Protobuf parameters store enums as ints
+            value = parameters.DESCRIPTOR.fields_by_name[name].enum_type.values_by_name[value].number
+    setattr(parameters, name, value)
+
+
+class PortfolioCallback(CpSolverSolutionCallback):
+    def __init__(self, model: CpModel, results_dir: str, worker: int):
+        CpSolverSolutionCallback.__init__(self)
+        self.model = model
+        self.results_dir = results_dir
+        self.worker = worker
+        self.solutions = 0
+
+    def on_solution_callback(self):
+        values = solution_values(self)
+        path = os.path.join(self.results_dir, f"worker_{self.worker}_{self.solutions}.solution")
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(values, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        write_portfolio_log(self.results_dir, self.worker, {"objective": self.ObjectiveValue(),
+                                                            "best_bound": self.BestObjectiveBound(),
+                                                            "wall_time": self.WallTime(),
+                                                            "solution": path})
+        self.solutions += 1
+        if os.path.exists(os.path.join(self.results_dir, "STOP")):
+            self.StopSearch()
+
+
+def write_portfolio_log(results_dir: str, worker: int, record: Dict):
+    with open(os.path.join(results_dir, f"worker_{worker}.log"), "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def read_portfolio_logs(results_dir: str, workers: int) -> Dict[int, List[Dict]]:
+    logs = {}
+    for worker in range(workers):
+        path = os.path.join(results_dir, f"worker_{worker}.log")
+        if os.path.exists(path):
+            with open(path) as f:
+                # A line still being written is picked up on the next read
+                logs[worker] = [json.loads(line) for line in f if line.endswith("\n")]
+        else:
+            logs[worker] = []
+    return logs
+
+
+def portfolio_worker(results_dir: str, worker: int, profile: Dict, seed: int, threads: int, time_seconds: float):
+    with open(os.path.join(results_dir, "model"), "rb") as f:
+        model = model_from_bytes(f.read())
+    solver = create_solver(time_seconds)
+    solver.parameters.num_search_workers = threads
+    solver.parameters.random_seed = seed
+    for name, value in profile.items():
+        set_parameter(solver.parameters, name, value)
+    status = solver.Solve(model, PortfolioCallback(model, results_dir, worker))
+    solved = status == OPTIMAL or status == FEASIBLE
+    write_portfolio_log(results_dir, worker, {"status": solver.StatusName(status),
+                                              "objective": solver.ObjectiveValue() if solved else None,
+                                              "best_bound": solver.BestObjectiveBound() if solved else None,
+                                              "wall_time": solver.WallTime()})
+
+
+def portfolio_gap(objective, best_bound):
+    return abs(objective - best_bound) / max(1, abs(objective))
+
+
+def run_portfolio(schedule: Schedule,
+                  workers: int = 4,
+                  profiles: List[str] = None,
+                  time_seconds: float = 60,
+                  target_objective: float = None,
+                  target_gap: float = None,
+                  results_dir: str = None,
+                  threads: int = None,
+                  seed: int = 0,
+                  grace_seconds: float = 5) -> Dict:
+    # profiles are names from PORTFOLIO_PROFILES, used in turn by the workers
+    # threads is the number of search workers in each process, by default the cores are shared out
+    if not schedule.model.HasObjective():
+        minimize_schedule(schedule)
+    profiles = profiles or list(PORTFOLIO_PROFILES)
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    results_dir = results_dir or tempfile.mkdtemp(prefix="portfolio_")
+    os.makedirs(results_dir, exist_ok=True)
+    with open(os.path.join(results_dir, "model"), "wb") as f:
+        f.write(proto_to_bytes(schedule.model))
+
+    # Spawned rather than forked so no solver threads are copied into the workers
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for worker in range(workers):
+        profile = profiles[worker % len(profiles)]
+        process = context.Process(target=portfolio_worker,
+                                  args=(results_dir, worker, PORTFOLIO_PROFILES[profile], seed + worker,
+                                        threads, time_seconds))
+        process.start()
+        processes.append(process)
+
+    start = time.time()
+    stopped_at = None
+    while any(process.is_alive() for process in processes):
+        time.sleep(0.5)
+        solutions = [record for log in read_portfolio_logs(results_dir, workers).values()
+                     for record in log if "solution" in record]
+        if stopped_at is None and solutions:
+            objective = min(record["objective"] for record in solutions)
+            # Every worker's bound holds so the best of them does too
+            best_bound = max(record["best_bound"] for record in solutions)
+            if ((target_objective is not None and objective <= target_objective) or
+                    (target_gap is not None and portfolio_gap(objective, best_bound) <= target_gap)):
+                open(os.path.join(results_dir, "STOP"), "w").close()
+                stopped_at = time.time()
+        # Workers only look for STOP when they find a solution, or they might be stuck until their time limit
+        if stopped_at is not None and time.time() - stopped_at > grace_seconds or \
+                time.time() - start > time_seconds + grace_seconds:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+    for process in processes:
+        process.join()
+
+    logs = read_portfolio_logs(results_dir, workers)
+    rows = []
+    best = None
+    for worker, log in logs.items():
+        solutions = [record for record in log if "solution" in record]
+        final = [record for record in log if "status" in record]
+        rows.append({"worker": worker,
+                     "profile": profiles[worker % len(profiles)],
+                     "status": final[-1]["status"] if final else "STOPPED",
+                     "solutions": len(solutions),
+                     "objective": min([record["objective"] for record in solutions], default=None),
+                     "first_solution_time": round(solutions[0]["wall_time"], 2) if solutions else None})
+        for record in solutions:
+            if best is None or record["objective"] < best["objective"]:
+                best = dict(record, worker=worker)
+
+    values = None
+    if best is not None:
+        with open(best["solution"], "rb") as f:
+            values = pickle.load(f)
+    best_bound = max([record["best_bound"] for log in logs.values() for record in log
+                      if record.get("best_bound") is not None], default=None)
+    return {"objective": best["objective"] if best else None,
+            "best_bound": best_bound,
+            "worker": best["worker"] if best else None,
+            "values": values,
+            "assignment": None if values is None else
+            {key: 0 if is_false_literal(schedule.model, literal) else values[literal.Index()]
+             for key, literal in schedule.variables["staff_works_shift_on_day"].items()},
+            "workers": rows,
+            "results_dir": results_dir}
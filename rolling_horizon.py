@@ -0,0 +1,156 @@
+from lookback import *
+import time
+
+
+# Solves the horizon in short overlapping blocks instead of one long solve
+# Days before a block that have already been solved are added to the block as fixed history
+# so the sequence rules (including their Prior windows) see how the previous block ended
+#
+#     history      block_length
+#   |---------|-----------------|
+#             |   committed  |overlap|   <- the overlap is solved again as the start of the next block
+#
+# The first block's history comes from prior, the days before the horizon, when it's given
+
+# Their targets are shifts per month, inside a week they can't be met at all
+MONTHLY_FAMILIES = ["equalize_weekends", "equalize_night_shifts", "equalize_late_shifts",
+                    "equalize_day_shifts", "equalize_afternoon_shifts", "equalize_weekdays"]
+
+
+def block_instance(instance: Instance, first: int, end: int) -> Instance:
+    # Days first to end - 1 renumbered from 0, requests outside them are dropped
+    requests = [(m, d - first, s, w) for m, d, s, w in instance.requests if first <= d < end]
+    return Instance(staff=instance.staff,
+                    shifts=instance.shifts,
+                    days=list(range(end - first)),
+                    first_day=(instance.first_day + first) % 7,
+                    requests=requests,
+                    ft_staff=instance.ft_staff,
+                    midnight_staff=instance.midnight_staff,
+                    six_month_new_staff=instance.six_month_new_staff,
+                    productivities=instance.productivities,
+                    midnight_shifts=instance.midnight_shifts,
+                    late_shifts=instance.late_shifts,
+                    day_shifts=instance.day_shifts,
+                    afternoon_shifts=instance.afternoon_shifts,
+                    ft_shifts=instance.ft_shifts,
+                    on_call_shifts=instance.on_call_shifts,
+                    shift_names=instance.shift_names)
+
+
+def prior_from_array(array, staff: List) -> Dict[Tuple, int]:
+    # A staff x day x shift array of the days before the horizon, e.g. from read_history, as
+    # {(staff, day, shift): 0 or 1} numbered back from day -1 (read_prior_assignment for a text file)
+    num_days = array.shape[1]
+    return {(m, d - num_days, s): int(array[i, d, s])
+            for i, m in enumerate(staff) for d in range(num_days) for s in range(array.shape[2])}
+
+
+def rolling_horizon(instance: Instance,
+                    parameters: Parameters = None,
+                    block_length: int = 7,
+                    overlap: int = 3,
+                    history: int = None,
+                    time_seconds: float = 60,
+                    seed: int = 0,
+                    max_backtracks: int = 2,
+                    exclude: List[str] = MONTHLY_FAMILIES,
+                    prior: Dict[Tuple, int] = None,
+                    **options) -> Dict:
+    # options are passed on to build_schedule, e.g. transition_encoding
+    # history: days before a block added as fixed history, by default as many as the families read
+    # prior: {(staff, day, shift): 0 or 1} for the days before the horizon numbered back from -1,
+    # from read_prior_assignment or prior_from_array. Staff missing from it are off on those days
+    # Its days are fixed like solved ones, a history that breaks a hard rule makes the first block infeasible
+    # Returns the assignment {(staff, day, shift): 0 or 1} for every solved day and a row per block
+    if not 0 <= overlap < block_length:
+        raise ValueError("overlap must be smaller than block_length")
+    if history is None:
+        history = required_lookback(parameters, options.get("families"), exclude)
+    prior = prior or {}
+    # Only as much of it as the blocks read, and no further back than it goes
+    prior_days = min(-min((d for m, d, s in prior), default=0), history)
+
+    num_days = len(instance.days)
+    assignment = {}
+    # The overlap of the last block, used as a hint for the next one
+    previous = {}
+    # Where each committed block started, so a block can be undone
+    commits = []
+    blocks = []
+    status = "OPTIMAL"
+    # Backtracks since the furthest solved day last moved, and in total
+    backtracks = 0
+    total_backtracks = 0
+    solved_to = 0
+    start = 0
+    end = 0
+    while start < num_days:
+        end = max(min(start + block_length, num_days), end)
+        first = max(-prior_days, start - history)
+        build_start = time.time()
+        schedule = build_schedule(block_instance(instance, first, end), parameters, exclude=exclude, **options)
+        model = schedule.model
+        works = schedule.variables["staff_works_shift_on_day"]
+        for (m, d, s), literal in works.items():
+            if is_false_literal(model, literal):
+                continue
+            if first + d < 0:
+                model.Add(literal == prior.get((m, first + d, s), 0))
+            elif first + d < start:
+                model.Add(literal == assignment[m, first + d, s])
+            elif (m, first + d, s) in previous:
+                model.AddHint(literal, previous[m, first + d, s])
+        minimize_schedule(schedule)
+        build_time = time.time() - build_start
+
+        # A block merged after a backtrack gets time for each block it covers
+        solver = create_solver(time_seconds * (end - start) / block_length)
+        solver.parameters.random_seed = seed
+        block_status = solver.Solve(model)
+        blocks.append({"first_day": start,
+                       "last_day": end - 1,
+                       "history": start - first,
+                       "status": solver.StatusName(block_status),
+                       "objective": solver.ObjectiveValue()
+                       if block_status == OPTIMAL or block_status == FEASIBLE else None,
+                       "build_time": round(build_time, 2),
+                       "solve_time": round(solver.WallTime(), 2)})
+
+        if block_status == INFEASIBLE and commits and backtracks < max_backtracks:
+            # The rules are relaxed at the end of a block, so the last block can commit days
+            # that nothing can follow. Undo it and solve it again together with this block
+            backtracks += 1
+            total_backtracks += 1
+            start = commits.pop()
+            assignment = {key: value for key, value in assignment.items() if key[1] < start}
+            previous = {}
+            continue
+        if block_status != OPTIMAL and block_status != FEASIBLE:
+            # Later blocks need this one as history so there's nothing more to do
+            status = solver.StatusName(block_status)
+            break
+        if block_status == FEASIBLE:
+            status = "FEASIBLE"
+
+        commit_end = num_days if end == num_days else end - overlap
+        previous = {}
+        values = solution_values(solver)
+        for (m, d, s), literal in works.items():
+            day = first + d
+            if start <= day < commit_end:
+                assignment[m, day, s] = values[literal.Index()]
+            elif day >= commit_end:
+                previous[m, day, s] = values[literal.Index()]
+        # Only the last stride can be undone, so a merged block never grows past two blocks
+        commits.append(max(start, commit_end - (block_length - overlap)))
+        start = commit_end
+        if commit_end > solved_to:
+            solved_to = commit_end
+            backtracks = 0
+
+    return {"status": status,
+            "assignment": assignment,
+            "blocks": blocks,
+            "backtracks": total_backtracks,
+            "solve_time": round(sum(block["solve_time"] for block in blocks), 2)}
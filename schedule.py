@@ -0,0 +1,471 @@
+from constraints import *
+from instrumentation import *
+from dataclasses import dataclass, field
+from collections import defaultdict
+import random
+
+
+# The notebook builds the model one cell at a time. This builds the same model from
+# a function so it can be rebuilt with different encodings, parameters and instances
+
+
+@dataclass
+class Instance:
+    staff: List
+    shifts: List[int]
+    days: List[int]
+    first_day: int
+    requests: List[Tuple] = field(default_factory=list)
+    ft_staff: List = field(default_factory=list)
+    midnight_staff: List = field(default_factory=list)
+    six_month_new_staff: List = field(default_factory=list)
+    productivities: List[int] = field(default_factory=list)
+    midnight_shifts: List[int] = field(default_factory=list)
+    late_shifts: List[int] = field(default_factory=list)
+    day_shifts: List[int] = field(default_factory=list)
+    afternoon_shifts: List[int] = field(default_factory=list)
+    ft_shifts: List[int] = field(default_factory=list)
+    on_call_shifts: List[int] = field(default_factory=list)
+    # Start times of the shifts, the transitions are penalized by how far they move
+    shift_names: List[str] = field(default_factory=lambda: list(shift_list))
+
+    @property
+    def not_ft_staff(self):
+        return list_difference(self.staff, self.ft_staff)
+
+    @property
+    def not_midnight_staff(self):
+        return list_difference(self.staff, self.midnight_staff)
+
+    @property
+    def not_midnight_shifts(self):
+        return list_difference(self.shifts, self.midnight_shifts)
+
+    @property
+    def not_ft_shifts(self):
+        return list_difference(self.shifts, self.ft_shifts)
+
+    @property
+    def after_5_shifts(self):
+        return self.late_shifts + self.midnight_shifts
+
+    @property
+    def after_930_shifts(self):
+        return list_difference(self.shifts, self.day_shifts)
+
+    @property
+    def fris(self):
+        return fridays(self.days, self.first_day)
+
+    @property
+    def weekdays(self):
+        return (mondays(self.days, self.first_day) + tuesdays(self.days, self.first_day) +
+                wednesdays(self.days, self.first_day) + thursdays(self.days, self.first_day) + self.fris)
+
+    @property
+    def sats(self):
+        return saturdays(self.days, self.first_day)
+
+    @property
+    def suns(self):
+        return sundays(self.days, self.first_day)
+
+    @property
+    def weekends(self):
+        return self.sats + self.suns
+
+    @property
+    def eligibility(self):
+        # Shifts each group of staff is never allowed to work, their cells aren't created
+        return create_eligibility([(self.midnight_staff, self.not_midnight_shifts),
+                                   (self.six_month_new_staff, self.midnight_shifts),
+                                   (self.ft_staff, self.not_ft_shifts)])
+
+
+@dataclass
+class Parameters:
+    max_days_worked_hard_max: int = 7
+    max_days_worked_soft_max: int = 3
+    max_days_worked_max_cost: int = MAX
+
+    min_days_off_after_midnight_hard_min: int = 2
+    min_days_off_after_midnight_soft_min: int = 4
+    min_days_off_after_midnight_min_cost: int = HIGH
+
+    max_midnights_in_a_row_hard_max: int = 2
+    max_midnights_in_a_row_soft_max: int = 1
+    max_midnights_in_a_row_max_cost: int = MAX
+
+    no_late_shift_before_time_off_hard_min: int = 1
+    no_late_shift_before_time_off_soft_min: int = 0
+    no_late_shift_before_time_off_min_cost: int = NONE
+
+    on_call_rules_before_hard_min: int = 1
+    on_call_rules_before_soft_min: int = 0
+    on_call_rules_before_min_cost: int = NONE
+
+    on_call_rules_after_hard_min: int = 1
+    on_call_rules_after_soft_min: int = 0
+    on_call_rules_after_min_cost: int = NONE
+
+    days_off_after_consecutive_shifts_hard_min: int = 2
+    days_off_after_consecutive_shifts_soft_min: int = 3
+    days_off_after_consecutive_shifts_min_cost: int = HIGH
+
+    days_off_between_late_and_day_shifts_hard_min: int = 2
+    days_off_between_late_and_day_shifts_soft_min: int = 3
+    days_off_between_late_and_day_shifts_min_cost: int = HIGH
+
+    days_off_between_late_and_afternoon_shifts_hard_min: int = 2
+    days_off_between_late_and_afternoon_shifts_soft_min: int = 3
+    days_off_between_late_and_afternoon_shifts_min_cost: int = HIGH
+
+    late_shifts_in_a_row_hard_max: int = 7
+    late_shifts_in_a_row_soft_max: int = 3
+    late_shifts_in_a_row_max_cost: int = MAX
+
+    late_shifts_in_weeks_hard_min: int = 0
+    late_shifts_in_weeks_soft_min: int = 0
+    late_shifts_in_weeks_min_cost: int = NONE
+    late_shifts_in_weeks_hard_max: int = 14
+    late_shifts_in_weeks_soft_max: int = 5
+    late_shifts_in_weeks_max_cost: int = MAX
+
+    avoid_consecutive_ft_shifts_hard_max: int = 2
+    avoid_consecutive_ft_shifts_soft_max: int = 1
+    avoid_consecutive_ft_shifts_max_cost: int = MID
+
+    no_nightshifts_before_weekend_off_hard_min: int = 0
+    no_nightshifts_before_weekend_off_soft_min: int = 1
+    no_nightshifts_before_weekend_off_min_cost: int = HIGH
+
+    minimize_split_weekends_cost: int = MAX
+
+    equalize_weekends_cost: int = 4
+    equalize_night_shifts_cost: int = 4
+    equalize_late_shifts_cost: int = 4
+    equalize_day_shifts_cost: int = 2
+    equalize_afternoon_shifts_cost: int = 2
+    equalize_weekdays_cost: int = 1
+
+    productivity_span: int = 3
+
+
+@dataclass
+class SequenceFamily:
+    # The view a sequence rule counts runs of (a max rule is built on its negation), the Instance
+    # attribute with the staff it applies to, and the rule. Prior and Post hold views too
+    shifts: object
+    staff: str
+    minimum: bool
+    hard: int
+    soft: int
+    cost: int
+    prior: Prior = None
+    post: Post = None
+
+
+def sequence_rules(parameters: Parameters = None, variables: Dict = None) -> Dict[str, SequenceFamily]:
+    # The sequence rule families build_schedule adds, read by evaluation, validation and lookback too
+    # variables: the views by name, the model's literals by (staff, day) or staff x day arrays
+    # Without them the views are None and only the rules are of use
+    p = parameters or Parameters()
+    v = defaultdict(lambda: None, variables or {})
+    return {
+        "max_days_worked": SequenceFamily(
+            v["staff_works_day"], "staff", False,
+            p.max_days_worked_hard_max, p.max_days_worked_soft_max, p.max_days_worked_max_cost),
+        "min_days_off_after_midnight": SequenceFamily(
+            v["staff_doesnt_work_day"], "staff", True,
+            p.min_days_off_after_midnight_hard_min, p.min_days_off_after_midnight_soft_min,
+            p.min_days_off_after_midnight_min_cost, Prior(v["staff_works_midnight_shift"], [1], True)),
+        "max_midnights_in_a_row": SequenceFamily(
+            v["staff_works_midnight_shift"], "not_midnight_staff", False,
+            p.max_midnights_in_a_row_hard_max, p.max_midnights_in_a_row_soft_max, p.max_midnights_in_a_row_max_cost),
+        "on_call_rules_before": SequenceFamily(
+            v["staff_doesnt_work_after_930_shift"], "staff", True,
+            p.on_call_rules_before_hard_min, p.on_call_rules_before_soft_min, p.on_call_rules_before_min_cost,
+            post=Post(v["staff_works_on_call_shift"], [1])),
+        "on_call_rules_after": SequenceFamily(
+            v["staff_doesnt_work_day_shift"], "staff", True,
+            p.on_call_rules_after_hard_min, p.on_call_rules_after_soft_min, p.on_call_rules_after_min_cost,
+            Prior(v["staff_works_on_call_shift"], [1])),
+        # The notebook passes staff_works_day for both arguments
+        "days_off_after_consecutive_shifts": SequenceFamily(
+            v["staff_works_day"], "staff", True,
+            p.days_off_after_consecutive_shifts_hard_min, p.days_off_after_consecutive_shifts_soft_min,
+            p.days_off_after_consecutive_shifts_min_cost, Prior(v["staff_works_day"], [1, 1, 1], True)),
+        "days_off_between_late_and_day_shifts": SequenceFamily(
+            v["staff_doesnt_work_day"], "staff", True,
+            p.days_off_between_late_and_day_shifts_hard_min, p.days_off_between_late_and_day_shifts_soft_min,
+            p.days_off_between_late_and_day_shifts_min_cost,
+            Prior(v["staff_works_late_shift"], [1]), Post(v["staff_works_day_shift"], [1])),
+        "days_off_between_late_and_afternoon_shifts": SequenceFamily(
+            v["staff_doesnt_work_day"], "staff", True,
+            p.days_off_between_late_and_afternoon_shifts_hard_min,
+            p.days_off_between_late_and_afternoon_shifts_soft_min,
+            p.days_off_between_late_and_afternoon_shifts_min_cost,
+            Prior(v["staff_works_late_shift"], [1]), Post(v["staff_works_afternoon_shift"], [1])),
+        "late_shifts_in_a_row": SequenceFamily(
+            v["staff_works_late_shift"], "staff", False,
+            p.late_shifts_in_a_row_hard_max, p.late_shifts_in_a_row_soft_max, p.late_shifts_in_a_row_max_cost),
+        "avoid_consecutive_ft_shifts": SequenceFamily(
+            v["staff_works_ft_shift"], "not_midnight_staff", False,
+            p.avoid_consecutive_ft_shifts_hard_max, p.avoid_consecutive_ft_shifts_soft_max,
+            p.avoid_consecutive_ft_shifts_max_cost),
+    }
+
+
+@dataclass
+class Schedule:
+    model: CpModel
+    instance: Instance
+    parameters: Parameters
+    variables: Dict[str, Dict]
+    # The objective terms returned by each constraint family
+    objectives: Dict[str, Tuple[List, List]] = field(default_factory=dict)
+    # If set only these constraint families are added
+    families: List[str] = None
+    # Constraint families that are left out
+    exclude: List[str] = None
+    # If set every family is profiled as it is built
+    profiles: List[FamilyProfile] = None
+    # Every family build_schedule offered, in order, including those left out
+    family_names: List[str] = field(default_factory=list)
+
+    def add_family(self, name, builder, *args, **kwargs):
+        self.family_names.append(name)
+        if self.families is not None and name not in self.families:
+            return
+        if self.exclude is not None and name in self.exclude:
+            return
+        result = self.measure(name, builder, *args, **kwargs)
+        if result is not None:
+            self.objectives[name] = result
+
+    def measure(self, name, builder, *args, **kwargs):
+        if self.profiles is None:
+            return builder(*args, **kwargs)
+        return profile_builder(self.profiles, self.model, name, builder, *args, **kwargs)
+
+    def objective_terms(self):
+        variables, coeffs = empty_minimize_constraints()
+        for family_variables, family_coeffs in self.objectives.values():
+            variables.extend(family_variables)
+            coeffs.extend(family_coeffs)
+        return variables, coeffs
+
+
+def random_requests(staff, days, shifts, seed=None):
+    # staff, day, shift, weight
+    # if shift is -1 make it all shifts
+    rng = random.Random(seed)
+    requests = []
+    for m in staff:
+        for i in range(rng.randint(1, 6)):
+            d = rng.choice([rng.choice(days)])
+            s = rng.choice([rng.choice(shifts)] * 10 + [-1])
+            w = rng.choice([LOW, MID, HIGH, MAX])
+            requests.append((m, d, s, w))
+    return requests
+
+
+def create_instance(first_month: int = 1,
+                    last_month: int = 1,
+                    year: int = 2021,
+                    requests: List[Tuple] = None,
+                    seed: int = None) -> Instance:
+    # The instance described by data.py, with random requests if none are given
+    staff = staff_list
+    shifts = create_data(shift_list)
+    days, first_day = create_date_range(first_month, last_month, year)
+    if requests is None:
+        requests = random_requests(staff, days, shifts, seed)
+    return Instance(staff=staff,
+                    shifts=shifts,
+                    days=days,
+                    first_day=first_day,
+                    requests=requests,
+                    ft_staff=filter_data(staff, ft_only_staff_mask),
+                    midnight_staff=filter_data(staff, midnight_staff_mask),
+                    six_month_new_staff=filter_data(
+                        staff, staff_in_first_6_months_mask),
+                    productivities=staff_productivity_mask,
+                    midnight_shifts=filter_data(shifts, midnight_shifts_mask),
+                    late_shifts=filter_data(shifts, late_shifts_mask),
+                    day_shifts=filter_data(shifts, day_shifts_mask),
+                    afternoon_shifts=filter_data(
+                        shifts, afternoon_shifts_mask),
+                    ft_shifts=filter_data(shifts, ft_shifts_mask),
+                    on_call_shifts=filter_data(shifts, on_call_shifts_mask))
+
+
+def create_schedule_variables(model: CpModel, instance: Instance) -> Dict[str, Dict]:
+    staff, days, shifts = instance.staff, instance.days, instance.shifts
+    variables = {}
+    works = create_model_variables_long(
+        model, "staff_works_shift_on_day", staff, days, shifts, instance.eligibility)
+    variables["staff_works_shift_on_day"] = works
+
+    views = {
+        "staff_works_day": shifts,
+        "staff_works_afternoon_shift": instance.afternoon_shifts,
+        "staff_works_midnight_shift": instance.midnight_shifts,
+        "staff_works_on_call_shift": instance.on_call_shifts,
+        "staff_works_ft_shift": instance.ft_shifts,
+        "staff_works_late_shift": instance.late_shifts,
+        "staff_works_after_5_shift": instance.after_5_shifts,
+        "staff_works_after_930_shift": instance.after_930_shifts,
+        "staff_works_day_shift": instance.day_shifts,
+    }
+    for name, view_shifts in views.items():
+        variables[name] = create_model_variables_with_sum(
+            model, name, works, staff, days, view_shifts)
+
+    for name in ["staff_works_day", "staff_works_afternoon_shift", "staff_works_late_shift",
+                 "staff_works_after_5_shift", "staff_works_after_930_shift", "staff_works_day_shift"]:
+        variables[name.replace("works", "doesnt_work")] = not_dict(
+            variables[name], literal_cache(model))
+
+    variables["staff_productivities"] = create_staff_variables(
+        model, "staff_productivity", instance.productivities, 0, 6, works, staff, days, shifts)
+    return variables
+
+
+def sequence_family(model: CpModel, name: str, family: SequenceFamily, instance: Instance,
+                    encoding: str = WINDOW_ENCODING):
+    # One of the sequence_rules families over the model's literals, a sequence per staff
+    cache = literal_cache(model)
+    days = instance.days
+    add_sequence = add_soft_sequence_min if family.minimum else add_soft_sequence_max
+    obj_bool_vars = []
+    obj_bool_coeffs = []
+    for m in getattr(instance, family.staff):
+        shifts = [family.shifts[m, d] for d in days]
+        prior = None if family.prior is None else Prior([family.prior.shifts[m, d] for d in days],
+                                                        family.prior.choices, family.prior.continue_shifts)
+        post = None if family.post is None else Post([family.post.shifts[m, d] for d in days], family.post.choices)
+        variables, coeffs = add_sequence(model, f"{name}_{m}",
+                                         shifts if family.minimum else not_list(shifts, cache),
+                                         family.hard, family.soft, family.cost, prior, post, encoding)
+        obj_bool_vars.extend(variables)
+        obj_bool_coeffs.extend(coeffs)
+    return obj_bool_vars, obj_bool_coeffs
+
+
+def build_schedule(instance: Instance,
+                   parameters: Parameters = None,
+                   encoding: str = WINDOW_ENCODING,
+                   transition_encoding: str = PAIR_TRANSITIONS,
+                   distribution_encoding: str = PRODUCT_DISTRIBUTION,
+                   families: List[str] = None,
+                   exclude: List[str] = None,
+                   report: bool = False,
+                   profile: bool = False) -> Schedule:
+    parameters = parameters or Parameters()
+    model = create_model()
+    schedule = Schedule(model, instance, parameters, {}, families=families, exclude=exclude,
+                        profiles=[] if profile else None)
+    schedule.variables = schedule.measure("create_schedule_variables", create_schedule_variables,
+                                          model, instance)
+    v, i, p = schedule.variables, instance, parameters
+    staff, days, shifts = i.staff, i.days, i.shifts
+    rules = sequence_rules(p, v)
+
+    schedule.add_family("all_shifts_taken", all_shifts_taken,
+                        model, v["staff_works_shift_on_day"], staff, days, shifts)
+    schedule.add_family("max_days_worked", sequence_family,
+                        model, "max_days_worked", rules["max_days_worked"], i, encoding=encoding)
+    schedule.add_family("min_days_off_after_midnight", sequence_family,
+                        model, "min_days_off_after_midnight", rules["min_days_off_after_midnight"],
+                        i, encoding=encoding)
+    schedule.add_family("midnight_physicians", midnight_physicians,
+                        model, v["staff_works_shift_on_day"], i.midnight_staff, days, i.not_midnight_shifts)
+    schedule.add_family("no_midnights_within_six_months", no_midnights_within_six_months,
+                        model, v["staff_works_shift_on_day"], i.six_month_new_staff, days, i.midnight_shifts)
+    schedule.add_family("max_midnights_in_a_row", sequence_family,
+                        model, "max_midnights_in_a_row", rules["max_midnights_in_a_row"], i, encoding=encoding)
+    schedule.add_family("ft_physicians", ft_physicians,
+                        model, v["staff_works_shift_on_day"], i.ft_staff, days, i.not_ft_shifts)
+    schedule.add_family("no_late_shift_before_time_off", no_late_shift_before_time_off,
+                        model, v["staff_works_day"], v["staff_doesnt_work_after_5_shift"], staff, i.requests,
+                        p.no_late_shift_before_time_off_hard_min, p.no_late_shift_before_time_off_soft_min,
+                        p.no_late_shift_before_time_off_min_cost, encoding=encoding)
+    schedule.add_family("on_call_rules_before", sequence_family,
+                        model, "on_call_rules_before", rules["on_call_rules_before"], i, encoding=encoding)
+    schedule.add_family("on_call_rules_after", sequence_family,
+                        model, "on_call_rules_after", rules["on_call_rules_after"], i, encoding=encoding)
+    schedule.add_family("days_off_after_consecutive_shifts", sequence_family,
+                        model, "days_off_after_consecutive_shifts", rules["days_off_after_consecutive_shifts"],
+                        i, encoding=encoding)
+    schedule.add_family("transitions_constraints", transitions_constraints,
+                        model, v["staff_works_shift_on_day"], staff, days, encoding=transition_encoding,
+                        shift_names=instance.shift_names)
+    schedule.add_family("days_off_between_late_and_day_shifts", sequence_family,
+                        model, "days_off_between_late_and_day_shifts", rules["days_off_between_late_and_day_shifts"],
+                        i, encoding=encoding)
+    schedule.add_family("days_off_between_late_and_afternoon_shifts", sequence_family,
+                        model, "days_off_between_late_and_afternoon_shifts",
+                        rules["days_off_between_late_and_afternoon_shifts"], i, encoding=encoding)
+    schedule.add_family("late_shifts_in_a_row", sequence_family,
+                        model, "late_shifts_in_a_row", rules["late_shifts_in_a_row"], i, encoding=encoding)
+    schedule.add_family("late_shifts_in_weeks", late_shifts_in_weeks,
+                        model, v["staff_works_late_shift"], staff, days,
+                        p.late_shifts_in_weeks_hard_min, p.late_shifts_in_weeks_soft_min,
+                        p.late_shifts_in_weeks_min_cost, p.late_shifts_in_weeks_hard_max,
+                        p.late_shifts_in_weeks_soft_max, p.late_shifts_in_weeks_max_cost)
+    schedule.add_family("avoid_consecutive_ft_shifts", sequence_family,
+                        model, "avoid_consecutive_ft_shifts", rules["avoid_consecutive_ft_shifts"],
+                        i, encoding=encoding)
+    schedule.add_family("equalize_weekends", equalize_weekends,
+                        model, v["staff_works_day"], staff, i.weekends, p.equalize_weekends_cost,
+                        triangle_costs(len(shifts), len(i.weekends), len(staff)),
+                        encoding=distribution_encoding)
+    schedule.add_family("minimize_split_weekends", minimize_split_weekends,
+                        model, v["staff_works_day"], staff, i.sats, i.suns, p.minimize_split_weekends_cost)
+    schedule.add_family("equalize_night_shifts", equalize_night_shifts,
+                        model, v["staff_works_midnight_shift"], staff, days, p.equalize_night_shifts_cost,
+                        triangle_costs(len(i.midnight_shifts), len(days), len(staff)),
+                        encoding=distribution_encoding)
+    schedule.add_family("no_nightshifts_before_weekend_off", no_nightshifts_before_weekend_off,
+                        model, v["staff_works_day"], v["staff_doesnt_work_after_5_shift"], staff, i.fris, i.sats,
+                        p.no_nightshifts_before_weekend_off_hard_min, p.no_nightshifts_before_weekend_off_soft_min,
+                        p.no_nightshifts_before_weekend_off_min_cost, encoding=encoding)
+    schedule.add_family("equalize_late_shifts", equalize_late_shifts,
+                        model, v["staff_works_late_shift"], staff, days, p.equalize_late_shifts_cost,
+                        triangle_costs(len(i.late_shifts), len(days), len(staff)),
+                        encoding=distribution_encoding)
+    schedule.add_family("equalize_day_shifts", equalize_day_shifts,
+                        model, v["staff_works_day_shift"], staff, days, p.equalize_day_shifts_cost,
+                        triangle_costs(len(i.day_shifts), len(days), len(staff)),
+                        encoding=distribution_encoding)
+    schedule.add_family("equalize_afternoon_shifts", equalize_afternoon_shifts,
+                        model, v["staff_works_afternoon_shift"], staff, days, p.equalize_afternoon_shifts_cost,
+                        triangle_costs(len(i.afternoon_shifts), len(days), len(staff)),
+                        encoding=distribution_encoding)
+    schedule.add_family("equalize_weekdays", equalize_weekdays,
+                        model, v["staff_works_day"], staff, i.weekdays, p.equalize_weekdays_cost,
+                        triangle_costs(len(shifts), len(i.weekdays), len(staff)),
+                        encoding=distribution_encoding)
+    schedule.add_family("apply_requests", apply_requests,
+                        v["staff_works_shift_on_day"], v["staff_works_day"], days, i.requests)
+    schedule.add_family("apply_productivity", apply_productivity,
+                        model, v["staff_productivities"], staff, days, shifts, p.productivity_span)
+    if report:
+        print_literal_cache_report(schedule)
+        if profile:
+            print_profile(schedule.profiles)
+    return schedule
+
+
+def print_literal_cache_report(schedule: Schedule):
+    stats = literal_cache(schedule.model).stats()
+    print(f"Literal cache: {stats['cached_expressions']} shared expressions saved "
+          f"{stats['variables_saved']} variables and {stats['constraints_saved']} constraints, "
+          f"{stats['negations_reused']} negations reused")
+
+
+def minimize_schedule(schedule: Schedule):
+    variables, coeffs = schedule.objective_terms()
+    schedule.model.Minimize(
+        sum(variables[i] * coeffs[i] for i in range(len(variables))))
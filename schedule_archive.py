@@ -0,0 +1,117 @@
+from solution_arrays import *
+import datetime
+import json
+import os
+import struct
+
+
+# Schedules kept as history, any range of days can be read without reading the rest of the file
+#
+#   "SCHD" | version (uint16) | header length (uint32) | header | days
+#
+# The header is JSON: the staff, the shift names and the date of the first day (origin), padded
+# with spaces so the days start on an 8 byte boundary
+# Each day is the staff x shift matrix bit-packed with numpy.packbits and padded to whole bytes,
+# so the file past the header is a (days, record size) uint8 array that numpy.memmap can open
+# and a date range is one slice of it. The number of days isn't stored, more days can be appended
+
+ARCHIVE_MAGIC = b"SCHD"
+ARCHIVE_VERSION = 1
+
+
+def archive_header(staff: List, shift_names: List[str], origin: datetime.date) -> bytes:
+    header = json.dumps({"staff": list(staff), "shifts": list(shift_names), "origin": origin.isoformat()}).encode()
+    length = len(header) + (-(len(ARCHIVE_MAGIC) + 6 + len(header)) % 8)
+    return ARCHIVE_MAGIC + struct.pack("<HI", ARCHIVE_VERSION, length) + header.ljust(length)
+
+
+def read_archive_header(path: str) -> Tuple[Dict, int]:
+    # Returns the header and where the days start
+    with open(path, "rb") as f:
+        if f.read(4) != ARCHIVE_MAGIC:
+            raise ValueError(f"{path} is not a schedule archive")
+        version, length = struct.unpack("<HI", f.read(6))
+        if version > ARCHIVE_VERSION:
+            raise ValueError(f"{path} is version {version}, only up to {ARCHIVE_VERSION} can be read")
+        header = json.loads(f.read(length))
+    header["origin"] = datetime.date.fromisoformat(header["origin"])
+    return header, len(ARCHIVE_MAGIC) + 6 + length
+
+
+def record_size(header: Dict) -> int:
+    return record_bytes(len(header["staff"]) * len(header["shifts"]))
+
+
+def pack_days(array: np.ndarray) -> bytes:
+    # staff x day x shift to one packed record per day
+    return pack_records(array.transpose(1, 0, 2).reshape(array.shape[1], -1))
+
+
+def write_archive(path: str, array: np.ndarray, staff: List, shift_names: List[str], origin: datetime.date):
+    with open(path, "wb") as f:
+        f.write(archive_header(staff, shift_names, origin))
+        f.write(pack_days(array))
+
+
+def append_archive(path: str, array: np.ndarray, staff: List, shift_names: List[str]):
+    # The days after the last one in the archive, for the same staff and shifts
+    # A department whose staff or shifts change starts a new archive
+    header, offset = read_archive_header(path)
+    if header["staff"] != list(staff) or header["shifts"] != list(shift_names):
+        raise ValueError("The archive has different staff or shifts")
+    with open(path, "ab") as f:
+        f.write(pack_days(array))
+
+
+def archive_days(path: str) -> Tuple[Dict, np.memmap]:
+    # The header and the days as a read-only (days, record size) memmap, nothing is read yet
+    header, offset = read_archive_header(path)
+    size = record_size(header)
+    num_days = (os.path.getsize(path) - offset) // size
+    header["num_days"] = num_days
+    if num_days == 0:
+        return header, np.zeros((0, size), dtype=np.uint8)
+    return header, np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(num_days, size))
+
+
+def read_archive(path: str, start: datetime.date = None, end: datetime.date = None) -> Tuple[np.ndarray, Dict]:
+    # The staff x day x shift array from start up to but not including end, clipped to the days
+    # in the archive. Only those days are read from the file
+    # The header's "first_date" is the date of the array's first day
+    header, days = archive_days(path)
+    first = 0 if start is None else max((start - header["origin"]).days, 0)
+    last = header["num_days"] if end is None else min(max((end - header["origin"]).days, first),
+                                                      header["num_days"])
+    num_staff, num_shifts = len(header["staff"]), len(header["shifts"])
+    bits = unpack_records(days[first:last], num_staff * num_shifts)
+    header["first_date"] = header["origin"] + datetime.timedelta(days=first)
+    return bits.reshape(-1, num_staff, num_shifts).transpose(1, 0, 2).copy(), header
+
+
+def read_history(path: str, before: datetime.date, lookback: int) -> Tuple[np.ndarray, Dict]:
+    # The lookback days before a new schedule starts, as much history as its families read
+    # (lookback.required_lookback). Fewer if the archive starts later or ends earlier
+    return read_archive(path, before - datetime.timedelta(days=lookback), before)
+
+
+def parse_shifts_text(text: str) -> Tuple[List, np.ndarray]:
+    # The save_shifts_to_file format as the staff and a staff x day x shift array
+    staff, num_days, sequences = parse_shifts(text)
+    num_shifts = len(sequences[0][0]) if staff and num_days else 0
+    bits = np.frombuffer(''.join(itertools.chain.from_iterable(sequences)).encode(), dtype=np.uint8) - ord('0')
+    return staff, bits.reshape(len(staff), num_days, num_shifts)
+
+
+def text_to_archive(text_path: str, path: str, origin: datetime.date, shift_names: List[str] = shift_list):
+    # The text format has neither dates nor shift names, so they're given
+    with open(text_path) as f:
+        staff, array = parse_shifts_text(f.read())
+    if array.shape[2] != len(shift_names):
+        raise ValueError(f"{text_path} has {array.shape[2]} shifts, not {len(shift_names)}")
+    write_archive(path, array, staff, shift_names, origin)
+
+
+def archive_to_text(path: str, text_path: str, start: datetime.date = None, end: datetime.date = None):
+    array, header = read_archive(path, start, end)
+    with open(text_path, "w") as f:
+        f.write(format_array(array, header["staff"]))
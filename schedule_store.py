@@ -0,0 +1,164 @@
+from schedule_archive import *
+import sqlite3
+
+
+# Schedules of every month in one SQLite file, queried by staff and date
+#
+#   shifts       shift index -> name, the same for the whole store
+#   staff        names in the order they were first stored, the staff axis of the arrays read
+#   assignments  (staff, day, shift) for each shift worked, day is date.toordinal()
+#
+# Only worked shifts are stored, about one row per staff per day instead of one per cell
+# The primary key is the (staff, day) index, assignments_by_day the (day, shift) one
+# A schedule stored over days already in the store replaces them for its staff
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shifts (shift INTEGER PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS staff (name TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS assignments (
+    staff TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    shift INTEGER NOT NULL,
+    PRIMARY KEY (staff, day, shift)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS assignments_by_day ON assignments (day, shift);
+"""
+
+# The equalize families and the days or shifts each one counts
+FAIRNESS_COUNTERS = ["equalize_weekends", "equalize_night_shifts", "equalize_late_shifts",
+                     "equalize_day_shifts", "equalize_afternoon_shifts", "equalize_weekdays"]
+
+
+def open_store(path: str, shift_names: List[str] = shift_list) -> sqlite3.Connection:
+    # Creates the store if it doesn't exist, an existing one has to have the same shifts
+    connection = sqlite3.connect(path)
+    connection.executescript(STORE_SCHEMA)
+    stored = [name for name, in connection.execute("SELECT name FROM shifts ORDER BY shift")]
+    if not stored:
+        with connection:
+            connection.executemany("INSERT INTO shifts VALUES (?, ?)", enumerate(shift_names))
+    elif stored != list(shift_names):
+        connection.close()
+        raise ValueError(f"{path} has different shifts")
+    return connection
+
+
+def store_staff(connection: sqlite3.Connection) -> List[str]:
+    return [name for name, in connection.execute("SELECT name FROM staff ORDER BY rowid")]
+
+
+def store_shift_names(connection: sqlite3.Connection) -> List[str]:
+    return [name for name, in connection.execute("SELECT name FROM shifts ORDER BY shift")]
+
+
+def store_array(connection: sqlite3.Connection, array: np.ndarray, staff: List, first_date: datetime.date):
+    # A staff x day x shift array whose first day is first_date, in one transaction
+    if array.shape[2] != len(store_shift_names(connection)):
+        raise ValueError(f"The array has {array.shape[2]} shifts, the store {len(store_shift_names(connection))}")
+    first = first_date.toordinal()
+    staff = [str(m) for m in staff]
+    m, d, s = np.nonzero(array)
+    rows = zip([staff[i] for i in m.tolist()], (d + first).tolist(), s.tolist())
+    with connection:
+        connection.executemany("INSERT OR IGNORE INTO staff VALUES (?)", ((m,) for m in staff))
+        connection.executemany("DELETE FROM assignments WHERE staff = ? AND day >= ? AND day < ?",
+                               ((m, first, first + array.shape[1]) for m in staff))
+        connection.executemany("INSERT INTO assignments VALUES (?, ?, ?)", rows)
+
+
+def assignment_array(assignment: Dict[Tuple, int], staff: List, num_shifts: int) -> np.ndarray:
+    # The staff x day x shift array of an assignment (array_assignment the other way), days up to
+    # the last one in it
+    num_days = max((d for m, d, s in assignment), default=-1) + 1
+    position = {m: i for i, m in enumerate(staff)}
+    array = np.zeros((len(staff), num_days, num_shifts), dtype=np.uint8)
+    for (m, d, s), value in assignment.items():
+        if value and m in position:
+            array[position[m], d, s] = 1
+    return array
+
+
+def store_assignment(connection: sqlite3.Connection, assignment: Dict[Tuple, int], first_date: datetime.date,
+                     staff: List = None):
+    # {(staff, day, shift): 0 or 1} from read_assignment_from_file, read_assignment_from_csv or a
+    # solve, day 0 is first_date. Staff default to those in the assignment
+    staff = staff or list(dict.fromkeys(m for m, d, s in assignment))
+    array = assignment_array(assignment, staff, len(store_shift_names(connection)))
+    store_array(connection, array, staff, first_date)
+
+
+def store_solution(connection: sqlite3.Connection, solver, schedule: Schedule, first_date: datetime.date):
+    # The solver's schedule, read in one pass with schedule_solution_array
+    store_array(connection, schedule_solution_array(solver, schedule), schedule.instance.staff, first_date)
+
+
+def archive_to_store(path: str, connection: sqlite3.Connection):
+    array, header = read_archive(path)
+    if header["shifts"] != store_shift_names(connection):
+        raise ValueError(f"{path} has different shifts")
+    store_array(connection, array, header["staff"], header["origin"])
+
+
+def read_store(connection: sqlite3.Connection, start: datetime.date, end: datetime.date,
+               staff: List = None) -> np.ndarray:
+    # The staff x day x shift array from start up to but not including end, staff default to every
+    # staff in the store. Days nobody was stored for are all zeros
+    staff = store_staff(connection) if staff is None else [str(m) for m in staff]
+    first, last = start.toordinal(), end.toordinal()
+    array = np.zeros((len(staff), max(last - first, 0), len(store_shift_names(connection))), dtype=np.uint8)
+    if not staff or last <= first:
+        return array
+    position = {m: i for i, m in enumerate(staff)}
+    rows = connection.execute("SELECT staff, day, shift FROM assignments WHERE day >= ? AND day < ?",
+                              (first, last)).fetchall()
+    rows = [(position[m], d - first, s) for m, d, s in rows if m in position]
+    if rows:
+        m, d, s = np.array(rows, dtype=np.int64).T
+        array[m, d, s] = 1
+    return array
+
+
+def read_staff_store(connection: sqlite3.Connection, m: str, start: datetime.date,
+                     end: datetime.date) -> np.ndarray:
+    # One staff's day x shift array, read through the (staff, day) index
+    first, last = start.toordinal(), end.toordinal()
+    array = np.zeros((max(last - first, 0), len(store_shift_names(connection))), dtype=np.uint8)
+    rows = connection.execute("SELECT day, shift FROM assignments WHERE staff = ? AND day >= ? AND day < ?",
+                              (str(m), first, last)).fetchall()
+    if rows:
+        d, s = np.array(rows, dtype=np.int64).T
+        array[d - first, s] = 1
+    return array
+
+
+def shift_condition(shifts: List[int]) -> str:
+    # The shifts are ints from the instance, so they can go in the query
+    return f"shift IN ({', '.join(str(int(s)) for s in shifts)})" if shifts else "0"
+
+
+def fairness_counts(connection: sqlite3.Connection, instance: Instance, start: datetime.date,
+                    end: datetime.date, staff: List = None) -> Dict[str, np.ndarray]:
+    # What each equalize family counts, per staff, from start up to but not including end:
+    # days worked on weekends and weekdays and shifts of each group
+    # Computed by the store, only one row per staff is read
+    staff = instance.staff if staff is None else staff
+    # date.weekday() is (ordinal + 6) % 7, Saturday is 5 and Sunday 6
+    query = f"""
+        SELECT staff,
+               COUNT(DISTINCT CASE WHEN (day + 6) % 7 >= 5 THEN day END),
+               SUM({shift_condition(instance.midnight_shifts)}),
+               SUM({shift_condition(instance.late_shifts)}),
+               SUM({shift_condition(instance.day_shifts)}),
+               SUM({shift_condition(instance.afternoon_shifts)}),
+               COUNT(DISTINCT CASE WHEN (day + 6) % 7 < 5 THEN day END)
+        FROM assignments WHERE day >= ? AND day < ? GROUP BY staff"""
+    counts = {m: row for m, *row in connection.execute(query, (start.toordinal(), end.toordinal()))}
+    empty = [0] * len(FAIRNESS_COUNTERS)
+    table = np.array([counts.get(str(m), empty) for m in staff], dtype=np.int64).reshape(len(staff), -1)
+    return {name: table[:, i] for i, name in enumerate(FAIRNESS_COUNTERS)}
+
+
+def year_to_date_counts(connection: sqlite3.Connection, instance: Instance, before: datetime.date,
+                        staff: List = None) -> Dict[str, np.ndarray]:
+    # fairness_counts from the first of January up to the day before a new schedule starts
+    return fairness_counts(connection, instance, datetime.date(before.year, 1, 1), before, staff)
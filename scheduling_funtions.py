@@ -1,6 +1,9 @@
 from dataclasses import dataclass
-from typing import List
+from functools import lru_cache
+from weakref import WeakKeyDictionary
+from typing import List, Tuple
 from utility_functions import *
+from model import *
 
 
 # https://github.com/google/or-tools/blob/master/examples/python/shift_scheduling_sat.py
@@ -19,26 +22,106 @@ class Post:
     choices: List[bool]
 
 
-def bounded_span(shifts, start, length):
+class LiteralCache:
+    # Hash-conses negations, ANDs and ORs of literals so that the same expression
+    # over the same literals only ever gets one variable in the model
+    def __init__(self, model):
+        self.model = model
+        self.negations = {}
+        self.expressions = {}
+        self.negations_reused = 0
+        self.variables_saved = 0
+        self.constraints_saved = 0
+
+    def Not(self, literal):
+        key = literal.Index()
+        if key in self.negations:
+            self.negations_reused += 1
+        else:
+            self.negations[key] = literal.Not()
+        return self.negations[key]
+
+    def And(self, literals):
+        return self.reified("and", literals)
+
+    def Or(self, literals):
+        return self.reified("or", literals)
+
+    def AllOf(self, literals):
+        # A literal that implies every literal in the list. Cheaper than And and enough
+        # when the literal is only ever used positively in a clause
+        unique = {literal.Index(): literal for literal in literals}
+        if ("and", frozenset(unique)) in self.expressions:
+            return self.reified("and", literals)
+        return self.reified("all", literals)
+
+    def reified(self, kind, literals):
+        unique = {literal.Index(): literal for literal in literals}
+        if len(unique) == 1:
+            return next(iter(unique.values()))
+
+        key = (kind, frozenset(unique))
+        if key in self.expressions:
+            self.variables_saved += 1
+            self.constraints_saved += {"and": 2, "or": 2, "all": 1}[kind] if unique else 0
+            return self.expressions[key]
+
+        if len(unique) == 0:
+            # An empty AND is true and an empty OR is false
+            literal = self.model.NewConstant(int(kind != "or"))
+        else:
+            literal = self.model.NewBoolVar(kind)
+            literals = list(unique.values())
+            if kind == "or":
+                self.model.AddBoolOr(literals).OnlyEnforceIf(literal)
+                self.model.AddBoolAnd([self.Not(x) for x in literals]).OnlyEnforceIf(self.Not(literal))
+            else:
+                self.model.AddBoolAnd(literals).OnlyEnforceIf(literal)
+                if kind == "and":
+                    self.model.AddBoolOr([self.Not(x) for x in literals] + [literal])
+        self.expressions[key] = literal
+        return literal
+
+    def stats(self):
+        return {"cached_expressions": len(self.expressions),
+                "variables_saved": self.variables_saved,
+                "constraints_saved": self.constraints_saved,
+                "negations_reused": self.negations_reused}
+
+
+_literal_caches = WeakKeyDictionary()
+
+
+def literal_cache(model):
+    if model not in _literal_caches:
+        _literal_caches[model] = LiteralCache(model)
+    return _literal_caches[model]
+
+
+def negate(literal, cache=None):
+    return literal.Not() if cache is None else cache.Not(literal)
+
+
+def bounded_span(shifts, start, length, cache=None):
     sequence = []
     # Left border (start of works, or works[start - 1])
     if start > 0:
-        sequence.append(shifts[start - 1].Not())
+        sequence.append(negate(shifts[start - 1], cache))
 
     for i in range(length):
         sequence.append(shifts[start + i])
 
     # Right border (end of works or works[start + length])
     if start + length < len(shifts):
-        sequence.append(shifts[start + length].Not())
+        sequence.append(negate(shifts[start + length], cache))
     return sequence
 
 
-def predicates(start, prior):
+def predicates(start, prior, cache=None):
     if prior is None:
         return []
     else:
-        return [prior.shifts[i + start].Not()
+        return [negate(prior.shifts[i + start], cache)
                 if prior.choices[i] == False
                 else prior.shifts[i + start]
                 for i in range(len(prior.choices))]
@@ -82,10 +165,10 @@ def shift_window(shifts, length, prior=None, post=None):
     return range(window_size(shifts, length, prior, post))
 
 
-def shift_span(shifts, start, length, bounded, prior=None, post=None):
+def shift_span(shifts, start, length, bounded, prior=None, post=None, cache=None):
     # Plus one to make the window inclusive
     if bounded:
-        return bounded_span(shifts, start, length)
+        return bounded_span(shifts, start, length, cache)
     window_size_start = start
     window_size_end = start + length + 1
     if prior is not None:
@@ -106,10 +189,8 @@ def forbid_seq(model, span, pred):
 
 def forbid_seq_continue_pattern(model, span, start, pred, prior):
     # Xor doesn't support reified variables so we have to do it manually
-    span_bool = model.NewBoolVar("span_bool")
     # If xor is disabled prevent enforce a span of 0's
-    model.AddBoolAnd(span).OnlyEnforceIf(
-        pred + [span_bool])
+    span_bool = literal_cache(model).AllOf(span)
     # Else continue the pattern
     model.AddBoolOr([span_bool, prior.shifts[start + len(prior.choices)]]).OnlyEnforceIf(pred)
 
@@ -119,20 +200,21 @@ def forbid_max(model, shifts, hard_max, prior=None, post=None):
     post_exists = post is not None
     continue_pattern = prior_exists and prior.continue_shifts
     grow_pred = (prior_exists and prior.continue_shifts) or (prior_exists and post_exists)
+    cache = literal_cache(model)
 
     # If the window should grow up to size then loop through each size
     for length in window_length(hard_max, grow_pred):
         # Find the start of each window
         for start in shift_window(shifts, length, prior, post):
-            span = shift_span(shifts, start, length, False, prior, post)
+            span = shift_span(shifts, start, length, False, prior, post, cache)
 
             # Find the predicates
-            priors = predicates(start, prior)
+            priors = predicates(start, prior, cache)
             posts = post_predicates(start, length, prior, post)
             pred = priors + posts
 
             if prior_exists and post_exists:
-                model.AddBoolOr(not_list(pred))
+                model.AddBoolOr(not_list(pred, cache))
             # If there is no predicates prevent runs of span
             elif not prior_exists and not post_exists:
                 forbid_seq_no_pred(model, span)
@@ -152,21 +234,22 @@ def forbid_min(model, shifts, hard_min, prior=None, post=None):
     continue_pattern = prior_exists and prior.continue_shifts
     grow_pred = (prior_exists and prior.continue_shifts) or (
         not prior_exists and not post_exists) or (prior_exists and post_exists)
+    cache = literal_cache(model)
 
     # If the window should grow up to size then loop through each size
     for length in window_length(hard_min, grow_pred):
         # Find the start of each window
         for start in shift_window(shifts, length, prior, post):
             span = shift_span(shifts, start, length,
-                              not prior_exists and not post_exists, prior, post)
+                              not prior_exists and not post_exists, prior, post, cache)
 
             # Find the predicates
-            priors = predicates(start, prior)
+            priors = predicates(start, prior, cache)
             posts = post_predicates(start, length, prior, post)
             pred = priors + posts
 
             if prior_exists and post_exists:
-                model.AddBoolOr(not_list(pred))
+                model.AddBoolOr(not_list(pred, cache))
             # If there is no predicates prevent runs of span
             elif not prior_exists and not post_exists:
                 forbid_seq_no_pred(model, span)
@@ -187,16 +270,17 @@ def penalize_min(model, prefix, shifts, hard_min, soft_min, min_cost, prior=None
     prior_exists = prior is not None
     post_exists = post is not None
     continue_pattern = (prior_exists and prior.continue_shifts) or (prior_exists and post_exists)
+    cache = literal_cache(model)
 
     # Penalize sequences that are below the soft limit.
     # All pathes need to loop to add different costs per different differences
     for length in range(hard_min, soft_min):
         for start in shift_window(shifts, length, prior, post):
             span = shift_span(shifts, start, length,
-                              not prior_exists and not post_exists, prior, post)
+                              not prior_exists and not post_exists, prior, post, cache)
 
             # Find the predicates
-            priors = predicates(start, prior)
+            priors = predicates(start, prior, cache)
             posts = post_predicates(start, length, prior, post)
             pred = priors + posts
 
@@ -210,10 +294,9 @@ def penalize_min(model, prefix, shifts, hard_min, soft_min, min_cost, prior=None
                 model.AddBoolOr(span + [lit]).OnlyEnforceIf(pred)
             elif prior_exists or post_exists:
                 # We need to create the expression (A1 and A2 and A3 and ... and An) or lit
-                # To do this we need an intermediate variable
-                span_bool = model.NewBoolVar('span_bool: under_span(start=%i, length=%i)' % (start, length))
+                # To do this we need an intermediate variable, shared by every window over the same span
                 # The pattern only exists if you are willing to pay
-                model.AddBoolAnd(span).OnlyEnforceIf(pred + [span_bool])
+                span_bool = cache.AllOf(span)
                 or_vars = or_vars + [span_bool]
             if continue_pattern:
                 if start > window_size(shifts, length, prior, post) - len(prior.choices) - 1:
@@ -240,16 +323,17 @@ def penalize_max(model, prefix, shifts, hard_max, soft_max, max_cost, prior=None
     prior_exists = prior is not None
     post_exists = post is not None
     continue_pattern = (prior_exists and prior.continue_shifts) or (prior_exists and post_exists)
+    cache = literal_cache(model)
 
     # Penalize sequences that are below the soft limit.
     # All pathes need to loop to add different costs per different differences
     for length in range(soft_max, hard_max + 1):
         for start in shift_window(shifts, length, prior, post):
             span = shift_span(shifts, start, length,
-                              not prior_exists and not post_exists, prior, post)
+                              not prior_exists and not post_exists, prior, post, cache)
 
             # Find the predicates
-            priors = predicates(start, prior)
+            priors = predicates(start, prior, cache)
             posts = post_predicates(start, length, prior, post)
             pred = priors + posts
 
@@ -263,10 +347,9 @@ def penalize_max(model, prefix, shifts, hard_max, soft_max, max_cost, prior=None
                 model.AddBoolOr(span + [lit]).OnlyEnforceIf(pred)
             elif prior_exists or post_exists:
                 # We need to create the expression (A1 and A2 and A3 and ... and An) or lit
-                # To do this we need an intermediate variable
-                span_bool = model.NewBoolVar('span_bool')
+                # To do this we need an intermediate variable, shared by every window over the same span
                 # The pattern only exists if you are willing to pay
-                model.AddBoolAnd(span).OnlyEnforceIf(pred + [span_bool])
+                span_bool = cache.AllOf(span)
                 or_vars = or_vars + [span_bool]
             if continue_pattern:
                 if start > window_size(shifts, length, prior, post) - len(prior.choices) - 1:
@@ -284,12 +367,314 @@ def penalize_max(model, prefix, shifts, hard_max, soft_max, max_cost, prior=None
     # Return the optimization constraints
     return cost_literals, cost_coefficients
 
-def add_soft_sequence_min(model, prefix, shifts, hard_min, soft_min, min_cost, prior=None, post=None):
+
+# The window encoding above creates clauses and literals for every (length, start)
+# window. The automaton encoding compiles the same rule into one AddAutomaton per
+# sequence that reads one letter per day (the shift, prior and post literals packed
+# together) and emits the cost of every window as it is read
+WINDOW_ENCODING = "window"
+AUTOMATON_ENCODING = "automaton"
+
+
+@dataclass(frozen=True)
+class SequenceRule:
+    minimum: bool
+    hard: int
+    soft: int
+    cost: int
+    choices: Tuple = None
+    continue_shifts: bool = False
+    post_length: int = None
+
+
+@dataclass(frozen=True)
+class SequenceWindow:
+    forbid: bool
+    length: int
+    cost: int
+    bounded: bool
+    # True if the window is dropped when the prior pattern can still continue
+    continues: bool
+    # Offsets of the first and last day the window reads relative to its start
+    first: int
+    last: int
+    # The window exists when there are at least need days from its start to the end
+    need: int
+
+
+def sequence_rule(minimum, hard, soft, cost, prior=None, post=None):
+    return SequenceRule(minimum, hard, soft, cost,
+                        None if prior is None else tuple(prior.choices),
+                        prior is not None and prior.continue_shifts,
+                        None if post is None else len(post.choices))
+
+
+def sequence_windows(rule):
+    # Mirrors the loops of forbid_min, forbid_max, penalize_min and penalize_max
+    prior_exists = rule.choices is not None
+    post_exists = rule.post_length is not None
+    prior_length = len(rule.choices) if prior_exists else 0
+    post_length = rule.post_length if post_exists else 0
+    no_pred = not prior_exists and not post_exists
+    continue_pattern = prior_exists and rule.continue_shifts
+
+    grows = continue_pattern or (prior_exists and post_exists)
+    if rule.minimum:
+        forbid_lengths = window_length(rule.hard, grows or no_pred)
+        penalize_lengths = range(rule.hard, rule.soft)
+    else:
+        forbid_lengths = window_length(rule.hard, grows)
+        penalize_lengths = range(rule.soft, rule.hard + 1)
+
+    windows = []
+    for forbid, lengths in [(True, forbid_lengths), (False, penalize_lengths)]:
+        for length in lengths:
+            if forbid:
+                cost = 0
+                bounded = no_pred and rule.minimum
+                continues = continue_pattern and not post_exists
+            else:
+                cost = rule.cost * (rule.soft - length if rule.minimum else length - rule.soft)
+                bounded = no_pred
+                continues = continue_pattern or (prior_exists and post_exists)
+
+            need = length + prior_length + post_length
+            if continues:
+                need += prior_length
+            if bounded:
+                first, last = -1, length
+            else:
+                last = max(length + prior_length - post_length,
+                           length + prior_length + post_length - 1)
+                if continues:
+                    last = max(last, prior_length)
+                first = 0
+            windows.append(SequenceWindow(forbid, length, cost, bounded,
+                                          continues, first, last, need))
+    return windows
+
+
+def window_outcome(rule, window, start, num_shifts, bit):
+    # The cost of a single window, or None if it is forbidden
+    # bit(i, j) reads letter i, j = 0 for the shift, 1 for the prior and 2 for the post
+    # num_shifts is None while the end of the sequence has not been reached
+    prior_exists = rule.choices is not None
+    post_exists = rule.post_length is not None
+    prior_length = len(rule.choices) if prior_exists else 0
+    post_length = rule.post_length if post_exists else 0
+    length = window.length
+
+    if window.bounded:
+        span = [1 - bit(start - 1, 0)] if start > 0 else []
+        span += [bit(start + i, 0) for i in range(length)]
+        if num_shifts is None or start + length < num_shifts:
+            span.append(1 - bit(start + length, 0))
+    else:
+        end = start + length + 1 + prior_length - post_length
+        if num_shifts is not None:
+            end = min(end, num_shifts)
+        span = [bit(i, 0) for i in range(start + prior_length, end)]
+
+    pred = [bit(start + i, 1) == choice for i, choice in enumerate(rule.choices or [])]
+    post_start = start + length + prior_length
+    pred += [bit(i, 2) for i in range(post_start, post_start + post_length)]
+    matched = all(pred)
+
+    if window.forbid:
+        if prior_exists and post_exists:
+            return None if matched else 0
+        if not prior_exists and not post_exists:
+            return 0 if any(span) else None
+        if window.continues and bit(start + prior_length, 1):
+            return 0
+        return None if matched and not all(span) else 0
+
+    if prior_exists and post_exists:
+        broken = not any(span) or not bit(start + prior_length, 1)
+    elif prior_exists or post_exists:
+        broken = not all(span) and not (window.continues and bit(start + prior_length, 1))
+    else:
+        return 0 if any(span) else window.cost
+    return window.cost if matched and broken else 0
+
+
+@lru_cache(maxsize=None)
+def sequence_automaton(rule):
+    # Builds the automaton by reading every possible letter from every reachable state.
+    # A state remembers the last few letters and the costs of windows that are only
+    # charged if the sequence turns out to be long enough
+    windows = sequence_windows(rule)
+    letter_bits = 1 + (rule.choices is not None) + (rule.post_length is not None)
+    end_letter = 2 ** letter_bits
+    memory = max([window.last - window.first + 1 for window in windows] + [1])
+    # Past this many letters every window start is known to be positive
+    cap = memory + 1
+    unknown_position = 10 ** 6
+    # Letters pack the shift, prior and post bits in that order, skipping missing ones
+    slots = [0] + [1] * (rule.choices is not None) + [2] * (rule.post_length is not None)
+
+    def letter_bit(letters, base):
+        def bit(i, j):
+            return (letters[i - base] >> slots.index(j)) & 1
+        return bit
+
+    def step(state, letter):
+        read, letters, pending = state
+        total = 0
+        if letter == end_letter:
+            base = read - len(letters) if read < cap else unknown_position
+            num_shifts = base + len(letters)
+            bit = letter_bit(letters, base)
+            for window in windows:
+                for start in range(max(0, num_shifts - window.last), num_shifts - window.need + 1):
+                    value = window_outcome(rule, window, start, num_shifts, bit)
+                    if value is None:
+                        return None
+                    total += value
+            return "end", total
+
+        letters = letters + (letter,)
+        base = read + 1 - len(letters) if read + 1 < cap else unknown_position
+        position = base + len(letters) - 1
+        bit = letter_bit(letters, base)
+
+        carried = {}
+        for delay, value in pending:
+            if delay == 1:
+                if value is None:
+                    return None
+                total += value
+            else:
+                carried[delay - 1] = value
+
+        for window in windows:
+            start = position - window.last
+            if start < 0:
+                continue
+            value = window_outcome(rule, window, start, None, bit)
+            delay = max(window.last, window.need - 1) - window.last
+            if delay == 0:
+                if value is None:
+                    return None
+                total += value
+            elif value != 0:
+                previous = carried.get(delay, 0)
+                carried[delay] = None if value is None or previous is None else previous + value
+
+        state = (min(read + 1, cap), letters[-memory:], tuple(sorted(carried.items())))
+        return state, total
+
+    initial = (0, (), ())
+    states = {initial: 0}
+    queue = [initial]
+    arcs = []
+    while queue:
+        state = queue.pop()
+        for letter in range(end_letter + 1):
+            result = step(state, letter)
+            if result is None:
+                continue
+            target, cost = result
+            if target not in states:
+                states[target] = len(states)
+                if target != "end":
+                    queue.append(target)
+            arcs.append((states[state], letter, cost, states[target]))
+
+    # Drop states that can't reach the end of the sequence
+    final = states["end"] if "end" in states else None
+    alive = {final}
+    grew = True
+    while grew:
+        grew = False
+        for tail, _, _, head in arcs:
+            if head in alive and tail not in alive:
+                alive.add(tail)
+                grew = True
+    arcs = [arc for arc in arcs if arc[0] in alive and arc[3] in alive]
+
+    # Merge states with the same future (partition refinement)
+    classes = {state: int(state == final) for state in alive}
+    while True:
+        outgoing = {state: [] for state in alive}
+        for tail, letter, cost, head in arcs:
+            outgoing[tail].append((letter, cost, classes[head]))
+        signatures = {state: (classes[state], tuple(sorted(outgoing[state])))
+                      for state in alive}
+        numbering = {}
+        refined = {state: numbering.setdefault(signature, len(numbering))
+                   for state, signature in signatures.items()}
+        if len(numbering) == len(set(classes.values())):
+            break
+        classes = refined
+
+    unit = math.gcd(*[cost for _, _, cost, _ in arcs]) or 1
+    transitions = sorted({(classes[tail], letter, cost // unit, classes[head])
+                          for tail, letter, cost, head in arcs})
+    start_state = classes.get(0)
+    final_state = classes.get(final)
+    return start_state, final_state, transitions, unit, end_letter
+
+
+def add_sequence_automaton(model, prefix, shifts, rule, prior=None, post=None):
+    start_state, final_state, transitions, unit, end_letter = sequence_automaton(rule)
+    if start_state is None:
+        # Every sequence breaks a hard rule
+        model.AddBoolOr([])
+        return [], []
+
+    max_units = max(units for _, _, units, _ in transitions)
+    letter_base = end_letter + 1
+    cost_variables = []
+    letters = []
+    for d in range(len(shifts)):
+        bits = [shifts[d]]
+        if prior is not None:
+            bits.append(prior.shifts[d] if d < len(prior.shifts) else 0)
+        if post is not None:
+            # Posts beyond the end of the post list are dropped by the window encoding
+            bits.append(post.shifts[d] if d < len(post.shifts) else 1)
+        letter = model.NewIntVar(0, end_letter - 1 + letter_base * max_units,
+                                 prefix + ': letter(day=%i)' % d)
+        packed = sum(bit * 2 ** i for i, bit in enumerate(bits))
+        if max_units > 0:
+            cost = model.NewIntVar(0, max_units, prefix + ': automaton_cost(day=%i)' % d)
+            model.Add(letter == packed + letter_base * cost)
+            cost_variables.append(cost)
+        else:
+            model.Add(letter == packed)
+        letters.append(letter)
+
+    if max_units > 0:
+        end = model.NewIntVar(end_letter, end_letter + letter_base * max_units,
+                              prefix + ': letter(end)')
+        cost = model.NewIntVar(0, max_units, prefix + ': automaton_cost(end)')
+        model.Add(end == end_letter + letter_base * cost)
+        cost_variables.append(cost)
+    else:
+        end = model.NewConstant(end_letter)
+    letters.append(end)
+
+    model.AddAutomaton(letters, start_state, [final_state],
+                       [(tail, letter + letter_base * units, head)
+                        for tail, letter, units, head in transitions])
+    return cost_variables, [unit] * len(cost_variables)
+
+
+def add_soft_sequence_min(model, prefix, shifts, hard_min, soft_min, min_cost, prior=None, post=None,
+                          encoding=WINDOW_ENCODING):
+    if encoding == AUTOMATON_ENCODING:
+        rule = sequence_rule(True, hard_min, soft_min, min_cost, prior, post)
+        return add_sequence_automaton(model, prefix, shifts, rule, prior, post)
     forbid_min(model, shifts, hard_min, prior, post)
     return penalize_min(model, prefix, shifts, hard_min, soft_min, min_cost, prior, post)
 
 
-def add_soft_sequence_max(model, prefix, shifts, hard_max, soft_max, max_cost, prior=None, post=None):
+def add_soft_sequence_max(model, prefix, shifts, hard_max, soft_max, max_cost, prior=None, post=None,
+                          encoding=WINDOW_ENCODING):
+    if encoding == AUTOMATON_ENCODING:
+        rule = sequence_rule(False, hard_max, soft_max, max_cost, prior, post)
+        return add_sequence_automaton(model, prefix, shifts, rule, prior, post)
     forbid_max(model, shifts, hard_max, prior, post)
     return penalize_max(model, prefix, shifts, hard_max, soft_max, max_cost, prior, post)
 
@@ -306,6 +691,8 @@ def add_soft_sequence(model, prefix, shifts, hard_max, soft_max, max_cost, hard_
 
 def add_soft_sum(model, shifts, hard_min, soft_min, min_cost,
                  soft_max, hard_max, max_cost, prefix):
+    # shifts can be literals or linear expressions such as productivity * works
+    # so the deltas are bounded by the hard limits rather than the number of terms
 
     cost_variables = []
     cost_coefficients = []
@@ -315,19 +702,19 @@ def add_soft_sum(model, shifts, hard_min, soft_min, min_cost,
 
     # Penalize sums below the soft_min target.
     if soft_min > hard_min and min_cost > 0:
-        delta = model.NewIntVar(-len(shifts), len(shifts), '')
+        delta = model.NewIntVar(soft_min - hard_max, soft_min - hard_min, '')
         model.Add(delta == soft_min - sum_var)
         # TODO(user): Compare efficiency with only excess >= soft_min - sum_var.
-        excess = model.NewIntVar(0, len(shifts), prefix + ': under_sum')
+        excess = model.NewIntVar(0, soft_min - hard_min, prefix + ': under_sum')
         model.AddMaxEquality(excess, [delta, 0])
         cost_variables.append(excess)
         cost_coefficients.append(min_cost)
 
     # Penalize sums above the soft_max target.
     if soft_max < hard_max and max_cost > 0:
-        delta = model.NewIntVar(-len(shifts), len(shifts), '')
+        delta = model.NewIntVar(hard_min - soft_max, hard_max - soft_max, '')
         model.Add(delta == sum_var - soft_max)
-        excess = model.NewIntVar(0, len(shifts), prefix + ': over_sum')
+        excess = model.NewIntVar(0, hard_max - soft_max, prefix + ': over_sum')
         model.AddMaxEquality(excess, [delta, 0])
         cost_variables.append(excess)
         cost_coefficients.append(max_cost)
@@ -335,30 +722,88 @@ def add_soft_sum(model, shifts, hard_min, soft_min, min_cost,
     return cost_variables, cost_coefficients
 
 
-def distribution(model, target_shifts, prefix, target):
+def add_soft_window_sums(model, totals, span, hard_min, soft_min, min_cost,
+                         soft_max, hard_max, max_cost, prefix):
+    # Same penalties as add_soft_sum over every window of span totals, but overlapping
+    # windows share the totals and each window only gets its excess variables
+    # The excess is only bounded below, the objective keeps it at max(delta, 0)
+    cost_variables = []
+    cost_coefficients = []
+
+    for wind in window(totals, span):
+        wind_sum = sum(wind)
+        model.Add(wind_sum >= hard_min)
+        model.Add(wind_sum <= hard_max)
+
+        # Penalize sums below the soft_min target.
+        if soft_min > hard_min and min_cost > 0:
+            excess = model.NewIntVar(0, soft_min - hard_min, prefix + ': under_sum')
+            model.Add(excess >= soft_min - wind_sum)
+            cost_variables.append(excess)
+            cost_coefficients.append(min_cost)
+
+        # Penalize sums above the soft_max target.
+        if soft_max < hard_max and max_cost > 0:
+            excess = model.NewIntVar(0, hard_max - soft_max, prefix + ': over_sum')
+            model.Add(excess >= wind_sum - soft_max)
+            cost_variables.append(excess)
+            cost_coefficients.append(max_cost)
+
+    return cost_variables, cost_coefficients
+
+
+# diff * (diff + 1) through AddMultiplicationEquality
+PRODUCT_DISTRIBUTION = "product"
+# The same penalty looked up by the number of shifts with AddElement
+ELEMENT_DISTRIBUTION = "element"
+# The same penalty bounded below by the lines joining neighbouring counts, it's convex so this is exact
+CONVEX_DISTRIBUTION = "convex"
+
+
+def distribution_penalties(target):
+    # Penalty before the coefficient for working 0, 1, ... target shifts
+    # The product has to be positive so there can never be more than target shifts
+    return [(target - num_shifts) * (target - num_shifts + 1) for num_shifts in range(target + 1)]
+
+
+def distribution(model, target_shifts, prefix, target, encoding=PRODUCT_DISTRIBUTION):
     # The optimization constraints
     cost_literals = []
     cost_coefficients = []
 
     num_shifts = model.NewIntVar(0, target * 2, '%s' % prefix)
     model.Add(num_shifts == sum(target_shifts))
-    diff = model.NewIntVar(-target, target, '%s' % prefix)
-    model.Add(num_shifts + diff == target)
 
-    abs_diff = model.NewIntVar(0, target, '%s' % prefix)
-    model.AddAbsEquality(abs_diff, diff)
+    if encoding == PRODUCT_DISTRIBUTION:
+        diff = model.NewIntVar(-target, target, '%s' % prefix)
+        model.Add(num_shifts + diff == target)
 
-    diff_plus_one = model.NewIntVar(1, target + 1, '%s' % prefix)
-    model.Add(diff_plus_one == 1 + abs_diff)
+        abs_diff = model.NewIntVar(0, target, '%s' % prefix)
+        model.AddAbsEquality(abs_diff, diff)
 
-    # In order to stay as close to the target as possible a non-linear error is needed
-    # Or else 0 away from the target and 3 away from the target is equivilant to
-    # 2 away and 1 away. I don't want 1 person to get all the weekends off
-    # I have chosen the triangle numbers, 4 * n(n+1)/2, 1 + 2 + 3... * 4
-    # Using regression this is equivilant to 2x + 2x^2
-    diff_not_linear = model.NewIntVar(
-        0, target * target + target, '%s_distribution' % prefix)
-    model.AddMultiplicationEquality(diff_not_linear, [diff, diff_plus_one])
+        diff_plus_one = model.NewIntVar(1, target + 1, '%s' % prefix)
+        model.Add(diff_plus_one == 1 + abs_diff)
+
+        # In order to stay as close to the target as possible a non-linear error is needed
+        # Or else 0 away from the target and 3 away from the target is equivilant to
+        # 2 away and 1 away. I don't want 1 person to get all the weekends off
+        # I have chosen the triangle numbers, 4 * n(n+1)/2, 1 + 2 + 3... * 4
+        # Using regression this is equivilant to 2x + 2x^2
+        diff_not_linear = model.NewIntVar(
+            0, target * target + target, '%s_distribution' % prefix)
+        model.AddMultiplicationEquality(diff_not_linear, [diff, diff_plus_one])
+    else:
+        penalties = distribution_penalties(target)
+        model.Add(num_shifts <= target)
+        diff_not_linear = model.NewIntVar(
+            0, target * target + target, '%s_distribution' % prefix)
+        if encoding == ELEMENT_DISTRIBUTION:
+            model.AddElement(num_shifts, penalties, diff_not_linear)
+        else:
+            # Only correct while the penalty is minimized, which it always is
+            for k in range(target):
+                slope = penalties[k + 1] - penalties[k]
+                model.Add(diff_not_linear >= penalties[k] + slope * (num_shifts - k))
 
     cost_literals.append(diff_not_linear)
     # The penalty is proportional to the delta with soft_min.
@@ -370,11 +815,14 @@ def distribution(model, target_shifts, prefix, target):
 def x_shifts_only(model, not_target_shifts, staff, days, shifts):
     # Certain staff can only work cartain shifts
     for m in staff:
+        # Cells that were never created don't need to be forbidden
         constraint = [not_target_shifts[m, d, s]
                       for d in days
-                      for s in shifts]
+                      for s in shifts
+                      if not is_false_literal(model, not_target_shifts[m, d, s])]
 
-        model.Add(sum(constraint) == 0)
+        if constraint:
+            model.Add(sum(constraint) == 0)
 
 
 # def forbid_min(model, shifts, hard_min, prior=None, post=None):
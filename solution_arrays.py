@@ -0,0 +1,96 @@
+from evaluation import *
+
+
+# Reads a solved schedule into a staff x day x shift uint8 array in one pass over the solver's
+# response, instead of a Value call for every cell, every view and every objective term
+# The views (schedule_views), the notebook's *_results dicts and the objective (evaluate_schedule)
+# are then computed from the array
+
+
+def cell_indices(staff_works_shift_on_day: Dict[Tuple, IntVar], staff: List, days: List[int],
+                 shifts: List[int]) -> np.ndarray:
+    # Proto index of each cell's literal, a negated literal has index -index - 1
+    # The same for every solution of a model, so it can be kept between solutions
+    return np.array([[[staff_works_shift_on_day[m, d, s].Index() for s in shifts] for d in days] for m in staff],
+                    dtype=np.int64)
+
+
+def response_values(solver) -> np.ndarray:
+    # Every variable's value by proto index. Reading the response costs the same for each value,
+    # so this is only worth it over literal_values when most of the variables are needed
+    solution = solver_response(solver).solution
+    return np.fromiter(solution, dtype=np.int64, count=len(solution))
+
+
+def literal_values(solution, indices: np.ndarray) -> np.ndarray:
+    # solution is the response's solution field, or every value from response_values
+    flat = indices.ravel()
+    positive = np.where(flat >= 0, flat, -flat - 1)
+    if isinstance(solution, np.ndarray):
+        values = solution[positive]
+    else:
+        values = np.fromiter((solution[i] for i in positive.tolist()), dtype=np.int64, count=len(flat))
+    values = np.where(flat >= 0, values, 1 - values)
+    return values.reshape(indices.shape)
+
+
+def solution_array(solver, indices: np.ndarray) -> np.ndarray:
+    # solver is a CpSolver after Solve or a solution callback, indices from cell_indices
+    return literal_values(solver_response(solver).solution, indices).astype(np.uint8)
+
+
+def schedule_solution_array(solver, schedule: Schedule) -> np.ndarray:
+    instance = schedule.instance
+    indices = cell_indices(schedule.variables["staff_works_shift_on_day"], instance.staff, instance.days,
+                           instance.shifts)
+    return solution_array(solver, indices)
+
+
+def record_bytes(length: int) -> int:
+    return (length + 7) // 8
+
+
+def pack_records(records: np.ndarray) -> bytes:
+    # A (records, bits) 0-1 array, each record bit-packed with numpy.packbits and padded to whole
+    # bytes. The binary solutions and the schedule archive are both stored this way
+    return np.packbits(records.astype(np.uint8), axis=1).tobytes()
+
+
+def unpack_records(packed, length: int) -> np.ndarray:
+    # packed: bytes from pack_records, or its records as a (records, record_bytes) uint8 array
+    records = np.frombuffer(packed, dtype=np.uint8) if isinstance(packed, bytes) else np.asarray(packed)
+    return np.unpackbits(records.reshape(-1, record_bytes(length)), axis=1, count=length)
+
+
+def format_array(array: np.ndarray, staff: List) -> str:
+    # The same text as format_shifts
+    text = [f"{len(staff)};", f"{array.shape[1]};"]
+    for i, m in enumerate(staff):
+        for row in array[i]:
+            text.append(f"{m};{''.join(map(str, row.tolist()))};")
+    return ''.join(text)
+
+
+def notebook_results(array: np.ndarray, instance: Instance) -> Dict[str, Dict]:
+    # The *_results dicts the notebook builds for test.py, {staff: [value for each day]} for each
+    # view and {(staff, day): [value for each shift]} for staff_works_shift_on_day_results
+    results = {name + "_results": {m: view[i].tolist() for i, m in enumerate(instance.staff)}
+               for name, view in schedule_views(array, instance).items()}
+    results["staff_works_shift_on_day_results"] = {(m, d): array[i, d].tolist()
+                                                   for i, m in enumerate(instance.staff)
+                                                   for d in instance.days}
+    return results
+
+
+def family_objectives(solver, schedule: Schedule) -> Dict[str, int]:
+    # obj_result for every family, from the solver's values of the objective terms
+    # evaluate_schedule gives the same for a solution whose penalty variables are as low as the
+    # shifts allow, which the solver only guarantees for an optimal one
+    names = list(schedule.objectives)
+    indices = np.array([variable.Index() for name in names for variable in schedule.objectives[name][0]],
+                       dtype=np.int64)
+    coeffs = np.array([coeff for name in names for coeff in schedule.objectives[name][1]], dtype=np.int64)
+    # There are more objective terms than cells, so every value is read once
+    terms = literal_values(response_values(solver), indices) * coeffs
+    lengths = [len(schedule.objectives[name][0]) for name in names]
+    return {name: int(part.sum()) for name, part in zip(names, np.split(terms, np.cumsum(lengths)[:-1]))}
@@ -0,0 +1,133 @@
+from solution_arrays import *
+from warm_start import *
+import json
+import os
+import struct
+import time
+
+
+# Writes every improving solution to disk as the solver finds it, so nothing is lost if the
+# kernel dies and a long solve can be looked at while it's still running
+#
+#   directory/
+#     solutions.txt   one line per solution in the save_shifts_to_file format
+#     solutions.bin   or a header followed by one record per solution, packed as in the schedule
+#                     archive (pack_records)
+#     solutions.log   one JSON line per solution: index, wall time, objective and best bound
+#
+# The solution is written before its log line, so every logged solution can be read
+
+TEXT_SOLUTIONS = "text"
+BINARY_SOLUTIONS = "binary"
+
+SOLUTIONS_MAGIC = b"SHFT"
+
+
+def binary_header(staff: List, num_days: int, num_shifts: int) -> bytes:
+    names = b"".join(struct.pack("<H", len(m.encode())) + m.encode() for m in staff)
+    return SOLUTIONS_MAGIC + struct.pack("<III", len(staff), num_days, num_shifts) + names
+
+
+def read_binary_header(f):
+    magic = f.read(4)
+    if magic != SOLUTIONS_MAGIC:
+        raise ValueError("Not a solutions file")
+    num_staff, num_days, num_shifts = struct.unpack("<III", f.read(12))
+    staff = []
+    for _ in range(num_staff):
+        length = struct.unpack("<H", f.read(2))[0]
+        staff.append(f.read(length).decode())
+    return staff, num_days, num_shifts
+
+
+class SolutionRecorder(CpSolverSolutionCallback):
+    def __init__(self,
+                 directory: str,
+                 staff_works_shift_on_day: Dict[Tuple, IntVar],
+                 staff: List,
+                 num_days: int,
+                 num_shifts: int,
+                 solution_format: str = TEXT_SOLUTIONS,
+                 verbose: bool = False):
+        CpSolverSolutionCallback.__init__(self)
+        self.directory = directory
+        self.staff_works_shift_on_day = staff_works_shift_on_day
+        self.staff = staff
+        self.num_days = num_days
+        self.num_shifts = num_shifts
+        self.solution_format = solution_format
+        self.verbose = verbose
+        self.solutions = 0
+        self.indices = cell_indices(staff_works_shift_on_day, staff, list(range(num_days)), list(range(num_shifts)))
+        os.makedirs(directory, exist_ok=True)
+        # A recorder starts a new series of solutions
+        for name in ["solutions.txt", "solutions.bin", "solutions.log"]:
+            if os.path.exists(os.path.join(directory, name)):
+                os.remove(os.path.join(directory, name))
+        if solution_format == BINARY_SOLUTIONS:
+            with open(os.path.join(directory, "solutions.bin"), "wb") as f:
+                f.write(binary_header(staff, num_days, num_shifts))
+
+    def on_solution_callback(self):
+        array = solution_array(self, self.indices)
+        if self.solution_format == BINARY_SOLUTIONS:
+            with open(os.path.join(self.directory, "solutions.bin"), "ab") as f:
+                f.write(pack_records(array.reshape(1, -1)))
+        else:
+            with open(os.path.join(self.directory, "solutions.txt"), "a") as f:
+                f.write(format_array(array, self.staff) + "\n")
+
+        record = {"index": self.solutions,
+                  "wall_time": self.WallTime(),
+                  "objective": self.ObjectiveValue(),
+                  "best_bound": self.BestObjectiveBound()}
+        with open(os.path.join(self.directory, "solutions.log"), "a") as f:
+            f.write(json.dumps(record) + "\n")
+        if self.verbose:
+            print(f"Solution {self.solutions}: {record['objective']} (bound {record['best_bound']}) "
+                  f"after {round(record['wall_time'], 2)}s")
+        self.solutions += 1
+
+
+def read_solution_log(directory: str) -> List[Dict]:
+    path = os.path.join(directory, "solutions.log")
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        # A line still being written is left for the next read
+        return [json.loads(line) for line in f if line.endswith("\n")]
+
+
+def load_solution(directory: str, index: int) -> Dict[Tuple, int]:
+    binary = os.path.join(directory, "solutions.bin")
+    if os.path.exists(binary):
+        with open(binary, "rb") as f:
+            staff, num_days, num_shifts = read_binary_header(f)
+            length = len(staff) * num_days * num_shifts
+            record_size = record_bytes(length)
+            count = (os.path.getsize(binary) - f.tell()) // record_size
+            if not 0 <= index < count:
+                raise ValueError(f"No solution {index} in {directory}, it has {count} solutions")
+            f.seek(index * record_size, os.SEEK_CUR)
+            bits = unpack_records(f.read(record_size), length)[0].tolist()
+        keys = [(m, d, s) for m in staff for d in range(num_days) for s in range(num_shifts)]
+        return dict(zip(keys, bits))
+
+    count = 0
+    with open(os.path.join(directory, "solutions.txt")) as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            if count == index:
+                return parse_assignment(line.rstrip("\n"))
+            count += 1
+    raise ValueError(f"No solution {index} in {directory}, it has {count} solutions")
+
+
+def load_latest_solution(directory: str):
+    # Safe to call while the solve is running, returns (record, assignment) or None before the first solution
+    log = read_solution_log(directory)
+    if not log:
+        return None
+    record = log[-1]
+    return record, load_solution(directory, record["index"])
@@ -0,0 +1,149 @@
+from schedule import *
+from dataclasses import dataclass, asdict
+import csv
+import json
+import os
+import re
+import time
+
+
+# A time series of the solve so runs can be compared on one chart
+# Solutions come from the callback, which also knows the conflicts and branches so far,
+# and bound improvements between solutions come from the search log
+
+@dataclass
+class TelemetryPoint:
+    wall_time: float
+    objective: float = None
+    best_bound: float = None
+    conflicts: int = None
+    branches: int = None
+    # "solution" from the callback, "bound" or "log_solution" from the search log
+    source: str = "solution"
+    worker: str = ""
+
+
+class TelemetryCallback(CpSolverSolutionCallback):
+    def __init__(self):
+        CpSolverSolutionCallback.__init__(self)
+        self.points = []
+
+    def on_solution_callback(self):
+        self.points.append(TelemetryPoint(self.WallTime(),
+                                          self.ObjectiveValue(),
+                                          self.BestObjectiveBound(),
+                                          self.NumConflicts(),
+                                          self.NumBranches()))
+
+    @property
+    def first_solution_time(self):
+        return self.points[0].wall_time if self.points else None
+
+
+# #1       0.52s best:10776 next:[0,10775] default_lp
+# #Bound   3.10s best:10776 next:[12,10775] max_lp
+# #Done    9.00s core
+SEARCH_LOG_LINE = re.compile(r"^#(\d+|Bound|Done)\s+([\d.]+)s\s+best:(\S+)\s+next:\[([^\]]*)\]\s*(\S*)")
+
+
+def parse_search_log_line(line: str):
+    match = SEARCH_LOG_LINE.match(line)
+    if match is None:
+        return None
+    event, wall_time, best, next_range, worker = match.groups()
+    objective = None if best == "inf" else float(best)
+    if next_range == "":
+        # Nothing better left, the incumbent is optimal
+        best_bound = objective
+    else:
+        best_bound = float(next_range.split(",")[0])
+    return TelemetryPoint(float(wall_time), objective, best_bound,
+                          source="bound" if event == "Bound" else "log_solution", worker=worker)
+
+
+def parse_search_log(lines: List[str]) -> List[TelemetryPoint]:
+    return [point for point in map(parse_search_log_line, lines) if point is not None]
+
+
+def merge_telemetry(solutions: List[TelemetryPoint], log: List[TelemetryPoint]) -> List[TelemetryPoint]:
+    # The callback already has every solution with its counters, the log adds the bounds
+    # and which worker found each solution
+    workers = {point.objective: point.worker for point in log if point.source == "log_solution"}
+    for point in solutions:
+        point.worker = workers.get(point.objective, point.worker)
+    points = solutions + [point for point in log if point.source == "bound"]
+    return sorted(points, key=lambda point: point.wall_time)
+
+
+def solve_with_telemetry(model: CpModel, solver: CpSolver = None, time_seconds: float = 60):
+    solver = solver or create_solver(time_seconds)
+    lines = []
+    solver.parameters.log_search_progress = True
+    solver.parameters.log_to_stdout = False
+    solver.log_callback = lines.append
+    callback = TelemetryCallback()
+    start = time.time()
+    status = solver.Solve(model, callback)
+    solve_time = time.time() - start
+
+    points = merge_telemetry(callback.points, parse_search_log(lines))
+    solved = status == OPTIMAL or status == FEASIBLE
+    points.append(TelemetryPoint(solver.WallTime(),
+                                 solver.ObjectiveValue() if solved else None,
+                                 solver.BestObjectiveBound() if solved else None,
+                                 solver.NumConflicts(),
+                                 solver.NumBranches(),
+                                 source="final"))
+    return status, {"status": solver.StatusName(status),
+                    "solve_time": solve_time,
+                    "points": points,
+                    "summary": telemetry_summary(points)}
+
+
+def relative_gap(objective, best_bound):
+    if objective is None or best_bound is None:
+        return None
+    return abs(objective - best_bound) / max(1, abs(objective))
+
+
+def telemetry_summary(points: List[TelemetryPoint], within: List[float] = (0.1, 0.05, 0.01)) -> Dict:
+    # within: time until the incumbent is within that fraction of the final objective
+    solutions = [point for point in points if point.source == "solution"]
+    final = points[-1] if points else TelemetryPoint(0)
+    summary = {"first_solution_time": solutions[0].wall_time if solutions else None,
+               "first_objective": solutions[0].objective if solutions else None,
+               "final_objective": final.objective,
+               "final_bound": final.best_bound,
+               "final_gap": relative_gap(final.objective, final.best_bound),
+               "solutions": len(solutions),
+               "conflicts": final.conflicts,
+               "branches": final.branches,
+               "wall_time": final.wall_time}
+    for fraction in within:
+        reached = [point.wall_time for point in solutions if final.objective is not None and
+                   point.objective - final.objective <= fraction * max(1, abs(final.objective))]
+        summary[f"time_within_{fraction:g}"] = reached[0] if reached else None
+    return summary
+
+
+def save_telemetry(telemetry: Dict, directory: str, name: str = "telemetry"):
+    # <name>.csv has the time series and <name>.json the summary, for plotting across runs
+    os.makedirs(directory, exist_ok=True)
+    columns = list(TelemetryPoint.__dataclass_fields__)
+    with open(os.path.join(directory, f"{name}.csv"), "w", newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for point in telemetry["points"]:
+            writer.writerow(asdict(point))
+    with open(os.path.join(directory, f"{name}.json"), "w") as f:
+        json.dump({"status": telemetry["status"],
+                   "solve_time": telemetry["solve_time"],
+                   "summary": telemetry["summary"],
+                   "points": [asdict(point) for point in telemetry["points"]]}, f, indent=2)
+
+
+def load_telemetry(directory: str, name: str = "telemetry") -> Dict:
+    with open(os.path.join(directory, f"{name}.json")) as f:
+        telemetry = json.load(f)
+    telemetry["points"] = [TelemetryPoint(**point) for point in telemetry["points"]]
+    return telemetry
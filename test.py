@@ -1,6 +1,10 @@
 from typing import Dict, List
+from contextlib import redirect_stdout
 from constraints import *
 from testing_functions import *
+from solution_arrays import *
+import io
+import re
 
 
 def all_shifts_taken_test(staff_works_shift_on_day_results: Dict[Tuple, IntVar],
@@ -226,3 +230,96 @@ def minimize_split_weekends_test(solver, staff_works_day, staff, sats, suns, obj
 def no_nightshifts_before_weekend_off_test(staff_doesnt_work_after_5_shift, staff_works_day, hard_min, soft_min, obj):
     add_soft_sequence_min_test("no_nightshifts_before_weekend_off",
                                staff_doesnt_work_after_5_shift, hard_min, soft_min, obj, post=Post(staff_works_day, [1]))
+
+def read_shifts_from_file_test(name, lookback=None, staff=("Olivia", "Emma"), num_days=5, num_shifts=3):
+    # save_shifts_to_file then read_shifts_from_file gives back the last lookback days as constants
+    model = CpModel()
+    works = {}
+    for i, m in enumerate(staff):
+        for d in range(num_days):
+            for s in range(num_shifts):
+                works[m, d, s] = model.NewBoolVar(f"works_{m}_{d}_{s}")
+                model.Add(works[m, d, s] == (i + d + s) % 2)
+    solver = CpSolver()
+    solver.Solve(model)
+    save_shifts_to_file(name, works, staff, num_days, num_shifts, solver)
+
+    prev_model = CpModel()
+    prev_days, prev_works = read_shifts_from_file(prev_model, name, lookback)
+    kept = num_days if lookback is None else min(lookback, num_days)
+    assert(prev_days == list(range(-kept, 0)))
+    assert(len(prev_works) == len(staff) * kept * num_shifts)
+    for (m, d, s), constant in prev_works.items():
+        assert(prev_model.Proto().variables[constant.Index()].domain[0] == solver.Value(works[m, num_days + d, s]))
+
+def notebook_results(view, staff, rows):
+    # A staff x day view as the notebook's {staff: [value for each day]}
+    return {m: view[row].tolist() for m, row in zip(staff, rows)}
+
+def validate_sequence_rules_test(array, instance, parameters=None):
+    # validate_sequence_rules and the notebook's checks agree on the array, family by family:
+    # forbid_*_test fails for the staff the validator lists and penalize_*_test prints its penalties
+    validated = validate_sequence_rules(array, instance, parameters)
+    for name, family in sequence_rules(parameters, schedule_views(array, instance)).items():
+        staff = getattr(instance, family.staff)
+        rows = staff_rows(instance, staff)
+        results = notebook_results(family.shifts, staff, rows)
+        prior = None if family.prior is None else Prior(notebook_results(family.prior.shifts, staff, rows),
+                                                        family.prior.choices, family.prior.continue_shifts)
+        post = None if family.post is None else Post(notebook_results(family.post.shifts, staff, rows),
+                                                     family.post.choices)
+        forbid_test = forbid_min_test if family.minimum else forbid_max_test
+        violating_staff = []
+        for m in staff:
+            try:
+                forbid_test({m: results[m]}, family.hard, prior, post)
+            except AssertionError:
+                violating_staff.append(m)
+        assert(violating_staff == validated[name]["violating_staff"]), name
+
+        penalize_test = penalize_min_test if family.minimum else penalize_max_test
+        printed = io.StringIO()
+        with redirect_stdout(printed):
+            penalize_test(name, results, family.hard, family.soft, None, prior, post)
+        penalties = {int(length): int(count)
+                     for length, count in re.findall(r"\t(\d+) from range \d+ to \d+: (\d+)", printed.getvalue())}
+        assert(penalties == validated[name]["penalties"]), name
+
+def solve_fixed(instance, assignment, cells=None, parameters=None, time_seconds=60, **options):
+    # build_schedule with the cells (every cell by default) fixed to the assignment, solved to optimality
+    # options are passed on to build_schedule, e.g. encoding
+    schedule = build_schedule(instance, parameters, **options)
+    works = schedule.variables["staff_works_shift_on_day"]
+    for key in works if cells is None else cells:
+        if not is_false_literal(schedule.model, works[key]):
+            schedule.model.Add(works[key] == assignment.get(key, 0))
+    minimize_schedule(schedule)
+    solver = create_solver(time_seconds)
+    assert(solver.Solve(schedule.model) == OPTIMAL)
+    return solver, schedule
+
+def family_objectives_test(instance, assignment, parameters=None, time_seconds=60, **options):
+    # With every cell fixed to a known schedule an optimal solve leaves each penalty as low as the
+    # shifts allow, so family_objectives and evaluate_schedule agree family by family
+    solver, schedule = solve_fixed(instance, assignment, None, parameters, time_seconds, **options)
+    evaluated = evaluate_schedule(schedule_array(assignment, instance.staff, instance.days, instance.shifts),
+                                  instance, parameters)
+    assert(evaluated["violations"] == 0)
+    objectives = family_objectives(solver, schedule)
+    for name, cost in objectives.items():
+        assert(cost == evaluated["families"][name]["cost"]), name
+    assert(sum(objectives.values()) == evaluated["total"] == solver.ObjectiveValue())
+
+ENCODING_OPTIONS = {"encoding": [WINDOW_ENCODING, AUTOMATON_ENCODING],
+                    "transition_encoding": [PAIR_TRANSITIONS, TABLE_TRANSITIONS],
+                    "distribution_encoding": [PRODUCT_DISTRIBUTION, ELEMENT_DISTRIBUTION, CONVEX_DISTRIBUTION]}
+
+def encodings_test(instance, assignment, cells=None, parameters=None, time_seconds=60):
+    # Every encoding of an option reaches the same optimum with the same cells fixed, and with every
+    # cell fixed the same cost for each family
+    for option, encodings in ENCODING_OPTIONS.items():
+        results = []
+        for encoding in encodings:
+            solver, schedule = solve_fixed(instance, assignment, cells, parameters, time_seconds, **{option: encoding})
+            results.append((solver.ObjectiveValue(), family_objectives(solver, schedule) if cells is None else None))
+        assert(all(result == results[0] for result in results)), option
@@ -23,10 +23,15 @@ def detect_pattern_soft(list, pattern):
     return len(re.findall(pattern, "B" + ''.join([str(i) for i in list]) + "E"))
 
 
-def not_list(my_list: List):
+def not_list(my_list: List, cache=None):
+    # With a literal cache the negations are shared with every other user of the model
+    if cache is not None:
+        return list(map(cache.Not, my_list))
     return list(map(lambda x: x.Not(), my_list))
 
-def not_dict(my_dict: Dict):
+def not_dict(my_dict: Dict, cache=None):
+    if cache is not None:
+        return {k: cache.Not(v) for k, v in my_dict.items()}
     return {k: v.Not() for k, v in my_dict.items()}
 
 def triangle_costs(num_shifts, num_days, num_staff):
@@ -60,30 +65,62 @@ def list_difference(starting_list: List, difference_list: List):
 
 def save_shifts_to_file(name, staff_works_shift_on_day, staff, num_days, num_shifts, solver):
     f = open(name, "w")
+    f.write(format_shifts(staff_works_shift_on_day, staff, num_days, num_shifts, solver))
+    f.close()
 
-    f.write(f"{len(staff)};")
-    f.write(f"{num_days};")
+def format_shifts(staff_works_shift_on_day, staff, num_days, num_shifts, solver):
+    # solver can be anything with Value, e.g. a solution callback
+    text = [f"{len(staff)};", f"{num_days};"]
     for m in staff:
         for d in range(num_days):
-            f.write(m + ";")
+            text.append(m + ";")
             shift_seq = ''.join([str(solver.Value(staff_works_shift_on_day[m,d,s])) for s in range(num_shifts)])
-            f.write(f"{shift_seq};")
-    f.close()
-
-def read_shifts_from_file(model, name):
+            text.append(f"{shift_seq};")
+    return ''.join(text)
+
+def parse_shifts(text):
+    # The save_shifts_to_file format: the number of staff and days, then a staff;shifts; pair for
+    # each staff and day, staff by staff
+    # Returns the staff, the number of days and each staff's shifts, a string of 0s and 1s a day
+    results = text.strip().split(';')
+    num_staff, num_days = int(results[0]), int(results[1])
+    entries = results[2:2 + 2 * num_staff * num_days]
+    if len(entries) < 2 * num_staff * num_days:
+        raise ValueError(f"Expected {num_staff * num_days} days of shifts, found {len(entries) // 2}")
+    staff = entries[0::2 * num_days]
+    sequences = entries[1::2]
+    return staff, num_days, [sequences[i * num_days:(i + 1) * num_days] for i in range(num_staff)]
+
+def read_prior_assignment(name, lookback=None):
+    # The file's days as {(staff, day, shift): 0 or 1} numbered back from day -1, only the last
+    # lookback days (lookback.required_lookback gives what the families read)
     with open(name) as myFile:
-        text = myFile.read()
-        results = text.split(';')
-        prev_staff = range(int(results[0]))
-        prev_days = list(range(-int(results[1]), 0))
-        results = results[2:]
-        prev_works = {}
-        for m in prev_staff:
-            for d in prev_days:
-                for s, value in enumerate(results[0]):
-                    prev_works[m,d,s] = model.NewConstant(int(value))
-                results = results[1:]
+        staff, num_days, sequences = parse_shifts(myFile.read())
+    kept = num_days if lookback is None else min(lookback, num_days)
+    prior = {}
+    for m, days in zip(staff, sequences):
+        for d, shift_seq in zip(range(-kept, 0), days[num_days - kept:]):
+            for s, value in enumerate(shift_seq):
+                prior[m,d,s] = int(value)
+    return prior
+
+def read_shifts_from_file(model, name, lookback=None):
+    # The file's days numbered back from -1 as constants of the model, with the file's staff names
+    # lookback: only the last lookback days become constants, the rest of the file is skipped
+    prior = read_prior_assignment(name, lookback)
+    prev_days = sorted({d for m, d, s in prior})
+    prev_works = {key: model.NewConstant(value) for key, value in prior.items()}
     return prev_days, prev_works
 
 def obj_result(solver, obj):
-    return sum(map(lambda y: y[0] *  y[1], zip(map(lambda x: solver.Value(x), obj[0]), obj[1])))
\ No newline at end of file
+    return sum(map(lambda y: y[0] *  y[1], zip(map(lambda x: solver.Value(x), obj[0]), obj[1])))
+
+def print_table(rows: List[Dict]):
+    columns = list(rows[0].keys())
+    widths = [max(len(str(column)), *(len(str(row[column])) for row in rows))
+              for column in columns]
+    print("  ".join(str(column).ljust(width)
+          for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[column]).ljust(width)
+              for column, width in zip(columns, widths)))
@@ -0,0 +1,191 @@
+from schedule import *
+import numpy as np
+
+
+# The checks in testing_functions.py with NumPy instead of a regex over every window
+# The schedule is loaded once into a staff x day x shift array, each view (works a day, a late
+# shift...) is a staff x day mask over it and every rule is checked for all staff at once
+# The results are the same as the notebook's tests, including which windows they look at
+
+
+def schedule_array(assignment: Dict[Tuple, int], staff: List, days: List[int], shifts: List[int]) -> np.ndarray:
+    # assignment is {(staff, day, shift): 0 or 1}, missing cells are off
+    array = np.zeros((len(staff), len(days), len(shifts)), dtype=np.uint8)
+    staff_index = {m: i for i, m in enumerate(staff)}
+    for (m, d, s), value in assignment.items():
+        if value:
+            array[staff_index[m], d, s] = 1
+    return array
+
+
+def array_assignment(array: np.ndarray, staff: List, days: List[int], shifts: List[int]) -> Dict[Tuple, int]:
+    # The other way around, every cell of the array
+    return {(m, d, s): int(array[i, d, s]) for i, m in enumerate(staff) for d in days for s in shifts}
+
+
+def results_array(results: Dict, staff: List = None) -> np.ndarray:
+    # The notebook's {staff: [value for each day]} results as a staff x day array
+    staff = list(results) if staff is None else staff
+    return np.array([results[m] for m in staff], dtype=np.uint8)
+
+
+def staff_rows(instance: Instance, staff: List) -> np.ndarray:
+    return np.array([instance.staff.index(m) for m in staff], dtype=np.int64)
+
+
+def works_shifts(array: np.ndarray, shifts: List[int]) -> np.ndarray:
+    return array[:, :, shifts].any(axis=2).astype(np.uint8)
+
+
+def schedule_views(array: np.ndarray, instance: Instance) -> Dict[str, np.ndarray]:
+    views = {
+        "staff_works_day": works_shifts(array, instance.shifts),
+        "staff_works_afternoon_shift": works_shifts(array, instance.afternoon_shifts),
+        "staff_works_midnight_shift": works_shifts(array, instance.midnight_shifts),
+        "staff_works_on_call_shift": works_shifts(array, instance.on_call_shifts),
+        "staff_works_ft_shift": works_shifts(array, instance.ft_shifts),
+        "staff_works_late_shift": works_shifts(array, instance.late_shifts),
+        "staff_works_after_5_shift": works_shifts(array, instance.after_5_shifts),
+        "staff_works_after_930_shift": works_shifts(array, instance.after_930_shifts),
+        "staff_works_day_shift": works_shifts(array, instance.day_shifts),
+    }
+    for name in ["staff_works_day", "staff_works_after_930_shift", "staff_works_day_shift",
+                 "staff_works_after_5_shift"]:
+        views[name.replace("works", "doesnt_work")] = 1 - views[name]
+    return views
+
+
+def runs_of_ones(x: np.ndarray, length: int, pad: int = 2) -> np.ndarray:
+    # runs[:, i] is whether x[:, i:i + length] is all ones and fits in the days, padded with False
+    num_staff, num_days = x.shape
+    runs = np.zeros((num_staff, num_days + pad), dtype=bool)
+    if length == 0:
+        # An empty pattern is always found, even past the end
+        runs[:] = True
+        return runs
+    if length <= num_days:
+        sums = np.concatenate([np.zeros((num_staff, 1), dtype=np.int64), np.cumsum(x, axis=1)], axis=1)
+        runs[:, :num_days - length + 1] = sums[:, length:] - sums[:, :num_days - length + 1] == length
+    return runs
+
+
+def matches_choices(x: np.ndarray, choices: List, pad: int = 0) -> np.ndarray:
+    # matches[:, i] is whether x[:, i:i + len(choices)] == choices, False once it runs past the end
+    num_staff, num_days = x.shape
+    matches = np.zeros((num_staff, num_days + pad), dtype=bool)
+    k = len(choices)
+    if k <= num_days:
+        window = np.ones((num_staff, num_days - k + 1), dtype=bool)
+        for t, choice in enumerate(choices):
+            window &= x[:, t:num_days - k + 1 + t] == int(choice)
+        matches[:, :num_days - k + 1] = window
+    return matches
+
+
+def sequence_windows(x: np.ndarray, length: int, prior: Prior = None, post: Post = None):
+    # The windows testing_functions looks at for one length: where each starts in x and which
+    # have their prior and post around them. Prior and Post hold staff x day arrays here
+    num_staff, num_days = x.shape
+    k = len(prior.choices) if prior is not None else 0
+    j = len(post.choices) if post is not None else 0
+    size = num_days - length + 1 - k - j
+    starts = np.arange(max(0, size))
+    found = np.ones((num_staff, len(starts)), dtype=bool)
+    if prior is not None:
+        found &= matches_choices(prior.shifts, prior.choices, pad=k + 1)[:, starts]
+    if post is not None:
+        found &= matches_choices(post.shifts, post.choices, pad=length + k + j + 1)[:, starts + k + length]
+    if prior is not None and prior.continue_shifts:
+        # A window that carries on the prior's run is checked from where the run ends
+        shifts = np.concatenate([prior.shifts, np.zeros((num_staff, k + 1), dtype=prior.shifts.dtype)], axis=1)
+        found &= (starts <= size - k - 1)[None, :] & (shifts[:, starts + k] == 0)
+    return starts + k, found
+
+
+def sequence_violations(x: np.ndarray, hard: int, minimum: bool, prior: Prior = None, post: Post = None) -> np.ndarray:
+    # forbid_min_test and forbid_max_test, True for every staff that fails them
+    continue_shifts = prior is not None and prior.continue_shifts
+    grows = continue_shifts or (minimum and prior is None and post is None)
+    failed = np.zeros(x.shape[0], dtype=bool)
+    for length in window_length(hard, grows):
+        runs = runs_of_ones(x, length, pad=length + 3)
+        if prior is None and post is None:
+            if minimum:
+                failed |= ~runs.any(axis=1)
+            else:
+                failed |= runs_of_ones(x, length + 1).any(axis=1)
+            continue
+        first, found = sequence_windows(x, length, prior, post)
+        # "1" * length somewhere in x[first:first + length + 1]
+        contains = runs[:, first] | runs[:, first + 1]
+        failed |= (found & ~contains).any(axis=1)
+    return failed
+
+
+def sequence_penalties(x: np.ndarray, lengths: List[int], prior: Prior = None, post: Post = None) -> Dict[int, int]:
+    # penalize_min_test and penalize_max_test, the sum they print for each length
+    # With a prior that doesn't continue, or only a post, nothing is counted
+    num_staff, num_days = x.shape
+    penalties = {}
+    for length in lengths:
+        if prior is None and post is None:
+            penalties[length] = bounded_runs(x, length)
+        elif prior is not None and prior.continue_shifts:
+            first, found = sequence_windows(x, length, prior, post)
+            # x[first:first + length + 1] is exactly length ones then a zero
+            padded = np.concatenate([x, np.ones((num_staff, length + 1), dtype=x.dtype)], axis=1)
+            runs = runs_of_ones(x, length, pad=length + 1)
+            exact = runs[:, first] & (padded[:, first + length] == 0) & (first + length < num_days)[None, :]
+            penalties[length] = int((found & exact).sum())
+        else:
+            penalties[length] = 0
+    return penalties
+
+
+def bounded_runs(x: np.ndarray, length: int) -> int:
+    # re.findall counts of "0" + "1" * length + "0", "0" + "1" * length + "E" and "B" + "1" * length + "0"
+    # over "B" + x + "E". The first pattern doesn't overlap itself, so of runs of exactly length
+    # separated by single zeros only every other one is found
+    num_staff, num_days = x.shape
+    total = 0
+    if length + 2 <= num_days:
+        size = num_days - length - 1
+        found = (x[:, :size] == 0) & runs_of_ones(x[:, 1:], length)[:, :size] & (x[:, length + 1:] == 0)
+        step = length + 1
+        for residue in range(step):
+            chain = found[:, residue::step]
+            if chain.shape[1] == 0:
+                continue
+            # Position of each find in its run of finds one step apart, the odd ones are matched
+            index = np.arange(chain.shape[1])
+            last_miss = np.maximum.accumulate(np.where(chain, -1, index), axis=1)
+            total += int((chain & ((index - last_miss) % 2 == 1)).sum())
+    if length + 1 <= num_days:
+        total += int(((x[:, num_days - length - 1] == 0) & runs_of_ones(x, length)[:, num_days - length]).sum())
+        total += int((runs_of_ones(x, length)[:, 0] & (x[:, length] == 0)).sum())
+    return total
+
+
+def check_sequence_rule(x: np.ndarray, hard: int, soft: int, minimum: bool,
+                        prior: Prior = None, post: Post = None) -> Dict:
+    # add_soft_sequence_min_test and add_soft_sequence_max_test
+    lengths = range(hard, soft + 1) if minimum else range(soft, hard + 1)
+    return {"violations": sequence_violations(x, hard, minimum, prior, post),
+            "penalties": sequence_penalties(x, lengths, prior, post)}
+
+
+def validate_sequence_rules(array: np.ndarray, instance: Instance, parameters: Parameters = None) -> Dict[str, Dict]:
+    # The sequence rules build_schedule adds, on the staff it adds them for
+    v = schedule_views(array, instance)
+    results = {}
+    for name, family in sequence_rules(parameters, v).items():
+        staff = getattr(instance, family.staff)
+        rows = staff_rows(instance, staff)
+        prior = None if family.prior is None else Prior(family.prior.shifts[rows], family.prior.choices,
+                                                        family.prior.continue_shifts)
+        post = None if family.post is None else Post(family.post.shifts[rows], family.post.choices)
+        result = check_sequence_rule(family.shifts[rows], family.hard, family.soft, family.minimum, prior, post)
+        results[name] = {"valid": not result["violations"].any(),
+                         "violating_staff": [staff[i] for i in np.flatnonzero(result["violations"])],
+                         "penalties": result["penalties"]}
+    return results
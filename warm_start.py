@@ -0,0 +1,125 @@
+from schedule import *
+import csv
+
+
+# A previous schedule is turned into a solution hint so a re-solve after a small change
+# starts close to where the last solve finished instead of from scratch
+# An assignment is {(staff, day, shift): 0 or 1} for staff_works_shift_on_day
+
+
+def read_assignment_from_file(name: str) -> Dict[Tuple, int]:
+    # The format written by save_shifts_to_file, days start at 0
+    with open(name) as f:
+        return parse_assignment(f.read())
+
+
+def parse_assignment(text: str) -> Dict[Tuple, int]:
+    staff, num_days, sequences = parse_shifts(text)
+    assignment = {}
+    for m, days in zip(staff, sequences):
+        for d, shift_seq in enumerate(days):
+            for s, value in enumerate(shift_seq):
+                assignment[m, d, s] = int(value)
+    return assignment
+
+
+def read_assignment_from_csv(name: str) -> Dict[Tuple, int]:
+    # The output.csv the notebook writes, one row per day with who works each shift
+    assignment = {}
+    with open(name, newline='') as f:
+        rows = csv.reader(f)
+        header = next(rows)
+        for row in rows:
+            d = int(row[0])
+            for s, m in enumerate(row[1:len(header)]):
+                if m != "":
+                    assignment[m, d, s] = 1
+    return assignment
+
+
+def assignment_from_solver(solver: CpSolver, staff_works_shift_on_day: Dict[Tuple, IntVar]) -> Dict[Tuple, int]:
+    return {key: solver.Value(literal) for key, literal in staff_works_shift_on_day.items()}
+
+
+def clone_model(model: CpModel) -> CpModel:
+    if hasattr(model, "Clone"):
+        return model.Clone()
+    clone = CpModel()
+    clone.Proto().CopyFrom(model.Proto())
+    return clone
+
+
+def solve_values(model: CpModel, time_seconds: float):
+    solver = create_solver(time_seconds)
+    status = solver.Solve(model)
+    if status != OPTIMAL and status != FEASIBLE:
+        return None
+    return solution_values(solver)
+
+
+def hint_cells(schedule: Schedule, assignment: Dict[Tuple, int]):
+    # Cells missing from the prior schedule (new staff or days) are hinted as off
+    works = schedule.variables["staff_works_shift_on_day"]
+    return [(literal.Index(), assignment.get(key, 0))
+            for key, literal in works.items()
+            if not is_false_literal(schedule.model, literal)]
+
+
+def complete_hint(schedule: Schedule, cells: List[Tuple], time_seconds: float):
+    # Fixing every shift leaves the auxiliary variables to propagation so this is quick,
+    # and it fails if the prior schedule breaks one of the current hard constraints
+    clone = clone_model(schedule.model)
+    if not clone.HasObjective():
+        variables, coeffs = schedule.objective_terms()
+        clone.Minimize(sum(clone.GetIntVarFromProtoIndex(variables[i].Index()) * coeffs[i]
+                           for i in range(len(variables))))
+    for index, value in cells:
+        clone.Add(clone.GetIntVarFromProtoIndex(index) == value)
+    return solve_values(clone, time_seconds)
+
+
+def repair_hint(schedule: Schedule, cells: List[Tuple], time_seconds: float):
+    # Closest feasible schedule to the prior, counted in changed shifts
+    clone = clone_model(schedule.model)
+    clone.ClearObjective()
+    changes = []
+    for index, value in cells:
+        literal = clone.GetIntVarFromProtoIndex(index)
+        clone.AddHint(literal, value)
+        changes.append(literal.Not() if value else literal)
+    clone.Minimize(sum(changes))
+    return solve_values(clone, time_seconds)
+
+
+def hint_schedule(schedule: Schedule,
+                  assignment: Dict[Tuple, int],
+                  complete: bool = True,
+                  repair: bool = False,
+                  time_seconds: float = 60) -> Dict:
+    # Replaces the schedule's hints with the prior assignment
+    # complete: also hint every auxiliary variable with values consistent with the assignment
+    # repair: if the assignment breaks a hard constraint hint the closest schedule that doesn't
+    model = schedule.model
+    cells = hint_cells(schedule, assignment)
+    values = None
+    hinted = "shifts"
+    if complete:
+        values = complete_hint(schedule, cells, time_seconds)
+        hinted = "complete"
+        if values is None and repair:
+            values = repair_hint(schedule, cells, time_seconds)
+            hinted = "repaired"
+
+    model.ClearHints()
+    changed_cells = 0
+    if values is None:
+        # Either not asked for or the prior schedule isn't feasible any more, the solver can still use the shifts
+        hinted = "shifts"
+        for index, value in cells:
+            model.AddHint(model.GetIntVarFromProtoIndex(index), value)
+    else:
+        changed_cells = sum(1 for index, value in cells if values[index] != value)
+        for index, value in enumerate(values):
+            model.AddHint(model.GetIntVarFromProtoIndex(index), value)
+    return {"hinted": hinted, "hints": len(values) if values is not None else len(cells),
+            "changed_cells": changed_cells}